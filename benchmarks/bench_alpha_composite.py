@@ -0,0 +1,62 @@
+__description__ = \
+"""
+Compare numpy alpha compositing against the old round trip through PIL.
+
+    python benchmarks/bench_alpha_composite.py
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-22"
+
+import pyfx
+import numpy as np
+from PIL import Image
+
+import timeit
+
+def pil_composite(bottom,top):
+    """
+    What helper.alpha_composite used to do: array -> PIL -> array.
+    """
+
+    bottom_img = pyfx.util.to_image(bottom)
+    top_img = pyfx.util.to_image(top)
+    composite = Image.alpha_composite(bottom_img,top_img)
+
+    return pyfx.util.to_array(composite,dtype=np.uint8,num_channels=4)
+
+def run(name,bottom,top,number,repeat):
+
+    out = np.empty_like(bottom)
+
+    tests = [("PIL round trip",lambda: pil_composite(bottom,top)),
+             ("composite.over",lambda: pyfx.util.composite.over(bottom,top)),
+             ("composite.over (out=)",
+              lambda: pyfx.util.composite.over(bottom,top,out=out))]
+
+    print(name)
+    for test_name, fcn in tests:
+        # Best of several repeats; single runs on a shared machine are noisy
+        t = min(timeit.repeat(fcn,number=number,repeat=repeat))/number
+        print("    {:40s}{:8.2f} ms".format(test_name,t*1000))
+
+def main(shape=(1080,1920),number=5,repeat=7):
+
+    rs = np.random.RandomState(0)
+    bottom = rs.randint(0,256,size=shape + (4,)).astype(np.uint8)
+    bottom[:,:,3] = 255
+
+    # Every pixel of the top layer partially transparent
+    dense = rs.randint(0,256,size=shape + (4,)).astype(np.uint8)
+
+    # Top layer only visible in a small patch (a sprite or glow)
+    sparse = np.zeros(shape + (4,),dtype=np.uint8)
+    r, c = shape[0]//4, shape[1]//4
+    sparse[r:2*r,c:2*c] = dense[r:2*r,c:2*c]
+
+    print("{}x{} RGBA, best of {} x {} runs".format(shape[1],shape[0],
+                                                   repeat,number))
+    run("dense top layer",bottom,dense,number,repeat)
+    run("sparse top layer (1/16 of frame visible)",bottom,sparse,number,repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+__description__ = \
+"""
+Time pyfx.util.to_array for every (dtype, channels) -> (dtype, channels)
+conversion, with the default checks, with trusted=True, and writing into a
+preallocated out= array.
+
+    python benchmarks/bench_convert.py
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-22"
+
+import pyfx
+import numpy as np
+
+import itertools, timeit
+
+DTYPES = (np.uint8,np.float32,np.float64)
+CHANNELS = (1,3,4)
+
+def make_input(shape,dtype,num_channels):
+
+    rs = np.random.RandomState(0)
+    if num_channels > 1:
+        shape = (shape[0],shape[1],num_channels)
+
+    if dtype == np.uint8:
+        return rs.randint(0,256,size=shape).astype(np.uint8)
+
+    return rs.uniform(0,1,size=shape).astype(dtype)
+
+def main(shape=(720,1280),number=5):
+
+    print("{}x{} frames, mean of {} runs (ms)".format(shape[1],shape[0],number))
+    print("{:>20s}{:>20s}{:>10s}{:>10s}{:>10s}".format("from","to","default",
+                                                       "trusted","out="))
+
+    pairs = list(itertools.product(DTYPES,CHANNELS))
+    for (in_dtype, in_channels), (out_dtype, out_channels) in itertools.product(pairs,pairs):
+
+        a = pyfx.util.to_array(make_input(shape,in_dtype,in_channels),
+                               dtype=in_dtype,num_channels=in_channels)
+        out = np.empty(pyfx.util.to_array(a,dtype=out_dtype,
+                                          num_channels=out_channels).shape,
+                       dtype=out_dtype)
+
+        times = []
+        for extra in [{},{"trusted":True},{"out":out}]:
+
+            # Fresh dict for each variant, so "trusted" does not carry over
+            # into the out= column
+            kwargs = {"dtype":out_dtype,"num_channels":out_channels}
+            kwargs.update(extra)
+            t = timeit.timeit(lambda: pyfx.util.to_array(a,**kwargs),
+                              number=number)
+            times.append(1000*t/number)
+
+        print("{:>20s}{:>20s}{:10.2f}{:10.2f}{:10.2f}".format(
+              "{} x{}".format(np.dtype(in_dtype).name,in_channels),
+              "{} x{}".format(np.dtype(out_dtype).name,out_channels),
+              *times))
+
+if __name__ == "__main__":
+    main()
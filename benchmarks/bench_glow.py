@@ -0,0 +1,47 @@
+__description__ = \
+"""
+Compare drawing glowing particles one sprite at a time against splatting
+them all at once with GlowRenderer.
+
+    python benchmarks/bench_glow.py
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-23"
+
+import pyfx
+import numpy as np
+
+import timeit
+
+def sprites(shape,coords,radii,intensities,hue,layer):
+
+    layer.clear()
+    for c, r, i in zip(coords,radii,intensities):
+        s = pyfx.visuals.sprites.GlowingParticle(radius=r,intensity=i,hue=hue)
+        s.write_to_image(c,layer)
+
+def main(shape=(1080,1920),number=3):
+
+    rs = np.random.RandomState(0)
+    renderer = pyfx.visuals.sprites.GlowRenderer(shape)
+    layer = pyfx.util.composite.Layer(shape)
+
+    for num_particles in [300,3000,10000]:
+
+        coords = rs.random_sample((num_particles,2))*shape
+        radii = np.minimum(rs.pareto(1.0,num_particles) + 1,5)
+        intensities = rs.random_sample(num_particles)
+        hue = 0.6
+
+        tests = [("sprites",
+                  lambda: sprites(shape,coords,radii,intensities,hue,layer)),
+                 ("GlowRenderer.render",
+                  lambda: renderer.render(coords,radii,intensities,hue))]
+
+        print("{} particles".format(num_particles))
+        for test_name, fcn in tests:
+            t = timeit.timeit(fcn,number=number)/number
+            print("    {:40s}{:8.2f} ms".format(test_name,t*1000))
+
+if __name__ == "__main__":
+    main()
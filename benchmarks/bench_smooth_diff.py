@@ -0,0 +1,58 @@
+__description__ = \
+"""
+Compare building a smoothed potential well with Background.smooth_diff by
+repeated dilation against building it from a distance transform.
+
+    python benchmarks/bench_smooth_diff.py
+
+The dilation method takes minutes per frame at 1080p, so the default frame
+is 540p.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-24"
+
+import pyfx
+import numpy as np
+
+import timeit
+
+def fake_diff(shape,num_blobs,rs):
+    """
+    Frame difference with a few elliptical blobs that differ from the
+    background.
+    """
+
+    rows, cols = np.mgrid[0:shape[0],0:shape[1]]
+
+    diff = np.zeros(shape,dtype=np.float)
+    for i in range(num_blobs):
+        r, c = rs.random_sample(2)*shape
+        a, b = rs.random_sample(2)*shape[0]/8 + 10
+        inside = ((rows - r)/a)**2 + ((cols - c)/b)**2 < 1
+        diff[inside] = 1.0
+
+    return diff
+
+def main(shape=(540,960),number=1):
+
+    rs = np.random.RandomState(0)
+    bg = pyfx.util.Background(np.zeros(shape,dtype=np.uint8))
+
+    for num_blobs in [1,10]:
+
+        diff = fake_diff(shape,num_blobs,rs)
+
+        print("{} blobs".format(num_blobs))
+        out = {}
+        for method in ["dilation","distance"]:
+            fcn = lambda: bg.smooth_diff(None,diff=diff,method=method)
+            t = timeit.timeit(fcn,number=number)/number
+            out[method] = fcn().astype(np.int)
+            print("    {:40s}{:8.2f} ms".format(method,t*1000))
+
+        delta = np.abs(out["dilation"] - out["distance"])
+        print("    max difference: {} gray levels (mean {:.3f})".format(np.max(delta),
+                                                                       np.mean(delta)))
+
+if __name__ == "__main__":
+    main()
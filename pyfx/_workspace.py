@@ -8,14 +8,62 @@ __date__ = "2018-12-07"
 import pyfx
 
 import numpy as np
-import copy, os, string, warnings, json, glob, shutil, sys
+from skimage import filters
+
+import copy, os, string, warnings, json, glob, shutil, sys, hashlib
+import multiprocessing, collections
+
+VIDEO_EXTENSIONS = (".mp4",".mkv",".mov",".avi",".webm")
+WORKING_DTYPES = (np.uint8,np.float32,np.float16)
+
+# State for render worker processes.  Set once per worker by
+# _init_render_worker so the workspace and effects are not re-sent with
+# every chunk.
+_worker_state = {}
+
+def _init_render_worker(workspace,effects,out_dir,png_options=None):
+    """
+    Initialize a render worker process.
+    """
+
+    _worker_state["workspace"] = workspace
+    _worker_state["effects"] = effects
+    _worker_state["out_dir"] = out_dir
+    _worker_state["png_options"] = png_options
+
+def _render_chunk(times):
+    """
+    Render and write out a contiguous chunk of frames in a worker process.
+    """
+
+    ws = _worker_state["workspace"]
+    effects = _worker_state["effects"]
+
+    with ws._png_writer(_worker_state["out_dir"],
+                        _worker_state["png_options"]) as writer:
+        for t in times:
+            writer.write(ws._render_frame(t,effects),t)
+
+    return writer.stats
+
+def _render_one(t):
+    """
+    Render a single frame in a worker process and send it back.
+    """
+
+    ws = _worker_state["workspace"]
+    effects = _worker_state["effects"]
+
+    return ws._render_frame(t,effects)
 
 class Workspace:
     """
     Main class for managing a pyfx session.
     """
 
-    def __init__(self,name,src=None,bg_frame=None):
+    def __init__(self,name,src=None,bg_frame=None,read_ahead=4,
+                 frame_cache_size=2**30,frame_store=False,dtype=np.uint8,
+                 seed=None,diff_method=None,derived_cache_size=2**28):
         """
         name:   string, name of workspace.
         src:    If string, treat as video file.
@@ -27,12 +75,50 @@ class Workspace:
                   must match those from src.  If None, a background of uniform
                   127,127,127 is used for all calculations.
                   If loading from an existing source, this argument is ignored.
-        """
+        read_ahead: number of frames to decode in the background ahead of the
+                    frame last requested by get_frame.
+        frame_cache_size: memory (in bytes) to use for caching decoded frames.
+        frame_store: if True, decode the source once into a memory-mapped
+                     array in the workspace directory and serve frames
+                     straight from it.  The store is rebuilt automatically if
+                     the source changes.
+        dtype: working precision of the frames passed from effect to effect.
+               np.uint8 (0-255 integers) or np.float32 (0-1 floats).  With
+               np.float32, effects do their math in float32 and frames are
+               only rounded to 8 bits when they are written out.  np.float16
+               works like np.float32, but stores frames between effects at
+               half the size.
+        seed: integer seed for the random number streams used by effects
+              (see rng).  If None, use the seed saved with an existing
+              workspace, or pick (and save) a new one.
+        diff_method: speed/quality tier for measuring the difference between
+                     frames and the background: "ssim" (slowest, most
+                     exact), "pyramid" or "absdiff" (fastest).  See
+                     pyfx.util.frame_diff.  If None, use the method saved
+                     with an existing workspace, or "ssim".
+        derived_cache_size: memory (in bytes) to use for caching products
+                            derived from frames (grayscale frames,
+                            differences from the background, masks...).
+                            See frame_diff.
+        """
+
+        if dtype not in WORKING_DTYPES:
+            err = "dtype must be one of np.uint8, np.float32, or np.float16\n"
+            raise ValueError(err)
 
         self._name = name
         self._src = copy.copy(src)
         self._bg_frame = bg_frame
 
+        self._read_ahead = read_ahead
+        self._frame_cache_size = frame_cache_size
+        self._frame_store = frame_store
+        self._dtype = dtype
+        self._seed = seed
+        self._diff_method = diff_method
+        self._rng_key_counts = collections.Counter()
+        self._derived = pyfx.util.DerivedCache(derived_cache_size)
+
         # If the workspace exists, load it.  If not, create it.
         if os.path.exists(self._name):
             if os.path.isdir(self._name):
@@ -43,17 +129,38 @@ class Workspace:
         else:
             self._initialize_workspace()
 
-    def render(self,out_dir,effects=(),time_interval=None,overwrite=False):
+    def render(self,out_dir,effects=(),time_interval=None,overwrite=False,
+               workers=1,encoder_options=None,png_options=None):
         """
-        out_dir: directory to write out frames
+        out_dir: directory to write out frames.  If this has a video file
+                 extension (.mp4, .mkv, .mov, .avi, .webm), encode the frames
+                 directly into that video file instead.
         effects: tuple containing what effects to apply, in what order.
         time_interval: tuple or list of length = 2 that indicates starting and
                        ending frame to render.
         overwrite: bool indicating whether or not to overwrite existing output
-        """
+        workers: number of processes to use for rendering.  If > 1, frames are
+                 split into contiguous chunks and rendered by a process pool.
+                 This is only done if every effect is parallel_safe; if any
+                 effect carries state from frame to frame, render serially.
+        encoder_options: dictionary of keyword arguments passed to
+                         pyfx.util.VideoWriter when writing a video file
+                         (codec, crf, pix_fmt, frame_rate, queue_size...).
+                         If frame_rate is not given, use the frame rate of the
+                         source video (or 30 for image sources).
+        png_options: dictionary of keyword arguments passed to
+                     pyfx.util.PNGWriter when writing png files (num_threads,
+                     queue_size, compress_level).
+        """
+
+        to_video = os.path.splitext(out_dir)[1].lower() in VIDEO_EXTENSIONS
 
         # Make the output directory
-        if os.path.isdir(out_dir):
+        if to_video:
+            if os.path.exists(out_dir) and not overwrite:
+                err = "output file {} exists\n".format(out_dir)
+                raise FileExistsError(err)
+        elif os.path.isdir(out_dir):
             if not overwrite:
                 err = "output directory {} exists\n".format(out_dir)
                 raise FileExistsError(err)
@@ -76,28 +183,172 @@ class Workspace:
                 err = "effect {} was not generated with this workspace".format(e)
                 raise ValueError(err)
 
-        # Go over the frames in the specified time interval
-        for t in range(time_interval[0],time_interval[1]):
+        # Make sure the effects are baked before running.  This is done up
+        # front so every worker process sees the same baked state (the shaking
+        # trajectory in VirtualCamera, for example, is random).
+        for e in effects:
+            if not e.baked:
+                e.bake()
+
+        workers = int(workers)
+        if workers < 1:
+            err = "workers must be 1 or more\n"
+            raise ValueError(err)
 
-            self._current_time = t
-            print("processing frame ",t)
-            sys.stdout.flush()
+        if workers > 1:
+            not_safe = [e for e in effects if not e.parallel_safe]
+            if len(not_safe) > 0:
+                w = "effect(s) {} carry state between frames; rendering serially\n"
+                warnings.warn(w.format(",".join([str(e) for e in not_safe])))
+                workers = 1
+
+        times = list(range(time_interval[0],time_interval[1]))
+
+        if to_video:
+            self._render_video(times,effects,out_dir,workers,encoder_options)
+        elif workers > 1:
+            stats = self._render_parallel(times,effects,out_dir,workers,
+                                          png_options)
+            self._print_writer_stats(stats)
+        else:
+            # The writer waits for queued frames to be written, even if a
+            # render raises an exception.
+            with self._png_writer(out_dir,png_options) as writer:
+                for t in times:
+                    writer.write(self._render_frame(t,effects),t)
+            self._print_writer_stats([writer.stats])
 
-            # Go over each effect, in order
-            img = self.get_frame(t)
-            for e in effects:
+        self._save()
 
-                # Make sure the effect is baked before running
-                if not e.baked:
-                    e.bake()
+    def _render_frame(self,t,effects):
+        """
+        Apply effects, in order, to the frame at time t.  Return the image.
+        """
+
+        self._current_time = t
+        print("processing frame ",t)
+        sys.stdout.flush()
+
+        # Go over each effect, in order.  Effects are allowed to modify the
+        # image they are handed, so give them a copy of the frame.
+        if self._dtype == np.uint8:
+            img = np.copy(self.get_frame(t))
+            for e in effects:
                 img = e.render(img)
 
-            # Write out image
-            out_file = "frame{:08d}.png".format(t)
-            out_file = os.path.join(out_dir,out_file)
-            pyfx.util.to_file(img,out_file)
+        # Working in float: keep the frame in float between effects.  It is
+        # only rounded to 8 bits when it is written out.
+        else:
+            img = pyfx.util.to_array(self.get_frame(t),dtype=self._dtype,
+                                     num_channels=4,copy=True)
+            for e in effects:
+                img = pyfx.util.to_array(e.render(img),dtype=self._dtype,
+                                         num_channels=4)
 
-        self._save()
+        return img
+
+    def _png_writer(self,out_dir,png_options=None):
+        """
+        Create a PNGWriter for out_dir.
+        """
+
+        kwargs = {}
+        if png_options is not None:
+            kwargs.update(png_options)
+
+        return pyfx.util.PNGWriter(out_dir,**kwargs)
+
+    def _print_writer_stats(self,stats):
+        """
+        Print out summed statistics from one or more PNGWriters.
+        """
+
+        num_written = sum([s["num_written"] for s in stats])
+        num_blocked = sum([s["num_blocked"] for s in stats])
+        time_blocked = sum([s["time_blocked"] for s in stats])
+
+        print("wrote {} frames; waited on writer {} times ({:.1f} s)".format(num_written,
+                                                                            num_blocked,
+                                                                            time_blocked))
+        sys.stdout.flush()
+
+    def _render_parallel(self,times,effects,out_dir,workers,png_options=None):
+        """
+        Render the frames in times using a pool of worker processes.  Each
+        worker gets its own copy of the workspace and (baked) effects and
+        writes its frames directly to out_dir.  Returns a list of writer
+        statistics, one per chunk.
+        """
+
+        # Split into contiguous chunks, several per worker so slow frames do
+        # not leave the rest of the pool idle.
+        chunk_size = int(np.ceil(len(times)/(4*workers)))
+        if chunk_size < 1:
+            chunk_size = 1
+        chunks = [times[i:i+chunk_size] for i in range(0,len(times),chunk_size)]
+
+        pool = multiprocessing.Pool(workers,
+                                    initializer=_init_render_worker,
+                                    initargs=(self,effects,out_dir,png_options))
+        try:
+            stats = list(pool.imap_unordered(_render_chunk,chunks))
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        return stats
+
+    def _render_video(self,times,effects,out_file,workers,encoder_options):
+        """
+        Render the frames in times and pipe them into a video encoder.  If
+        workers > 1, frames are rendered by a pool of worker processes and
+        handed back (in order) to be encoded.
+        """
+
+        kwargs = {}
+        if encoder_options is not None:
+            kwargs.update(encoder_options)
+        if "frame_rate" not in kwargs:
+            try:
+                kwargs["frame_rate"] = self._img_list.frame_rate
+            except AttributeError:
+                kwargs["frame_rate"] = 30
+
+        writer = pyfx.util.VideoWriter(out_file,self.shape[:2],overwrite=True,
+                                       **kwargs)
+        with writer:
+
+            if workers == 1:
+                for t in times:
+                    writer.write(self._render_frame(t,effects))
+                return
+
+            pool = multiprocessing.Pool(workers,
+                                        initializer=_init_render_worker,
+                                        initargs=(self,effects,None))
+            try:
+
+                # Keep a bounded window of frames in flight so finished frames
+                # do not pile up in memory if the encoder is slower than the
+                # pool.
+                pending = collections.deque()
+                for t in times:
+                    pending.append(pool.apply_async(_render_one,(t,)))
+                    if len(pending) >= 2*workers:
+                        writer.write(pending.popleft().get())
+
+                while len(pending) > 0:
+                    writer.write(pending.popleft().get())
+
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
 
     def set_background(self,bg_frame=None,blur_sigma=10):
         """
@@ -127,18 +378,134 @@ class Workspace:
                                             num_channels=4,
                                             dtype=np.uint8)
 
+        # Anything derived from the old background is stale
+        self._derived.clear()
+
+        # Fingerprint of the background, so things calculated from it and
+        # saved to disk can tell when it changes
+        h = hashlib.sha1(str(self._bg_frame.shape).encode("utf-8"))
+        h.update(np.ascontiguousarray(self._bg_frame).tobytes())
+        self._bg_signature = h.hexdigest()
+
         # Send to the Background instance
-        self._bg = pyfx.util.Background(self._bg_frame,blur_sigma)
+        self._bg = pyfx.util.Background(self._bg_frame,blur_sigma,
+                                        dtype=self.float_dtype,
+                                        diff_method=self._diff_method)
 
         self._save()
 
+    def derived(self,t,kind,params,calculate):
+        """
+        Return a product derived from frame t, calculating it only if it is
+        not already in the workspace's derived product cache.  Effects and
+        processors working on the same frame share one calculation.  The
+        returned array is read-only.
+
+        t: frame the product is derived from
+        kind: name of the product
+        params: dictionary of everything besides t the product depends on
+        calculate: function with no arguments that calculates the product
+        """
+
+        return self._derived.get(t,kind,params,calculate)
+
+    def frame_gray(self,t):
+        """
+        Grayscale version of frame t (2D array of float_dtype).
+        """
+
+        return self.derived(t,"gray",{"dtype":np.dtype(self.float_dtype).name},
+                            lambda: pyfx.util.to_array(self.get_frame(t),
+                                                       num_channels=1,
+                                                       dtype=self.float_dtype))
+
+    def frame_blur(self,t,sigma):
+        """
+        Grayscale version of frame t blurred with a gaussian filter.
+
+        sigma: width of the gaussian (pixels)
+        """
+
+        return self.derived(t,"blur",{"sigma":sigma},
+                            lambda: filters.gaussian(self.frame_gray(t),sigma))
+
+    def _diff_params(self):
+        """
+        Everything the difference from the background depends on.
+        """
+
+        return {"diff_method":self._diff_method,
+                "blur_sigma":self._bg.blur_sigma}
+
+    def frame_diff(self,t):
+        """
+        Difference between frame t and the background (see
+        Background.frame_diff).
+        """
+
+        return self.derived(t,"frame_diff",self._diff_params(),
+                            lambda: self._bg.frame_diff(self.frame_gray(t)))
+
+    def frame_mask(self,t,threshold):
+        """
+        Boolean mask of pixels in frame t that differ from the background by
+        more than threshold.
+        """
+
+        params = self._diff_params()
+        params["threshold"] = threshold
+
+        return self.derived(t,"frame_mask",params,
+                            lambda: self.frame_diff(t) > threshold)
+
+    def smooth_diff(self,t,**kwargs):
+        """
+        Smoothed potential well around the parts of frame t that differ from
+        the background (see Background.smooth_diff, which takes the same
+        keyword arguments).
+        """
+
+        params = self._diff_params()
+        params.update(kwargs)
+
+        return self.derived(t,"smooth_diff",params,
+                            lambda: self._bg.smooth_diff(None,
+                                                         diff=self.frame_diff(t),
+                                                         **kwargs))
+
+    def rng(self,*key):
+        """
+        Return an np.random.Generator for the stream named by key.  The same
+        key always gives the same numbers for a given workspace seed, no
+        matter what other streams have been used, so frames can be rendered
+        in any order (or by different processes) reproducibly.
+
+        key: strings and/or non-negative integers naming the stream (say, an
+             effect's rng_key and a frame number).
+        """
+
+        return self._streams.generator(*key)
+
+    def _new_rng_key(self,name):
+        """
+        Return a stream name for a new object called name.  The first object
+        with a given name gets "name.0", the next "name.1" and so on, so
+        scripts that create effects in the same order get the same streams.
+        """
+
+        key = "{}.{}".format(name,self._rng_key_counts[name])
+        self._rng_key_counts[name] += 1
+
+        return key
+
     def get_frame(self,t):
         """
-        Get the frame at time t.  Return as an array.
+        Get the frame at time t.  Return as an array.  The array is read-only
+        (it may be shared with the frame cache or memory-mapped from disk);
+        copy it before modifying it.
         """
 
-        return pyfx.util.to_array(self._img_list[t],dtype=np.uint8,
-                                  num_channels=4)
+        return self._frames.get(t)
 
     def _initialize_workspace(self):
         """
@@ -148,6 +515,12 @@ class Workspace:
         if not os.path.exists(self._name):
             os.mkdir(self._name)
 
+        self._streams = pyfx.util.RandomStreams(self._seed)
+        self._seed = self._streams.seed
+
+        if self._diff_method is None:
+            self._diff_method = "ssim"
+
         self._initialize_src()
         self.set_background(self._bg_frame)
         self._save()
@@ -177,6 +550,10 @@ class Workspace:
         self._name = input_dict["name"]
         self._src = input_dict["src"]
         self._bg_frame = input_dict["bg_frame"]
+        if self._seed is None:
+            self._seed = input_dict.get("seed")
+        if self._diff_method is None:
+            self._diff_method = input_dict.get("diff_method")
 
         self._initialize_workspace()
 
@@ -189,6 +566,12 @@ class Workspace:
         out_dict["version"] = pyfx.__version__
         out_dict["name"] = self._name
         out_dict["src"] = self._src
+        out_dict["seed"] = self._seed
+
+        # Custom diff methods (classes) cannot be saved; they must be passed
+        # in again when the workspace is loaded.
+        if isinstance(self._diff_method,str):
+            out_dict["diff_method"] = self._diff_method
 
         # Write out the background file as an image
         bg_file = os.path.join(self._name,"master_bg_image.png")
@@ -212,9 +595,9 @@ class Workspace:
                 self._img_list = glob.glob(os.path.join(self._src,"*.png"))
                 self._img_list.sort()
 
-            # Parse a video file
+            # Parse a video file.  Frames are decoded on demand.
             elif os.path.isfile(self._src):
-                self._img_list = pyfx.util.video_to_array(self._src)
+                self._img_list = pyfx.util.VideoReader(self._src)
 
             # Error
             else:
@@ -235,6 +618,15 @@ class Workspace:
             err = "could not parse src of type {}\n".format(type(self._src))
             raise ValueError(err)
 
+        if self._frame_store:
+            store_dir = os.path.join(self._name,"frame_store")
+            self._frames = pyfx.util.FrameStore(store_dir,self._src,
+                                                self._img_list)
+        else:
+            self._frames = pyfx.util.FrameProvider(self._img_list,
+                                                   read_ahead=self._read_ahead,
+                                                   max_bytes=self._frame_cache_size)
+
         self._current_time = 0
         self._max_time = len(self._img_list) - 1
         self._shape = pyfx.util.to_array(self._img_list[0],num_channels=1).shape
@@ -254,6 +646,14 @@ class Workspace:
 
         return self._bg_frame
 
+    @property
+    def bg_signature(self):
+        """
+        Hash of the background frame.  Changes whenever the background does.
+        """
+
+        return self._bg_signature
+
     @property
     def src(self):
         """
@@ -262,6 +662,35 @@ class Workspace:
 
         return copy.copy(self._src)
 
+    @property
+    def seed(self):
+        """
+        Seed for the workspace random number streams.
+        """
+        return self._seed
+
+    @property
+    def derived_cache(self):
+        """
+        DerivedCache holding products derived from frames.
+        """
+        return self._derived
+
+    @property
+    def diff_method(self):
+        """
+        How frames are compared to the background ("ssim", "pyramid" or
+        "absdiff"; see pyfx.util.frame_diff).
+        """
+        return self._diff_method
+
+    @diff_method.setter
+    def diff_method(self,diff_method):
+
+        self._bg.diff_method = diff_method
+        self._diff_method = diff_method
+        self._save()
+
     @property
     def current_time(self):
         """
@@ -269,6 +698,21 @@ class Workspace:
         """
         return self._current_time
 
+    @current_time.setter
+    def current_time(self,t):
+        """
+        Set the current time.  Effects that simulate frames they are not
+        drawing (to catch up after a checkpoint, for example) set this so
+        time-dependent potentials see the frame being simulated.
+        """
+
+        t = int(t)
+        if t < 0 or t > self._max_time:
+            err = "time {} is outside of the workspace\n".format(t)
+            raise ValueError(err)
+
+        self._current_time = t
+
     @property
     def max_time(self):
         """
@@ -291,6 +735,41 @@ class Workspace:
 
         return self._shape
 
+    @property
+    def dtype(self):
+        """
+        Working precision of frames passed between effects (np.uint8,
+        np.float32 or np.float16).
+        """
+
+        return self._dtype
+
+    @property
+    def compute_dtype(self):
+        """
+        Data type effects should use for the image arrays they work on.  This
+        is np.uint8 for uint8 workspaces and np.float32 otherwise (float16 is
+        only used to store frames, not to do math on them).
+        """
+
+        if self._dtype == np.uint8:
+            return np.uint8
+
+        return np.float32
+
+    @property
+    def float_dtype(self):
+        """
+        Float type effects should use for intermediate calculations.  This is
+        np.float64 for uint8 workspaces (as always) and np.float32 for float
+        workspaces.
+        """
+
+        if self._dtype == np.uint8:
+            return np.float64
+
+        return np.float32
+
     @property
     def background(self):
         """
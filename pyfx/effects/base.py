@@ -28,6 +28,11 @@ characteristics.
    apply whatever transformation is necessary at time and must return an image
    of identical dimensions to the input image.
 
+4. If render() depends on state carried over from previous frames (say, a
+   particle simulation), set self._parallel_safe = False after calling
+   super().__init__(workspace).  Such effects are never rendered out of order
+   by a process pool.
+
 Some useful private methods/features of the Effect class:
 
 1.
@@ -94,6 +99,12 @@ class Effect:
         self._waypoints[0] = copy.copy(self._default_waypoint)
         self._baked = False
 
+        # Name of this effect's random number streams in the workspace
+        self._rng_key = workspace._new_rng_key(self.__class__.__name__)
+
+        # Whether render(img) at time t depends only on the baked state and t
+        self._parallel_safe = True
+
     def bake(self,smooth_window_len=0):
         """
         Can be redefined in subclass.  Note: be careful calling this with
@@ -114,6 +125,24 @@ class Effect:
 
         return img
 
+    def rng(self,t=None):
+        """
+        Return an np.random.Generator for this effect, derived from the
+        workspace seed.
+
+        t: if given, return the substream for frame t.  The numbers drawn
+           from it do not depend on what happened at other frames, so an
+           effect that draws everything for frame t from rng(t) gives the
+           same result whether frames are rendered serially or in chunks.
+           If None, return the effect's stream for work that is not tied to
+           a frame (say, during bake).
+        """
+
+        if t is None:
+            return self._workspace.rng(self._rng_key)
+
+        return self._workspace.rng(self._rng_key,int(t))
+
     def add_waypoint(self,t,**kwargs):
         """
         Add a waypoint to the effect.
@@ -279,22 +308,28 @@ class Effect:
 
         if self.protect_mask[t] is not None:
 
+            # Work in the workspace precision
+            dtype = self._workspace.compute_dtype
+
             # Drop protection mask onto original image
             protect = pyfx.util.to_array(original_img,
                                          num_channels=4,
-                                         dtype=np.uint8)
+                                         dtype=dtype)
 
             protect[:,:,3] = pyfx.util.to_array(self.protect_mask[t],
                                                 num_channels=1,
-                                                dtype=np.uint8)
+                                                dtype=dtype)
 
             # Add an alpha channel to the new rgb value
-            rgba = 255*np.ones((original_img.shape[0],original_img.shape[1],4),
-                               dtype=np.uint8)
-            rgba[:,:,:3] = processed_img[:,:,:3]
+            rgba = pyfx.util.to_array(processed_img,num_channels=4,dtype=dtype,
+                                      copy=True)
+            if dtype == np.uint8:
+                rgba[:,:,3] = 255
+            else:
+                rgba[:,:,3] = 1.0
 
             # Do alpha compositing
-            out = pyfx.util.alpha_composite(rgba,protect)
+            out = pyfx.util.alpha_composite(rgba,protect,out=rgba)
 
             return out
 
@@ -386,6 +421,29 @@ class Effect:
     def baked(self):
         return self._baked
 
+    @property
+    def parallel_safe(self):
+        """
+        Whether frames can be rendered independently and out of order (for
+        example, by a pool of worker processes).
+        """
+        return self._parallel_safe
+
     @property
     def workspace(self):
         return self._workspace
+
+    @property
+    def rng_key(self):
+        """
+        Name of this effect's random number streams in the workspace.  By
+        default, class name plus the order in which effects of this class
+        were created ("GlowingParticles.0").  Set it to keep an effect's
+        random numbers fixed when other effects are added or removed.
+        """
+        return self._rng_key
+
+    @rng_key.setter
+    def rng_key(self,rng_key):
+        self._rng_key = str(rng_key)
+        self._baked = False
@@ -88,8 +88,11 @@ class ColorShift(Effect):
         if len(img.shape) == 3 and img.shape[2] == 4:
             saved_alpha = img[:,:,3]
 
+        # Work in the workspace precision
+        dtype = self._workspace.compute_dtype
+
         # Make sure we are in RGB
-        rgb = pyfx.util.to_array(img,num_channels=3,dtype=np.uint8)
+        rgb = pyfx.util.to_array(img,num_channels=3,dtype=dtype)
 
         # Manipulate HSV if requested
         if self.hue[t] >= 0 or \
@@ -123,7 +126,7 @@ class ColorShift(Effect):
 
             # Convert back to rgb
             rgb = pyfx.util.to_array(color.hsv2rgb(hsv),
-                                     dtype=np.uint8,
+                                     dtype=dtype,
                                      num_channels=3)
 
         # Set white balance to specified white point
@@ -145,10 +148,13 @@ class ColorShift(Effect):
             elif local_alpha > 255:
                 local_alpha = 255
 
-            rgba = pyfx.util.to_array(rgb,num_channels=4,dtype=np.uint8)
-            rgba[:,:,3] = local_alpha
+            rgba = pyfx.util.to_array(rgb,num_channels=4,dtype=dtype)
+            if dtype == np.uint8:
+                rgba[:,:,3] = local_alpha
+            else:
+                rgba[:,:,3] = local_alpha/255
 
-            original_img = pyfx.util.to_array(img,num_channels=4,dtype=np.uint8)
+            original_img = pyfx.util.to_array(img,num_channels=4,dtype=dtype)
             rgb = pyfx.util.alpha_composite(original_img,rgba)[:,:,:3]
 
         # Protect masked portions of the input image
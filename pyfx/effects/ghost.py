@@ -56,12 +56,16 @@ class Ghost(Effect):
         if self.use_base_frame[t]:
             to_proc = self._workspace.get_frame(t)
 
+        # Work in the workspace precision
+        dtype = self._workspace.compute_dtype
+        float_dtype = self._workspace.float_dtype
+
         # Make a black and white version of image
         ghost = pyfx.util.to_array(to_proc,num_channels=1,
-                                   dtype=np.uint8)
+                                   dtype=dtype)
 
         # Convert to HSV
-        ghost = pyfx.util.to_array(ghost,num_channels=3,dtype=np.float)
+        ghost = pyfx.util.to_array(ghost,num_channels=3,dtype=float_dtype)
         ghost = color.rgb2hsv(ghost)
 
         # Change hue to current waypoint color
@@ -70,32 +74,36 @@ class Ghost(Effect):
 
         # Convert back to an RGBA int array
         ghost = color.hsv2rgb(ghost)
-        ghost = pyfx.util.to_array(ghost,num_channels=4,dtype=np.uint8)
+        ghost = pyfx.util.to_array(ghost,num_channels=4,dtype=dtype)
 
-        # Put diff on alpha channel, scaling by total_alpha
-        diff = self._workspace.background.frame_diff(to_proc)
+        # Put diff on alpha channel, scaling by total_alpha.  The difference
+        # for the unprocessed frame is shared with other effects.
+        if self.use_base_frame[t]:
+            diff = self._workspace.frame_diff(t)
+        else:
+            diff = self._workspace.background.frame_diff(to_proc)
         ghost[:,:,3] = pyfx.util.to_array(diff*self.total_alpha[t],
-                                          num_channels=1,dtype=np.uint8)
+                                          num_channels=1,dtype=dtype)
 
         # Create HSV glow with hue at time t
         glow = np.ones((self._workspace.shape[0],
-                        self._workspace.shape[1],3),dtype=np.float)
+                        self._workspace.shape[1],3),dtype=float_dtype)
         glow[:,:,0] = self.hue[t]
 
         # Convert back to an RGBA array
         glow = color.hsv2rgb(glow)
-        glow = pyfx.util.to_array(glow,num_channels=4,dtype=np.uint8)
+        glow = pyfx.util.to_array(glow,num_channels=4,dtype=dtype)
 
         # Create a halo alpha channel for the glow
         halo = pyfx.visuals.filters.create_halo(1-diff,
                                                 decay_scalar=self.decay_scalar[t],
                                                 halo_size=self.halo_size[t])
         halo_alpha = pyfx.util.to_array(halo*self.total_alpha[t],
-                                        num_channels=1,dtype=np.uint8)
+                                        num_channels=1,dtype=dtype)
         glow[:,:,3] = halo_alpha
 
         # Composite components
-        glowing_ghost = pyfx.util.alpha_composite(glow,ghost)
+        glowing_ghost = pyfx.util.alpha_composite(glow,ghost,out=glow)
 
         final = pyfx.util.alpha_composite(img,glowing_ghost)
 
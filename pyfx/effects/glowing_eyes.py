@@ -121,13 +121,14 @@ class GlowingEyes(Effect):
         if not self._baked:
             self.bake()
 
-        tmp_img = np.zeros((img.shape),dtype=np.uint8)
+        # Only the regions the eyes are written into get composited
+        layer = pyfx.util.composite.Layer(img.shape)
 
         try:
             left_eyes = self._left_eye_coord[t]
             for eye in left_eyes:
                 self._eye_sprite.radius = eye[2]*self.eye_scalar[t]
-                self._eye_sprite.write_to_image(eye[:2],tmp_img)
+                self._eye_sprite.write_to_image(eye[:2],layer)
         except KeyError:
             pass
 
@@ -135,8 +136,8 @@ class GlowingEyes(Effect):
             right_eyes = self._right_eye_coord[t]
             for eye in right_eyes:
                 self._eye_sprite.radius = eye[2]*self.eye_scalar[t]
-                self._eye_sprite.write_to_image(eye[:2],tmp_img)
+                self._eye_sprite.write_to_image(eye[:2],layer)
         except KeyError:
             pass
 
-        return pyfx.util.alpha_composite(img,tmp_img)
+        return layer.composite(img)
@@ -10,10 +10,22 @@ from .base import Effect
 
 import numpy as np
 
+import os, glob, hashlib, warnings
+
+# Version of the checkpoint file format
+CHECKPOINT_VERSION = 1
+
 class GlowingParticles(Effect):
     """
     Glowing particle effect creates a collection of glowing particles that
     can respond to underlying potential(s) defined in the physics submodule.
+
+    The particles are simulated forward one frame at a time.  If baked with a
+    checkpoint_interval, the state of the simulation is written to the
+    workspace every checkpoint_interval frames.  Rendering a frame that is
+    not the next one (a later chunk of the video, or an earlier frame) then
+    picks the simulation up from the nearest checkpoint rather than from
+    frame 0.
     """
 
     def __init__(self,workspace):
@@ -61,12 +73,50 @@ class GlowingParticles(Effect):
 
         super().__init__(workspace)
 
-    def bake(self,smooth_window_len=0):
+        # Particles are simulated forward from frame to frame
+        self._parallel_safe = False
+
+    def bake(self,smooth_window_len=0,renderer="sprites",integrator=None,
+             checkpoint_interval=None):
         """
         smooth_window_len: length of window for interpolation
+        renderer: how to draw the particles.
+                  "sprites": composite each particle's sprite in turn.
+                  "splat": draw all particles at once with a
+                           visuals.sprites.GlowRenderer.  The cost depends
+                           on the frame size rather than the number of
+                           particles, so this is faster for thousands of
+                           particles.  Overlapping glows add rather than
+                           layer.
+        integrator: physics.integrators.Integrator used to move the
+                    particles between frames.  Give it a max_displacement
+                    to split frames into substeps where forces are steep.
+                    If None, use velocity Verlet with one step per frame.
+        checkpoint_interval: write the state of the simulation to the
+                             workspace every checkpoint_interval frames.  If
+                             None, do not write checkpoints.  With
+                             checkpoints, frames can be rendered in chunks by
+                             worker processes.
         """
 
-        self._current_time = 0
+        if renderer not in ["sprites","splat"]:
+            err = "renderer must be 'sprites' or 'splat'\n"
+            raise ValueError(err)
+        self._renderer = renderer
+
+        if checkpoint_interval is not None:
+            checkpoint_interval = int(checkpoint_interval)
+            if checkpoint_interval < 1:
+                err = "checkpoint_interval must be None or 1 or more\n"
+                raise ValueError(err)
+        self._checkpoint_interval = checkpoint_interval
+        self._checkpoint_dir = os.path.join(self._workspace.name,
+                                            "checkpoints",
+                                            self.rng_key)
+
+
+        # Last frame simulated (None: nothing simulated yet)
+        self._current_time = None
         self._dimensions = self._workspace.shape
 
         self._interpolate_waypoints(smooth_window_len)
@@ -86,7 +136,26 @@ class GlowingParticles(Effect):
                                                        sample_which_potential=self.sample_which_potential[0],
                                                        purge=self.purge[0],
                                                        num_equilibrate_steps=self.num_equilibrate_steps[0],
-                                                       sprite_generator=self._sprite_generator)
+                                                       sprite_generator=self._sprite_generator,
+                                                       build_sprites=self._renderer == "sprites",
+                                                       integrator=integrator)
+        self._layer = None
+        self._glow_renderer = None
+        if self._renderer == "splat":
+            self._glow_renderer = pyfx.visuals.sprites.GlowRenderer(self._dimensions)
+
+        # Checkpoints are only trusted if every potential can say when it
+        # has changed.
+        self._signature = self._calc_signature()
+        if self._signature is None and self._checkpoint_interval is not None:
+            w = "not all potentials have a signature; checkpoints disabled\n"
+            warnings.warn(w)
+            self._checkpoint_interval = None
+
+        # Frames can be rendered out of order if we can pick the simulation
+        # up from a checkpoint.
+        self._parallel_safe = self._checkpoint_interval is not None
+
         self._baked = True
 
     def render(self,img):
@@ -95,6 +164,97 @@ class GlowingParticles(Effect):
         if not self._baked:
             self.bake()
 
+        self._simulate_to(t)
+
+        # Construct the particle sprites on a layer that tracks which regions
+        # were drawn on, so only those regions are composited
+        if self._layer is None:
+            self._layer = pyfx.util.composite.Layer(self._dimensions)
+        self._layer.clear()
+        if self._glow_renderer is None:
+            for coord, sprite in zip(self._particle_collection.coords,
+                                     self._particle_collection.sprites):
+                sprite.write_to_image(coord,self._layer)
+        else:
+            pc = self._particle_collection
+            self._layer.array[:] = self._glow_renderer.render(pc.coords,
+                                                              pc.radii,
+                                                              pc.intensities,
+                                                              pc.hues)
+            self._layer.mark(0,self._dimensions[0],0,self._dimensions[1])
+
+        # Write out
+        self._layer.scale_alpha(self.alpha[t])
+
+        final = self._layer.composite(img)
+
+        # Protect image, if requested
+        final = self._protect(img,final)
+
+        return final
+
+    def _simulate_to(self,t):
+        """
+        Bring the particle simulation to frame t.  Frames are simulated one
+        at a time from the current frame or, if that is after t or a later
+        checkpoint is available, from the nearest checkpoint at or before t.
+        """
+
+        if t == self._current_time:
+            return
+
+        if self._current_time is None or t < self._current_time:
+            start = -1
+        else:
+            start = self._current_time
+
+        # Pick up from a checkpoint if that skips some frames
+        if t > start + 1:
+            checkpoint_t = self._find_checkpoint(t)
+            if checkpoint_t is not None and checkpoint_t > start:
+                if self._read_checkpoint(checkpoint_t):
+                    start = checkpoint_t
+
+        # Start over from an empty collection
+        if start == -1:
+            self._particle_collection.equalize_particles(0)
+            self._current_time = None
+
+        # Time-dependent potentials (DiffPotential) look up the workspace
+        # time, so move it along with the frames being simulated and put it
+        # back afterward.
+        workspace_time = self._workspace.current_time
+        try:
+            for frame in range(start + 1,t + 1):
+                self._workspace.current_time = frame
+                self._simulate_frame(frame)
+
+                # Sprites only learn whether they are out of frame when
+                # drawn, so do that for frames that are skipped over.
+                if frame != t and self._glow_renderer is None:
+                    pc = self._particle_collection
+                    for coord, sprite in zip(pc.coords,pc.sprites):
+                        sprite.update_out_of_frame(coord,self._dimensions)
+
+                if self._checkpoint_interval is not None and \
+                   frame % self._checkpoint_interval == 0:
+                    self._write_checkpoint(frame)
+        finally:
+            self._workspace.current_time = workspace_time
+
+    def _simulate_frame(self,t):
+        """
+        Advance the particle simulation by one frame, to frame t.
+        """
+
+        # Everything random in this frame is drawn from the frame's own
+        # stream, so frame t looks the same however we got here.
+        rng = self.rng(t)
+        self._sprite_generator.rng = rng
+        self._particle_collection.rng = rng
+        for pot in self.potentials[t]:
+            pot.rng = rng
+
         # Update the sprite generator
         self._sprite_generator.hue = self.hue[t]
         self._sprite_generator.intensity_pareto = self.intensity_pareto[t]
@@ -112,20 +272,23 @@ class GlowingParticles(Effect):
         self._particle_collection.purge = self.purge[t]
         self._particle_collection.num_equilibrate_steps = self.num_equilibrate_steps[t]
 
-        # Figure out how many time steps we need to take
-        num_steps = (t - self._current_time)
-        if num_steps < 0:
-            err = "time cannot run backwards for this effect\n"
-            err += "(try baking again before running.)\n"
-            raise ValueError(err)
+        # Advance time for the particles.  Nothing moves on the first frame.
+        num_steps = 0
+        if self._current_time is not None:
+            num_steps = t - self._current_time
         self._current_time = t
 
-        # Advance time for the particles
         self._particle_collection.advance_time(num_steps=num_steps)
 
-        # Remove particles that are off screen
+        # Remove particles that are off screen.  Sprites are not drawn when
+        # splatting, so ask the renderer which particles are visible.
         if self.purge[t]:
-            self._particle_collection.purge_invisible()
+            if self._glow_renderer is None:
+                self._particle_collection.purge_invisible()
+            else:
+                pc = self._particle_collection
+                visible = self._glow_renderer.in_frame(pc.coords,pc.radii)
+                pc.purge_invisible(visible)
 
         # Add or subtract particles so we have the desired number
         target_num_particles = np.int(self.num_particles[t])
@@ -133,18 +296,155 @@ class GlowingParticles(Effect):
             target_num_particles = 0
         self._particle_collection.equalize_particles(target_num_particles)
 
-        # Construct the particle sprites
-        out_array = np.zeros((self._dimensions[0],self._dimensions[1],4),
-                              dtype=np.uint8)
-        for p in self._particle_collection.particles:
-            out_array = p[1].write_to_image(p[0]._coord,out_array)
+    def _calc_signature(self):
+        """
+        Fingerprint of everything that determines the simulation, used to
+        make sure a checkpoint on disk came from the same setup.  Returns
+        None if any potential does not have a signature.
+        """
 
-        # Write out
-        out_array[:,:,3] = out_array[:,:,3]*self.alpha[t]
+        h = hashlib.sha1()
+        h.update("{} {} {}".format(self._workspace.seed,self.rng_key,
+                                   self._renderer).encode("utf-8"))
+        for k in ["num_particles","hue","velocity_dist","particle_density",
+                  "radius_pareto","radius_max","intensity_pareto",
+                  "intensity_max","sample_which_potential",
+                  "num_equilibrate_steps","purge"]:
+            values = self.__dict__[k]
+            try:
+                h.update(np.ascontiguousarray(values,dtype=np.float).tobytes())
+            except (TypeError,ValueError):
+                h.update(repr(values).encode("utf-8"))
 
-        final = pyfx.util.alpha_composite(img,out_array)
+        integrator = self._particle_collection.integrator
+        h.update("{} {} {}".format(integrator.__class__.__name__,
+                                   integrator.max_displacement,
+                                   integrator.max_substeps).encode("utf-8"))
 
-        # Protect image, if requested
-        final = self._protect(img,final)
+        # Each potential once, in the order it first appears
+        seen = set()
+        for potentials in self.potentials:
+            for pot in potentials:
+                if id(pot) in seen:
+                    continue
+                seen.add(id(pot))
 
-        return final
+                signature = getattr(pot,"signature",None)
+                if signature is None:
+                    return None
+                h.update(signature.encode("utf-8"))
+
+        return h.hexdigest()
+
+    def _checkpoint_file(self,t):
+        """
+        Name of the checkpoint file for frame t.
+        """
+
+        return os.path.join(self._checkpoint_dir,"{:08d}.npz".format(t))
+
+    def _find_checkpoint(self,t):
+        """
+        Return the last frame at or before t with a checkpoint on disk that
+        matches the current setup, or None.
+        """
+
+        if self._checkpoint_interval is None:
+            return None
+
+        # The potentials (or the workspace background behind them) may have
+        # changed since the effect was baked
+        self._signature = self._calc_signature()
+
+        times = []
+        for f in glob.glob(os.path.join(self._checkpoint_dir,"*.npz")):
+            try:
+                times.append(int(os.path.basename(f)[:-4]))
+            except ValueError:
+                continue
+
+        # Walk back past checkpoints from a different setup
+        for x in sorted([x for x in times if x <= t],reverse=True):
+            if self._checkpoint_matches(x):
+                return x
+
+        return None
+
+    def _checkpoint_matches(self,t):
+        """
+        Whether the checkpoint for frame t has the current file version and
+        signature.  Only those entries are read from the file.
+        """
+
+        with np.load(self._checkpoint_file(t)) as data:
+            return int(data["version"]) == CHECKPOINT_VERSION and \
+                   str(data["signature"]) == self._signature
+
+    def _write_checkpoint(self,t):
+        """
+        Write the state of the simulation after frame t to the workspace.
+        The file is written under a temporary name and then moved into place,
+        so other processes never read a partial checkpoint.
+        """
+
+        os.makedirs(self._checkpoint_dir,exist_ok=True)
+
+        self._signature = self._calc_signature()
+
+        pc = self._particle_collection
+        out = pc.get_state()
+        out["version"] = CHECKPOINT_VERSION
+        out["t"] = t
+        out["signature"] = self._signature
+
+        out_file = self._checkpoint_file(t)
+        tmp_file = "{}.{}.tmp".format(out_file,os.getpid())
+        with open(tmp_file,"wb") as f:
+            np.savez(f,**out)
+        os.replace(tmp_file,out_file)
+
+    def _read_checkpoint(self,t):
+        """
+        Load the state of the simulation after frame t from the workspace.
+        Returns False (and leaves the simulation alone) if the checkpoint
+        does not match this effect.
+        """
+
+        if not self._checkpoint_matches(t):
+            return False
+
+        with np.load(self._checkpoint_file(t)) as data:
+
+            # Splatting draws straight from the intensity and hue arrays, so
+            # sprites are only needed by the sprite renderer
+            sprites = None
+            if self._glow_renderer is None:
+                sprites = []
+                for radius, intensity, hue in zip(data["radii"],
+                                                  data["intensities"],
+                                                  data["hues"]):
+                    sprites.append(self._sprite_generator.create(radius=radius,
+                                                                 intensity=intensity,
+                                                                 hue=hue))
+
+            self._particle_collection.set_state(data,sprites)
+
+        # Record whether each sprite is out of frame, as drawing frame t did
+        if self._glow_renderer is None:
+            pc = self._particle_collection
+            for coord, sprite in zip(pc.coords,pc.sprites):
+                sprite.update_out_of_frame(coord,self._dimensions)
+
+        self._current_time = t
+
+        return True
+
+    def clear_checkpoints(self):
+        """
+        Delete this effect's checkpoints from the workspace.  Checkpoints
+        from a different setup are ignored anyway, so this just frees the
+        disk space.
+        """
+
+        for f in glob.glob(os.path.join(self._checkpoint_dir,"*.npz")):
+            os.remove(f)
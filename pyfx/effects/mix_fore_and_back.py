@@ -44,28 +44,31 @@ class MixForeAndBack(Effect):
         new_img = img
         if self.mask[t] is not None:
 
+            # Work in the workspace precision
+            dtype = self._workspace.compute_dtype
+
             # Put mask into single channel 0-255 array
             if self.alpha[t] != 1.0:
                 mask = pyfx.util.to_array(self.mask[t],
                                           num_channels=1,
-                                          dtype=np.float)
+                                          dtype=self._workspace.float_dtype)
                 mask = pyfx.util.to_array(mask*self.alpha[t],
                                           num_channels=1,
-                                          dtype=np.uint8)
+                                          dtype=dtype)
             else:
                 mask = pyfx.util.to_array(self.mask[t],
                                           num_channels=1,
-                                          dtype=np.uint8)
+                                          dtype=dtype)
 
             # Load background
             local_bg = self._workspace.background.image
             if self.bg_override[t] is not None:
                 local_bg = self.bg_override[t]
             bg = pyfx.util.to_array(local_bg,
-                                    num_channels=4,dtype=np.uint8)
+                                    num_channels=4,dtype=dtype)
 
             # Load foreground and stick mask into alpha channel
-            fg = pyfx.util.to_array(img,num_channels=4,dtype=np.uint8)
+            fg = pyfx.util.to_array(img,num_channels=4,dtype=dtype)
             fg[:,:,3] = mask
 
             # Alpha composite
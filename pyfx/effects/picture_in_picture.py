@@ -140,11 +140,18 @@ class PictureInPicture(Effect):
                 else:
                     pip = pyfx.util.expand(rescaled,crop_x,crop_y)
 
-            final_alpha = np.round(self.alpha[t]*(255 - self.picture_mask[t]),0)
-            masked_img = pyfx.util.to_array(img,num_channels=4,dtype=np.uint8)
-            masked_img[:,:,3] = final_alpha
+            # Work in the workspace precision
+            dtype = self._workspace.compute_dtype
 
-            pip[:,:,3] = 255
+            final_alpha = np.round(self.alpha[t]*(255 - self.picture_mask[t]),0)
+            masked_img = pyfx.util.to_array(img,num_channels=4,dtype=dtype)
+            pip = pyfx.util.to_array(pip,num_channels=4,dtype=dtype)
+            if dtype == np.uint8:
+                masked_img[:,:,3] = final_alpha
+                pip[:,:,3] = 255
+            else:
+                masked_img[:,:,3] = final_alpha/255
+                pip[:,:,3] = 1.0
 
             img = pyfx.util.alpha_composite(pip,masked_img)
 
@@ -174,7 +174,8 @@ class VirtualCamera(Effect):
 
         x, y = pyfx.util.helper.harmonic_langenvin(len(self.t),
                                                    self.shaking_stiffness,
-                                                   self.shaking_magnitude)
+                                                   self.shaking_magnitude,
+                                                   rng=self.rng())
 
         return x, y
 
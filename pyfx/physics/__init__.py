@@ -1,3 +1,5 @@
 from .particle import Particle
+from .sampler import Sampler
+from . import integrators
 from .particle_collection import ParticleCollection
 from . import potentials
@@ -0,0 +1,180 @@
+__description__ = \
+"""
+Integrators that advance a whole collection of particles through time.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-23"
+
+import numpy as np
+
+class Integrator:
+    """
+    Base class for integrators.  An integrator moves all particles in a
+    collection at once, updating (N,2) coords, velocities and accelerations
+    in place.
+
+    Each requested time step can be split into substeps.  With
+    max_displacement set, the substep size is chosen from the largest
+    acceleration in the collection so that no particle moves more than
+    max_displacement pixels under that acceleration in one substep:
+
+        dt_sub = sqrt(2*max_displacement/max(|a|))
+
+    Where forces are gentle, a frame is one step; near a steep part of a
+    potential (say, close to the min_r of a Radial potential), the frame is
+    split into as many substeps as needed (up to max_substeps) rather than
+    rendering extra frames to keep the simulation stable.
+
+    Subclasses define _step, which takes one step of size dt.
+    """
+
+    def __init__(self,max_displacement=None,max_substeps=100):
+        """
+        max_displacement: largest displacement (pixels) allowed from
+                          acceleration in one substep.  If None, do not
+                          substep: every time step is taken as given.
+        max_substeps: largest number of substeps a single time step may be
+                      split into.
+        """
+
+        self.max_displacement = max_displacement
+        self.max_substeps = max_substeps
+
+        self._num_substeps = 0
+
+    def advance(self,coords,velocities,accels,masses,get_forces,
+                dt=1.0,num_steps=1):
+        """
+        Advance the particles num_steps time steps of size dt.
+
+        coords: (N,2) array of coordinates (updated in place)
+        velocities: (N,2) array of velocities (updated in place)
+        accels: (N,2) array holding the accelerations at coords on entry
+                (updated in place)
+        masses: (N,) array of masses
+        get_forces: function that takes an (N,2) array of coordinates and
+                    returns the (N,2) array of forces on them
+        dt: time step size
+        num_steps: number of steps to take
+
+        Returns the number of substeps taken.
+        """
+
+        self._num_substeps = 0
+        if len(masses) == 0:
+            return 0
+
+        def get_accels(coords):
+            return get_forces(coords)/masses[:,np.newaxis]
+
+        for i in range(num_steps):
+
+            remaining = dt
+            while remaining > 0:
+
+                sub_dt = min(self._substep_size(accels,dt),remaining)
+
+                # Do not leave a sliver of a step at the end
+                if remaining - sub_dt < 1e-9*dt:
+                    sub_dt = remaining
+
+                self._step(coords,velocities,accels,get_accels,sub_dt)
+                self._num_substeps += 1
+
+                remaining -= sub_dt
+
+        return self._num_substeps
+
+    def _substep_size(self,accels,dt):
+        """
+        Size of the next substep, given the current accelerations.
+        """
+
+        if self._max_displacement is None:
+            return dt
+
+        max_accel = np.sqrt(np.max(np.sum(accels*accels,axis=1)))
+        if not np.isfinite(max_accel):
+            return dt/self._max_substeps
+
+        if max_accel == 0:
+            return dt
+
+        sub_dt = np.sqrt(2*self._max_displacement/max_accel)
+
+        return min(max(sub_dt,dt/self._max_substeps),dt)
+
+    def _step(self,coords,velocities,accels,get_accels,dt):
+        """
+        Take a single step of size dt.  Must be defined by the subclass.
+        """
+
+        err = "_step must be defined in a subclass\n"
+        raise NotImplementedError(err)
+
+    @property
+    def num_substeps(self):
+        """
+        Number of substeps taken in the last call to advance.
+        """
+        return self._num_substeps
+
+    @property
+    def max_displacement(self):
+        return self._max_displacement
+
+    @max_displacement.setter
+    def max_displacement(self,max_displacement):
+
+        if max_displacement is not None:
+            max_displacement = float(max_displacement)
+            if max_displacement <= 0:
+                err = "max_displacement must be None or greater than 0\n"
+                raise ValueError(err)
+
+        self._max_displacement = max_displacement
+
+    @property
+    def max_substeps(self):
+        return self._max_substeps
+
+    @max_substeps.setter
+    def max_substeps(self,max_substeps):
+
+        max_substeps = int(max_substeps)
+        if max_substeps < 1:
+            err = "max_substeps must be 1 or more\n"
+            raise ValueError(err)
+
+        self._max_substeps = max_substeps
+
+class VelocityVerlet(Integrator):
+    """
+    Velocity Verlet integration.  Second order, time reversible and
+    conserves energy well over long runs.  One force evaluation per step.
+    """
+
+    def _step(self,coords,velocities,accels,get_accels,dt):
+
+        # x(t + dt) = x(t) + v(t)*dt + a(t)*dt^2/2
+        coords += velocities*dt + accels*(dt*dt/2)
+
+        # v(t + dt) = v(t) + (a(t) + a(t + dt))*dt/2
+        new_accels = get_accels(coords)
+        velocities += (accels + new_accels)*(dt/2)
+        accels[:] = new_accels
+
+class SemiImplicitEuler(Integrator):
+    """
+    Semi-implicit (symplectic) Euler integration.  First order, but stable
+    for oscillating systems and slightly cheaper per step than velocity
+    Verlet.  One force evaluation per step.
+    """
+
+    def _step(self,coords,velocities,accels,get_accels,dt):
+
+        # v(t + dt) = v(t) + a(t)*dt; x(t + dt) = x(t) + v(t + dt)*dt
+        velocities += accels*dt
+        coords += velocities*dt
+
+        accels[:] = get_accels(coords)
@@ -13,6 +13,13 @@ import copy
 class ParticleCollection:
     """
     Manage a collection of particles interacting with potentials.
+
+    Particles are stored as arrays (structure of arrays) rather than as a list
+    of Particle instances: coords and velocities are (N,2) arrays, masses,
+    radii, intensities and hues are (N,) arrays, and sprites is a list of N
+    sprites (or None).  Each
+    time step evaluates every potential once on all N coordinates and updates
+    all particles at once with an integrator (see physics.integrators).
     """
 
     def __init__(self,
@@ -26,7 +33,10 @@ class ParticleCollection:
                  sample_which_potential=0,
                  purge=True,
                  num_equilibrate_steps=0,
-                 sprite_generator=None):
+                 sprite_generator=None,
+                 build_sprites=True,
+                 integrator=None,
+                 rng=None):
         """
         num_particles: number of particles to add
         dimensions: dimensions of box
@@ -54,6 +64,15 @@ class ParticleCollection:
                                after adding.
         sprite_generator: SpriteGenerator instance for creating new sprites.
                           If None, do not generate sprites
+        build_sprites: whether to build a sprite for each new particle.  If
+                       False, particles still get intensities and hues from
+                       the sprite generator (for renderers that draw straight
+                       from those arrays), but no sprite bitmaps are built.
+        integrator: physics.integrators.Integrator instance used to move the
+                    particles.  If None, use velocity Verlet without
+                    substeps.
+        rng: np.random.Generator used to create and remove particles.  If
+             None, use the global np.random state.
         """
 
         self.num_particles = num_particles
@@ -67,48 +86,177 @@ class ParticleCollection:
         self.purge = purge
         self.num_equilibrate_steps = num_equilibrate_steps
         self.sprite_generator = sprite_generator
-
-        self._particles = []
-
-    def _generate_random_particle(self):
+        self.build_sprites = build_sprites
+        self.integrator = integrator
+        self.rng = rng
+
+        self._coords = np.zeros((0,2),dtype=np.float)
+        self._velocities = np.zeros((0,2),dtype=np.float)
+        self._accels = np.zeros((0,2),dtype=np.float)
+        self._masses = np.zeros(0,dtype=np.float)
+        self._radii = np.zeros(0,dtype=np.float)
+        self._intensities = np.zeros(0,dtype=np.float)
+        self._hues = np.zeros(0,dtype=np.float)
+        self._sprites = []
+
+    def _generate_random_particles(self,num_particles):
         """
-        Generate a new particle.
+        Generate the coordinates, velocities and radii of num_particles new
+        particles.  Every property is drawn for all particles in one call.
         """
 
-        # Generate random radius (sampling from Pareto scale-free
+        # Generate random radii (sampling from Pareto scale-free
         # distribution)
-        radius = np.random.pareto(self._radius_pareto) + 1.0
-        if radius > self._radius_max:
-            radius = self._radius_max
+        rng = pyfx.util.rng.get_rng(self._rng)
 
-        # Generate x,y coordinates for the particle (sampling from potential
+        radii = rng.pareto(self._radius_pareto,num_particles) + 1.0
+        np.minimum(radii,self._radius_max,out=radii)
+
+        # Generate x,y coordinates for the particles (sampling from potential
         # or random)
         if len(self.potentials) > 0 and self._sample_which_potential >= 0:
-            coord = self.potentials[self._sample_which_potential].sample_coord()
+            pot = self.potentials[self._sample_which_potential]
+            coords = _batch_sample(pot,num_particles)
         else:
-            x = np.random.choice(range(self._dimensions[0]))
-            y = np.random.choice(range(self._dimensions[1]))
-            coord = np.array((x,y))
+            x = pyfx.util.rng.integers(self._rng,0,self._dimensions[0],num_particles)
+            y = pyfx.util.rng.integers(self._rng,0,self._dimensions[1],num_particles)
+            coords = np.stack((x,y),axis=1)
+        coords = np.array(coords,dtype=np.float)
+
+        # Generate random velocities (sampling from a normal distribution)
+        velocities = np.zeros((num_particles,2),dtype=np.float)
+        velocities[:,0] = rng.normal(self._velocity_dist[0],
+                                     self._velocity_dist[1],
+                                     num_particles)
+        velocities[:,1] = rng.normal(self._velocity_dist[2],
+                                     self._velocity_dist[3],
+                                     num_particles)
+
+        return coords, velocities, radii
+
+    def _add_particles(self,num_particles):
+        """
+        Generate num_particles new particles, equilibrate them (if requested)
+        and add them to the collection.  Particles the potential could not
+        place (nan coordinates) are dropped.
+        """
 
-        # Generate random velocity (sampling from a normal distribution)
-        vx = np.random.normal(self._velocity_dist[0],self._velocity_dist[1])
-        vy = np.random.normal(self._velocity_dist[2],self._velocity_dist[3])
-        velocity = np.array((vx,vy))
+        if num_particles <= 0:
+            return
 
-        # Generate a physical particle
-        p = pyfx.physics.Particle(coord,velocity=velocity,radius=radius,
-                                  density=self._particle_density)
+        coords, velocities, radii = self._generate_random_particles(num_particles)
 
-        # Equilibrate particle, if requested
-        if self._num_equilibrate_steps > 0:
-            self.apply_forces(p,num_steps=self._num_equilibrate_steps)
+        placed = np.all(np.isfinite(coords),axis=1)
+        if not np.all(placed):
+            coords = coords[placed]
+            velocities = velocities[placed]
+            radii = radii[placed]
+            num_particles = len(radii)
+
+        masses = 4/3*np.pi*(radii**3)*self._particle_density
 
-        sprite = None
+        # Equilibrate the new particles, if requested
+        accels = self._get_forces(coords)/masses[:,np.newaxis]
+        if self._num_equilibrate_steps > 0:
+            self._integrator.advance(coords,velocities,accels,masses,
+                                     self._get_forces,
+                                     num_steps=self._num_equilibrate_steps)
+
+        # Intensities and hues are drawn for all particles at once; sprites
+        # are only built if something is going to draw them.
+        intensities = np.zeros(num_particles,dtype=np.float)
+        hues = np.zeros(num_particles,dtype=np.float)
+        sprites = [None for i in range(num_particles)]
         if self._sprite_generator is not None:
-            sprite = self._sprite_generator.create(radius=radius,
-                                                   velocity=velocity)
+            properties = _batch_properties(self._sprite_generator,num_particles)
+            if properties is not None:
+                intensities, hues = properties
+
+            if self._build_sprites:
+                for i in range(num_particles):
+                    kwargs = {"radius":radii[i],"velocity":velocities[i]}
+                    if properties is not None:
+                        kwargs["intensity"] = intensities[i]
+                        kwargs["hue"] = hues[i]
+                    sprites[i] = self._sprite_generator.create(**kwargs)
+
+        self._coords = np.concatenate((self._coords,coords))
+        self._velocities = np.concatenate((self._velocities,velocities))
+        self._accels = np.concatenate((self._accels,accels))
+        self._masses = np.concatenate((self._masses,masses))
+        self._radii = np.concatenate((self._radii,radii))
+        self._intensities = np.concatenate((self._intensities,intensities))
+        self._hues = np.concatenate((self._hues,hues))
+        self._sprites.extend(sprites)
+
+    def _keep(self,keep):
+        """
+        Keep only the particles where the boolean array keep is True.
+        """
 
-        return p, sprite
+        self._coords = self._coords[keep]
+        self._velocities = self._velocities[keep]
+        self._accels = self._accels[keep]
+        self._masses = self._masses[keep]
+        self._radii = self._radii[keep]
+        self._intensities = self._intensities[keep]
+        self._hues = self._hues[keep]
+        self._sprites = [self._sprites[i] for i in np.flatnonzero(keep)]
+
+    def get_state(self):
+        """
+        Return a dictionary holding copies of the particle arrays (coords,
+        velocities, accels, masses, radii, intensities and hues).  Together
+        with the sprites, this is everything needed to pick the simulation up
+        again with set_state.
+        """
+
+        return {"coords":self._coords.copy(),
+                "velocities":self._velocities.copy(),
+                "accels":self._accels.copy(),
+                "masses":self._masses.copy(),
+                "radii":self._radii.copy(),
+                "intensities":self._intensities.copy(),
+                "hues":self._hues.copy()}
+
+    def set_state(self,state,sprites=None):
+        """
+        Replace the particles with those described by state (a dictionary
+        like the one returned by get_state).
+
+        state: dictionary of particle arrays.  intensities and hues may be
+               left out, in which case they are set to 0.
+        sprites: list with one sprite per particle.  If None, particles have
+                 no sprites.
+        """
+
+        coords = np.array(state["coords"],dtype=np.float).reshape((-1,2))
+        num_particles = len(coords)
+
+        if sprites is None:
+            sprites = [None for i in range(num_particles)]
+
+        arrays = {}
+        for k in ["velocities","accels","masses","radii","intensities","hues"]:
+            if k in ["intensities","hues"] and k not in state:
+                arrays[k] = np.zeros(num_particles,dtype=np.float)
+                continue
+            arrays[k] = np.array(state[k],dtype=np.float)
+            if len(arrays[k]) != num_particles:
+                err = "every array in state must have one entry per particle\n"
+                raise ValueError(err)
+        if len(sprites) != num_particles:
+            err = "sprites must have one entry per particle\n"
+            raise ValueError(err)
+
+        self._coords = coords
+        self._velocities = arrays["velocities"].reshape((-1,2))
+        self._accels = arrays["accels"].reshape((-1,2))
+        self._masses = arrays["masses"]
+        self._radii = arrays["radii"]
+        self._intensities = arrays["intensities"]
+        self._hues = arrays["hues"]
+        self._sprites = list(sprites)
 
     def construct_particles(self,num_particles=None):
         """
@@ -118,57 +266,62 @@ class ParticleCollection:
         if num_particles is not None:
             self._num_particles = num_particles
 
-        for i in range(self._num_particles):
-            self._particles.append(self._generate_random_particle())
+        self._add_particles(self._num_particles)
 
-    def purge_invisible(self):
+    def purge_invisible(self,visible=None):
         """
         Remove particles that have moved off screen. If a sprite is defined,
         for the particle, use its out_of_frame property, as this accounts
         for the fact that the particle may have width.  If that is not
         defined, use the x,y coordinate of the particle.
+
+        visible: boolean array saying which particles are visible.  If given,
+                 it is used instead of the sprites and coordinates.
         """
 
-        for i in range(len(self._particles)-1,-1,-1):
+        if visible is not None:
+            visible = np.asarray(visible,dtype=bool)
+            if visible.shape != (len(self._sprites),):
+                err = "visible must have one entry per particle\n"
+                raise ValueError(err)
+            if not np.all(visible):
+                self._keep(visible)
+            return
 
-            remove = False
-            if self._particles[i][1] is not None:
-                if self._particles[i][1].out_of_frame:
-                    remove = True
-            else:
-                if np.min(self._particles[i][0].coord) < 0 or \
-                   np.sum(self._particles[i][0].coord > self._dimensions) > 0:
+        outside = np.logical_or(np.min(self._coords,axis=1) < 0,
+                                np.any(self._coords > self._dimensions,axis=1))
 
-                   remove = True
+        remove = np.array([outside[i] if sprite is None else sprite.out_of_frame
+                           for i, sprite in enumerate(self._sprites)],dtype=bool)
 
-            if remove:
-                self._particles.pop(i)
+        if np.any(remove):
+            self._keep(np.logical_not(remove))
 
     def equalize_particles(self,target_num_particles):
         """
         Make sure the number of particles matches what is wanted.
         """
 
-        difference = int(round(target_num_particles - len(self._particles)))
+        difference = int(round(target_num_particles - len(self._sprites)))
         if difference < 0:
 
             # We don't want any particles; nuke em all
             if target_num_particles == 0:
-                self._particles = []
+                self._keep(np.zeros(len(self._sprites),dtype=bool))
                 return
 
             # Choose some random particles to remove
-            indexes_to_remove = np.random.choice(range(len(self._particles)),
-                                                 np.abs(difference),
-                                                 replace=False)
-            indexes_to_remove.sort()
-            for i in indexes_to_remove.reverse():
-                self._particles.pop(i)
+            rng = pyfx.util.rng.get_rng(self._rng)
+            indexes_to_remove = rng.choice(range(len(self._sprites)),
+                                           np.abs(difference),
+                                           replace=False)
+            keep = np.ones(len(self._sprites),dtype=bool)
+            keep[indexes_to_remove] = False
+            self._keep(keep)
 
         # Add particles
         elif difference > 0:
-            for i in range(difference):
-                self._particles.append(self._generate_random_particle())
+            self._add_particles(difference)
 
         # Don't do anything if there is no difference.
         else:
@@ -176,18 +329,34 @@ class ParticleCollection:
 
     def advance_time(self,dt=1.0,num_steps=1):
         """
-        Take time step(s).
+        Take time step(s).  The integrator may split each step into
+        substeps.
 
         dt: time step size.
         num_steps: number of steps to take
+
+        Returns the number of (sub)steps taken.
+        """
+
+        return self._integrator.advance(self._coords,self._velocities,
+                                        self._accels,self._masses,
+                                        self._get_forces,dt,num_steps)
+
+    def _get_forces(self,coords):
+        """
+        Total force from all potentials on each of the (N,2) coords.
         """
 
-        for p in self._particles:
-            self.apply_forces(p[0],dt,num_steps)
+        forces = np.zeros(coords.shape,dtype=np.float)
+        for pot in self.potentials:
+            forces += _batch_forces(pot,coords)
+
+        return forces
 
     def apply_forces(self,particle,dt=1.0,num_steps=1):
         """
-        Apply forces to a particle.
+        Apply forces to a particle that is not part of the collection.  The
+        collection itself is advanced with advance_time().
 
         particle: physics.Particle instance
         dt: time step
@@ -195,14 +364,76 @@ class ParticleCollection:
         """
 
         for i in range(num_steps):
-            forces = np.array([0.0,0.0],dtype=np.float)
-            for pot in self.potentials:
-                forces += pot.get_forces(particle.coord)
-            particle.advance_time(forces,dt)
+            forces = self._get_forces(np.array([particle.coord],dtype=np.float))
+            particle.advance_time(forces[0],dt)
 
     @property
     def particles(self):
-        return self._particles
+        """
+        List of (Particle, Sprite) tuples built from the current state.  This
+        is a snapshot; changing it does not change the collection.
+        """
+
+        out = []
+        for i in range(len(self._sprites)):
+            p = pyfx.physics.Particle(self._coords[i],
+                                      velocity=self._velocities[i],
+                                      radius=self._radii[i],
+                                      density=self._particle_density)
+            out.append((p,self._sprites[i]))
+
+        return out
+
+    @property
+    def coords(self):
+        """
+        (N,2) array of particle coordinates.
+        """
+        return self._coords
+
+    @property
+    def velocities(self):
+        """
+        (N,2) array of particle velocities.
+        """
+        return self._velocities
+
+    @property
+    def masses(self):
+        """
+        (N,) array of particle masses.
+        """
+        return self._masses
+
+    @property
+    def radii(self):
+        """
+        (N,) array of particle radii.
+        """
+        return self._radii
+
+    @property
+    def intensities(self):
+        """
+        (N,) array of particle intensities (0 to 1 scale), as drawn by the
+        sprite generator.  0 if the generator does not provide them.
+        """
+        return self._intensities
+
+    @property
+    def hues(self):
+        """
+        (N,) array of particle hues (0 to 1 scale), as set by the sprite
+        generator.  0 if the generator does not provide them.
+        """
+        return self._hues
+
+    @property
+    def sprites(self):
+        """
+        List of particle sprites (None if there is no sprite generator).
+        """
+        return self._sprites
 
     @property
     def num_particles(self):
@@ -246,7 +477,7 @@ class ParticleCollection:
             new_velocity_dist.append(velocity_dist)
 
         if new_velocity_dist[1] < 0 or new_velocity_dist[3] < 0:
-            mangled = rue
+            mangled = True
 
         if mangled:
             err = "Uninterpretable velocity_dist.  This parameter should be a\n"
@@ -313,3 +544,79 @@ class ParticleCollection:
     @sprite_generator.setter
     def sprite_generator(self,sprite_generator):
         self._sprite_generator = sprite_generator
+
+    @property
+    def build_sprites(self):
+        return self._build_sprites
+
+    @build_sprites.setter
+    def build_sprites(self,build_sprites):
+        self._build_sprites = bool(build_sprites)
+
+    @property
+    def integrator(self):
+        return self._integrator
+
+    @integrator.setter
+    def integrator(self,integrator):
+
+        if integrator is None:
+            integrator = pyfx.physics.integrators.VelocityVerlet()
+
+        self._integrator = integrator
+
+    @property
+    def rng(self):
+        """
+        np.random.Generator used to create and remove particles (None for the
+        global np.random state).  Potentials have their own rng.
+        """
+        return self._rng
+
+    @rng.setter
+    def rng(self,rng):
+        self._rng = rng
+
+def _batch_forces(potential,coords):
+    """
+    Forces from potential on each of the (N,2) coords, as an (N,2) array.
+    Potentials that do not derive from physics.Potential and lack a batch
+    method are evaluated one coordinate at a time.
+    """
+
+    try:
+        get_forces_batch = potential.get_forces_batch
+    except AttributeError:
+        forces = np.zeros(coords.shape,dtype=np.float)
+        for i in range(len(coords)):
+            forces[i] = potential.get_forces(coords[i])
+        return forces
+
+    return get_forces_batch(coords)
+
+def _batch_properties(sprite_generator,num_particles):
+    """
+    Intensities and hues for num_particles new particles, as two (N,) arrays,
+    or None if the sprite generator cannot draw them in bulk.
+    """
+
+    try:
+        sample_properties = sprite_generator.sample_properties
+    except AttributeError:
+        return None
+
+    return sample_properties(num_particles)
+
+def _batch_sample(potential,num_coords):
+    """
+    Sample num_coords coordinates from potential, as an (N,2) array.
+    Potentials that do not derive from physics.Potential and lack a batch
+    method are sampled one coordinate at a time.
+    """
+
+    try:
+        sample_coords = potential.sample_coords
+    except AttributeError:
+        return np.array([potential.sample_coord() for i in range(num_coords)])
+
+    return sample_coords(num_coords)
@@ -1,3 +1,4 @@
+from .base import Potential
 
 from .empirical import Empirical
 from .radial import Radial
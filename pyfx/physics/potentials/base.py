@@ -1,8 +1,16 @@
 
+from ...util.rng import get_rng
+
 import numpy as np
 
+import hashlib
+
 class Potential:
 
+    # np.random.Generator used for random draws (sampling coordinates, random
+    # forces).  None means the global np.random state.
+    _rng = None
+
     def __init__(self,kT):
 
         if kT < 0:
@@ -16,7 +24,18 @@ class Potential:
 
     def sample_coord(self):
 
-        return np.random.normal(0,1,2)
+        return get_rng(self._rng).normal(0,1,2)
+
+    def sample_coords(self,num_coords=1):
+        """
+        Return an array holding num_coords coordinates sampled from the
+        potential, one per row.
+
+        Subclasses should override this with a vectorized version; this
+        fallback calls sample_coord num_coords times.
+        """
+
+        return np.array([self.sample_coord() for i in range(num_coords)])
 
     def get_energy(self,coord):
 
@@ -26,6 +45,66 @@ class Potential:
 
         return np.array([0,0],dtype=np.float)
 
+    def get_energy_batch(self,coords):
+        """
+        Return the energy at each of the coords (array with one coordinate
+        per row) as a 1D array.
+
+        Subclasses should override this with a vectorized version; this
+        fallback calls get_energy once per coordinate.
+        """
+
+        coords = np.asarray(coords,dtype=np.float)
+
+        energies = np.zeros(len(coords),dtype=np.float)
+        for i in range(len(coords)):
+            energies[i] = self.get_energy(coords[i])
+
+        return energies
+
+    def get_forces_batch(self,coords):
+        """
+        Return the forces at each of the coords (array with one coordinate
+        per row) as an array with one force vector per row.
+
+        Subclasses should override this with a vectorized version; this
+        fallback calls get_forces once per coordinate.
+        """
+
+        coords = np.asarray(coords,dtype=np.float)
+
+        forces = np.zeros(coords.shape,dtype=np.float)
+        for i in range(len(coords)):
+            forces[i] = self.get_forces(coords[i])
+
+        return forces
+
+    def _make_signature(self,*values):
+        """
+        Hash the class name and values (numbers, strings, arrays) into a
+        signature string.
+        """
+
+        h = hashlib.sha1(self.__class__.__name__.encode("utf-8"))
+        for v in values:
+            if isinstance(v,np.ndarray):
+                h.update("{} {}".format(v.shape,v.dtype.str).encode("utf-8"))
+                h.update(np.ascontiguousarray(v).tobytes())
+            else:
+                h.update(repr(v).encode("utf-8"))
+
+        return h.hexdigest()
+
+    @property
+    def signature(self):
+        """
+        String that changes whenever anything that determines the forces,
+        energies or sampling of this potential changes.  Used to check that
+        saved simulation checkpoints still apply.  None if the potential
+        cannot provide one; subclasses should override this.
+        """
+        return None
+
     @property
     def kT(self):
         return self._kT
@@ -34,3 +113,15 @@ class Potential:
     def kT(self,kT):
         self._kT = kT
         self.update()
+
+    @property
+    def rng(self):
+        """
+        np.random.Generator used for random draws.  If None, use the global
+        np.random state.
+        """
+        return self._rng
+
+    @rng.setter
+    def rng(self,rng):
+        self._rng = rng
@@ -1,13 +1,33 @@
 
 from .base import Potential
+from ..sampler import Sampler
 import numpy as np
 from scipy import interpolate
 
 class Empirical(Potential):
     """
+    Potential built from an observed 2D surface, smoothed with a spline.
+
+    By default, forces are evaluated from the spline derivatives at each
+    coordinate.  If force_grid is set, the forces are instead calculated
+    once on a grid (every force_grid pixels) and stored as float32 arrays.
+    Force queries are then answered by bilinear interpolation on that grid,
+    which is much cheaper than evaluating the spline.  The grid is rebuilt
+    after every update() that loads a new surface and is kept when the
+    potential is pickled.
+
+    The spline, force grid and sampler are all built the first time they are
+    needed, so creating an Empirical potential from a stored surface is
+    cheap.
     """
 
-    def __init__(self,obs_potential,kT=1):
+    def __init__(self,obs_potential,kT=1,force_grid=None):
+        """
+        obs_potential: 2D array holding the potential surface
+        kT: energy scale
+        force_grid: spacing (in pixels) of the precomputed force grid.  If
+                    None, evaluate the spline directly.
+        """
 
         self._dimensions = np.copy(obs_potential.shape)
         if len(self._dimensions) != 2:
@@ -20,6 +40,12 @@ class Empirical(Potential):
         self._x_grid = np.array(range(self._dimensions[0]),dtype=np.int)
         self._y_grid = np.array(range(self._dimensions[1]),dtype=np.int)
 
+        if force_grid is not None and force_grid < 1:
+            err = "force_grid must be 1 or more\n"
+            raise ValueError(err)
+        self._force_grid = force_grid
+        self._forces = None
+
         self.update(obs_potential)
 
     def update(self,obs_potential=None):
@@ -28,20 +54,45 @@ class Empirical(Potential):
 
         obs_potential should be a 2D array of a potential.
 
-        self._potential is a spline approximation of the observed potential
+        These are built when first needed:
+
+        self._potential: spline approximation of the observed potential
         self._w: boltzmann weights
         self._p: boltzmann weighted probabilities (as a 1D array)
+        self._sampler: Sampler drawing pixels from self._p
         """
 
         if obs_potential is not None:
             self._obs_potential = obs_potential
+            self._potential = None
+            self._forces = None
+
+        self._w = None
+        self._p = None
+        self._sampler = None
+
+    def _get_spline(self):
+        """
+        Return the spline approximation of the observed potential, building
+        it if needed.
+        """
+
+        if self._potential is None:
             self._potential = interpolate.RectBivariateSpline(self._x_grid,
                                                               self._y_grid,
                                                               self._obs_potential)
 
-        self._w = None
-        self._p = None
-        self._p_indexes = None
+        return self._potential
+
+    def _calc_sampler(self):
+        """
+        Calculate the Boltzmann weights for this potential and build a
+        sampler over them.
+        """
+
+        self._w = np.exp(-self._obs_potential/self._kT)
+        self._p = np.ravel(self._w)/np.sum(self._w)
+        self._sampler = Sampler(self._p)
 
     def sample_coord(self):
         """
@@ -49,29 +100,157 @@ class Empirical(Potential):
         potential surface.
         """
 
-        # The weights have not been calculated for this potential -- calculate
-        # them.
-        if self._w is None:
-            self._w = np.exp(-self._obs_potential/self._kT)
-            self._p = np.ravel(self._w)/np.sum(self._w)
-            self._p_indexes = np.array(range(len(self._p)),dtype=np.int)
+        return self.sample_coords()[0]
 
-        position = np.random.choice(self._p_indexes,p=self._p)
-        y_coord = np.mod(position,self._w.shape[1])
-        x_coord = np.int((position - y_coord)/self._w.shape[1])
+    def sample_coords(self,num_coords=1):
+        """
+        Return a (num_coords,2) array of coordinates sampled from the
+        Boltzmann-weighted potential surface.
+        """
 
-        return np.array((x_coord, y_coord))
+        # The sampler has not been built for this potential -- build it.
+        if self._sampler is None:
+            self._calc_sampler()
+
+        positions = self._sampler.sample(num_coords,rng=self._rng)
+
+        return np.stack(np.divmod(positions,self._w.shape[1]),axis=1)
 
     def get_energy(self,coord):
 
-        return self._potential(coord[0],coord[1])
+        return self._get_spline()(coord[0],coord[1])
 
     def get_forces(self,coord):
         """
         Return force applied in x and y at position x,y.
         """
 
-        Fx = -self._potential(coord[0],coord[1],dx=1)
-        Fy = -self._potential(coord[0],coord[1],dy=1)
+        if self._force_grid is not None:
+            return self.get_forces_batch(np.array([coord]))[0]
+
+        spline = self._get_spline()
+        Fx = -spline(coord[0],coord[1],dx=1)
+        Fy = -spline(coord[0],coord[1],dy=1)
 
         return np.array(np.array((Fx[0,0],Fy[0,0])))
+
+    def get_energy_batch(self,coords):
+        """
+        Return the energy at each of the (N,2) coords as an (N,) array.
+        """
+
+        coords = np.asarray(coords,dtype=np.float)
+
+        return self._get_spline()(coords[:,0],coords[:,1],grid=False)
+
+    def get_forces_batch(self,coords):
+        """
+        Return the forces applied in x and y at each of the (N,2) coords as
+        an (N,2) array.  The spline derivatives are evaluated on all points in
+        one call.  If force_grid is set, the forces are interpolated from the
+        precomputed float32 grid instead.
+        """
+
+        if self._force_grid is not None:
+            return self._lookup_forces(coords)
+
+        coords = np.asarray(coords,dtype=np.float)
+
+        spline = self._get_spline()
+
+        forces = np.zeros(coords.shape,dtype=np.float)
+        forces[:,0] = -spline(coords[:,0],coords[:,1],dx=1,grid=False)
+        forces[:,1] = -spline(coords[:,0],coords[:,1],dy=1,grid=False)
+
+        return forces
+
+    def calc_force_grid(self):
+        """
+        Calculate Fx and Fy on a grid with force_grid pixel spacing.  This is
+        done automatically on the first force query after an update, but can
+        be called ahead of time (say, before pickling the potential).
+        """
+
+        if self._force_grid is None:
+            err = "force_grid is not set for this potential\n"
+            raise ValueError(err)
+
+        # Number of grid points along each dimension.  The grid always spans
+        # the whole surface, so the spacing is at most force_grid.
+        shape = np.int_(np.ceil((self._dimensions - 1)/self._force_grid)) + 1
+        shape = np.maximum(shape,2)
+        x = np.linspace(0,self._dimensions[0] - 1,shape[0])
+        y = np.linspace(0,self._dimensions[1] - 1,shape[1])
+
+        spline = self._get_spline()
+
+        self._forces = np.zeros((shape[0],shape[1],2),dtype=np.float32)
+        self._forces[:,:,0] = -spline(x,y,dx=1)
+        self._forces[:,:,1] = -spline(x,y,dy=1)
+
+        self._forces_scale = ((shape - 1)/(self._dimensions - 1)).astype(np.float32)
+
+    def _lookup_forces(self,coords):
+        """
+        Bilinear interpolation of the precomputed force grid at each of the
+        (N,2) coords.  Coords outside the surface get the force at the
+        nearest edge.  Returns an (N,2) float32 array.
+        """
+
+        if self._forces is None:
+            self.calc_force_grid()
+
+        max_index = np.array(self._forces.shape[:2],dtype=np.float32) - 1
+
+        # Position of each coord in grid units
+        g = np.asarray(coords,dtype=np.float32)*self._forces_scale
+        np.clip(g,0,max_index,out=g)
+
+        # Lower-left grid point and fractional offset from it
+        i = np.minimum(g.astype(np.int),max_index.astype(np.int) - 1)
+        g -= i
+        fx = g[:,0:1]
+        fy = g[:,1:2]
+
+        x0 = i[:,0]
+        y0 = i[:,1]
+        F = self._forces
+
+        out = F[x0,y0]*((1 - fx)*(1 - fy))
+        out += F[x0 + 1,y0]*(fx*(1 - fy))
+        out += F[x0,y0 + 1]*((1 - fx)*fy)
+        out += F[x0 + 1,y0 + 1]*(fx*fy)
+
+        return out
+
+    def __setstate__(self,state):
+        """
+        Potentials pickled by older versions of pyfx do not have a force grid
+        or sampler.
+        """
+
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_force_grid",None)
+        self.__dict__.setdefault("_forces",None)
+        self.__dict__.setdefault("_sampler",None)
+        self.__dict__.pop("_p_indexes",None)
+
+    @property
+    def surface(self):
+        """
+        Observed 2D potential surface the potential was built from.
+        """
+        return self._obs_potential
+
+    @property
+    def signature(self):
+        return self._make_signature(np.asarray(self._obs_potential),self._kT,
+                                    self._force_grid)
+
+    @property
+    def force_grid(self):
+        """
+        Spacing (in pixels) of the precomputed force grid, or None if forces
+        are evaluated from the spline directly.
+        """
+        return self._force_grid
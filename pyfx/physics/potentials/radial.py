@@ -1,5 +1,7 @@
 
 from .base import Potential
+from ..sampler import Sampler
+from ...util.rng import get_rng
 import numpy as np
 
 class Radial(Potential):
@@ -49,12 +51,12 @@ class Radial(Potential):
 
         self._w = np.exp(-U/self._kT)
         self._p = self._w/np.sum(self._w)
-        self._p_indexes = np.array(range(len(self._p)),dtype=np.int)
+        self._sampler = Sampler(self._p)
 
     def sample_coord(self,particle_charge=1.0,max_tries=500):
 
         # Sample a radius from the Boltzmann-weighted possibilities
-        r = self._possible_r[np.random.choice(self._p_indexes,p=self._p)]
+        r = self._possible_r[self._sampler.sample(rng=self._rng)]
 
         # Really a hack, but make sure that we end up with a particle that
         # is within the desired dimensions
@@ -63,7 +65,7 @@ class Radial(Potential):
         while not_found and counter < max_tries:
 
             # Grab a random theta
-            theta = 2*np.pi*np.random.random()
+            theta = 2*np.pi*get_rng(self._rng).random()
 
             # calculate x and y
             x = self._center_coord[0] + np.cos(theta)*r
@@ -79,6 +81,36 @@ class Radial(Potential):
 
         return np.array((x,y))
 
+    def sample_coords(self,num_coords=1,particle_charge=1.0,max_tries=500):
+        """
+        Return a (num_coords,2) array of coordinates sampled from the
+        Boltzmann-weighted potential.  Coordinates that could not be placed
+        within the dimensions after max_tries are nan.
+        """
+
+        # Sample radii from the Boltzmann-weighted possibilities
+        r = self._possible_r[self._sampler.sample(num_coords,rng=self._rng)]
+
+        # Draw a random angle for every coordinate, then redraw for those that
+        # land outside of the dimensions
+        out = np.full((num_coords,2),np.nan)
+        pending = np.arange(num_coords)
+        for i in range(max_tries):
+
+            theta = 2*np.pi*get_rng(self._rng).random(len(pending))
+            x = self._center_coord[0] + np.cos(theta)*r[pending]
+            y = self._center_coord[1] + np.sin(theta)*r[pending]
+
+            inside = (x > 0)*(x < self._dimensions[0])*(y > 0)*(y < self._dimensions[1])
+            out[pending[inside],0] = x[inside]
+            out[pending[inside],1] = y[inside]
+
+            pending = pending[np.logical_not(inside)]
+            if len(pending) == 0:
+                break
+
+        return out
+
     def get_energy(self,coord,particle_charge=1.0):
 
         r = np.sqrt(np.sum((coord - self._center_coord)**2))
@@ -106,3 +138,34 @@ class Radial(Potential):
         F = force_in_r*(coord - self._center_coord)/r
 
         return F
+
+    def get_energy_batch(self,coords,particle_charge=1.0):
+        """
+        Return the energy at each of the (N,2) coords as an (N,) array.
+        """
+
+        r = np.sqrt(np.sum((np.asarray(coords) - self._center_coord)**2,axis=1))
+
+        E = np.full(r.shape,np.nan)
+        E[r != 0] = self._pot_mag*particle_charge/r[r != 0]
+
+        return E
+
+    def get_forces_batch(self,coords,particle_charge=1.0):
+        """
+        Return the forces applied in x and y at each of the (N,2) coords as
+        an (N,2) array.
+        """
+
+        delta = np.asarray(coords) - self._center_coord
+        r = np.sqrt(np.sum(delta**2,axis=1))
+
+        force_r = np.maximum(r,self._min_r)
+        force_in_r = self._pot_mag*particle_charge*(1/force_r**2)
+
+        return (force_in_r/r)[:,np.newaxis]*delta
+
+    @property
+    def signature(self):
+        return self._make_signature(self._center_coord,self._dimensions,
+                                    self._pot_mag,self._min_r,self._kT)
@@ -1,5 +1,6 @@
 
 from .base import Potential
+from ...util.rng import get_rng, integers
 import numpy as np
 
 class Random(Potential):
@@ -30,10 +31,22 @@ class Random(Potential):
         potential surface.
         """
 
-        x_coord = np.random.choice(range(self._dimensions[0]))
-        y_coord = np.random.choice(range(self._dimensions[1]))
+        rng = get_rng(self._rng)
+        x_coord = rng.choice(range(self._dimensions[0]))
+        y_coord = rng.choice(range(self._dimensions[1]))
 
-        return np.arary((x_coord, y_coord))
+        return np.array((x_coord, y_coord))
+
+    def sample_coords(self,num_coords=1):
+        """
+        Return a (num_coords,2) array of coordinates sampled uniformly
+        from the dimensions.
+        """
+
+        x_coords = integers(self._rng,0,self._dimensions[0],num_coords)
+        y_coords = integers(self._rng,0,self._dimensions[1],num_coords)
+
+        return np.stack((x_coords,y_coords),axis=1)
 
     def get_energy(self,coord):
 
@@ -44,4 +57,19 @@ class Random(Potential):
         Return random force.
         """
 
-        return np.random.normal(0,self._force_sd,2)
+        return get_rng(self._rng).normal(0,self._force_sd,2)
+
+    def get_energy_batch(self,coords):
+
+        return np.zeros(len(coords),dtype=np.float)
+
+    def get_forces_batch(self,coords):
+        """
+        Return an independent random force for each of the (N,2) coords.
+        """
+
+        return get_rng(self._rng).normal(0,self._force_sd,(len(coords),2))
+
+    @property
+    def signature(self):
+        return self._make_signature(self._dimensions,self._force_sd,self._kT)
@@ -1,5 +1,6 @@
 
 from .base import Potential
+from ..sampler import Sampler
 import numpy as np
 
 class Spring1D(Potential):
@@ -40,18 +41,28 @@ class Spring1D(Potential):
 
         self._w = np.exp(-U/self._kT)
         self._p = self._w/np.sum(self._w)
-        self._p_indexes = np.array(range(len(self._p)),dtype=np.int)
+        self._sampler = Sampler(self._p)
 
     def sample_coord(self,max_tries=500):
 
         # Sample a value from the Boltzmann-weighted possibilities
-        r = self._possible_r[np.random.choice(self._p_indexes,p=self._p)]
+        r = self._possible_r[self._sampler.sample(rng=self._rng)]
+
+        return r + self._minimum
+
+    def sample_coords(self,num_coords=1):
+        """
+        Return a 1D array of num_coords positions sampled from the
+        Boltzmann-weighted potential.
+        """
+
+        r = self._possible_r[self._sampler.sample(num_coords,rng=self._rng)]
 
         return r + self._minimum
 
     def get_energy(self,position):
 
-        r = position - self._minimium
+        r = position - self._minimum
 
         return 0.5*self._spring_constant*(r**2)
 
@@ -60,3 +71,26 @@ class Spring1D(Potential):
         r = position - self._minimum
 
         return -self._spring_constant*r
+
+    def get_energy_batch(self,positions):
+        """
+        Return the energy at each of the positions (1D array).
+        """
+
+        r = np.asarray(positions,dtype=np.float) - self._minimum
+
+        return 0.5*self._spring_constant*(r**2)
+
+    def get_forces_batch(self,positions):
+        """
+        Return the force at each of the positions (1D array).
+        """
+
+        r = np.asarray(positions,dtype=np.float) - self._minimum
+
+        return -self._spring_constant*r
+
+    @property
+    def signature(self):
+        return self._make_signature(self._minimum,self._spring_constant,
+                                    self._max_r,self._kT)
@@ -1,5 +1,6 @@
 
 from .base import Potential
+from ...util.rng import get_rng, integers
 import numpy as np
 
 class Uniform(Potential):
@@ -30,11 +31,23 @@ class Uniform(Potential):
         potential surface.
         """
 
-        x_coord = np.random.choice(range(self._dimensions[0]))
-        y_coord = np.random.choice(range(self._dimensions[1]))
+        rng = get_rng(self._rng)
+        x_coord = rng.choice(range(self._dimensions[0]))
+        y_coord = rng.choice(range(self._dimensions[1]))
 
         return np.array((x_coord, y_coord))
 
+    def sample_coords(self,num_coords=1):
+        """
+        Return a (num_coords,2) array of coordinates sampled uniformly
+        from the dimensions.
+        """
+
+        x_coords = integers(self._rng,0,self._dimensions[0],num_coords)
+        y_coords = integers(self._rng,0,self._dimensions[1],num_coords)
+
+        return np.stack((x_coords,y_coords),axis=1)
+
     def get_energy(self,coord):
 
         return 0.0
@@ -45,3 +58,23 @@ class Uniform(Potential):
         """
 
         return self._force_vector
+
+    def get_energy_batch(self,coords):
+
+        return np.zeros(len(coords),dtype=np.float)
+
+    def get_forces_batch(self,coords):
+        """
+        Return the force applied at each of the (N,2) coords as an (N,2)
+        array.
+        """
+
+        forces = np.zeros((len(coords),2),dtype=np.float)
+        forces[:] = self._force_vector
+
+        return forces
+
+    @property
+    def signature(self):
+        return self._make_signature(self._dimensions,self._force_vector,
+                                    self._kT)
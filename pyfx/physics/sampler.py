@@ -0,0 +1,62 @@
+__description__ = \
+"""
+Fast sampling from discrete probability distributions.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-23"
+
+from ..util.rng import get_rng
+
+import numpy as np
+
+class Sampler:
+    """
+    Draw indexes from a discrete distribution (for example, Boltzmann weights
+    over every pixel of a frame).
+
+    The cumulative distribution is built once; each draw is then a binary
+    search (searchsorted) on it, and any number of indexes can be drawn in a
+    single vectorized call.  np.random.choice(len(p),p=p) rebuilds the
+    cumulative distribution on every call, which dominates the cost for big
+    distributions.
+
+    Draws use the same random numbers, in the same order, as
+    np.random.choice, so swapping one for the other does not change seeded
+    results.
+    """
+
+    def __init__(self,p):
+        """
+        p: array of non-negative probabilities (or weights).  Multidimensional
+           arrays are flattened.
+        """
+
+        p = np.ravel(np.asarray(p,dtype=np.float))
+        if len(p) == 0 or np.any(p < 0) or not np.all(np.isfinite(p)):
+            err = "p must be a non-empty array of non-negative, finite values\n"
+            raise ValueError(err)
+
+        cdf = np.cumsum(p)
+        if cdf[-1] <= 0:
+            err = "p must have at least one positive value\n"
+            raise ValueError(err)
+        cdf /= cdf[-1]
+
+        self._cdf = cdf
+
+    def sample(self,size=None,rng=None):
+        """
+        Draw indexes.
+
+        size: number of indexes to draw.  If None, draw a single index and
+              return it as an integer; otherwise, return an array.
+        rng: np.random.Generator to draw from.  If None, use the global
+             np.random state.
+        """
+
+        u = get_rng(rng).random(size)
+
+        return self._cdf.searchsorted(u,side="right")
+
+    def __len__(self):
+        return len(self._cdf)
@@ -3,7 +3,34 @@ import pyfx
 
 from .base import Processor
 
-import os, shutil, pickle, inspect, json
+import numpy as np
+
+import os, shutil, inspect, json, sys, hashlib
+import multiprocessing
+
+# Version of the potential surface files.  Files with another version are
+# calculated again.
+POTENTIAL_VERSION = 1
+
+# Processor used by precompute worker processes.  Set once per worker by
+# _init_precompute_worker.
+_worker_state = {}
+
+def _init_precompute_worker(processor):
+    """
+    Initialize a precompute worker process.
+    """
+
+    _worker_state["processor"] = processor
+
+def _precompute_keyframe(t):
+    """
+    Calculate and write out the potential for keyframe t in a worker process.
+    """
+
+    _worker_state["processor"]._calc_potential(t)
+
+    return t
 
 class DiffPotential(Processor):
     """
@@ -11,6 +38,14 @@ class DiffPotential(Processor):
     workspace time.  It reproduces the physics.Potential methods, so Effects
     can access this time-dependent potential as though it is just some other
     potential.
+
+    The potential surface for each keyframe is stored in the processor
+    directory as a compressed .npz file holding only the 8-bit smoothed
+    well, along with the settings used to calculate it.  Files calculated
+    with other settings (say, a different workspace diff_method) are
+    calculated again.  The spline, force grid and sampler are rebuilt from the well
+    when they are first used.  The last few potentials used are kept in
+    memory (cache_size).
     """
 
     def __init__(self,
@@ -21,7 +56,17 @@ class DiffPotential(Processor):
                  num_iterate=20,
                  dilation_interval=2,
                  disk_size=35,
-                 blur=50):
+                 blur=50,
+                 force_grid=None,
+                 smooth_method="distance",
+                 cache_size=4):
+        """
+        smooth_method: how Background.smooth_diff builds the well
+                       ("distance" or "dilation")
+        cache_size: number of keyframe potentials to keep in memory.  This
+                    does not affect the potentials, so it is not stored with
+                    the other parameters.
+        """
 
         super().__init__()
 
@@ -33,6 +78,7 @@ class DiffPotential(Processor):
         kwarg_keys = inspect.getfullargspec(self.__init__)[0]
         kwarg_keys.remove("self")
         kwarg_keys.remove("workspace")
+        kwarg_keys.remove("cache_size")
 
         local_variables = locals()
         self._params = dict([(k,local_variables[k]) for k in kwarg_keys])
@@ -49,23 +95,36 @@ class DiffPotential(Processor):
             print(self.__class__.__name__,"processor will use existing directory")
 
             f = open(self._json_file,"r")
-            self._params = json.load(f)
+            params = json.load(f)
             f.close()
 
+            # Directories written by older versions lack newer parameters
+            for k in self._params:
+                params.setdefault(k,self._params[k])
+            self._params = params
+
+        self._cache_size = cache_size
+        self._potentials = pyfx.util.LRUCache(cache_size)
+
         self._last_retrieved_t = -1
         self._last_retrieved_pot = None
+        self._rng = None
 
         self._baked = False
 
 
     def bake(self):
+        """
+        Work out which keyframe (and potential file) each frame uses.  Only
+        the frame times are stored; frames are read from the workspace when
+        a potential is calculated.
+        """
 
-        self._pot_files = []
         max_digits = str(len(str(self._workspace.max_time)) + 2)
-        fmt_string = "{:0" + max_digits + "d}.pickle"
+        fmt_string = "{:0" + max_digits + "d}.npz"
 
         self._potential_files = {}
-        self._img_files = {}
+        self._keyframes = {}
 
         current_file = None
         for t in self._workspace.times:
@@ -73,13 +132,165 @@ class DiffPotential(Processor):
             if t % self._params["update_interval"] == 0 or current_file is None:
                 current_file = os.path.join(self._processor_dir,
                                             fmt_string.format(t))
-                current_image = self._workspace.get_frame(t)
+                keyframe = t
 
             self._potential_files[t] = current_file
-            self._img_files[t] = current_image
+            self._keyframes[t] = keyframe
 
         self._baked = True
 
+    def precompute(self,workers=1):
+        """
+        Calculate the potential surface for every keyframe (one every
+        update_interval frames) that is not already on disk.  With
+        workers > 1, keyframes are calculated in a pool of worker processes.
+        Can be interrupted and run again; finished keyframes are skipped.
+
+        workers: number of processes to use
+
+        Returns the number of keyframes calculated.
+        """
+
+        if not self._baked:
+            self.bake()
+
+        workers = int(workers)
+        if workers < 1:
+            err = "workers must be 1 or more\n"
+            raise ValueError(err)
+
+        keyframes = sorted(set(self._keyframes.values()))
+        to_calc = [t for t in keyframes if not self._is_calculated(t)]
+
+        print("calculating {} of {} potential surfaces".format(len(to_calc),
+                                                               len(keyframes)))
+        sys.stdout.flush()
+
+        if workers == 1 or len(to_calc) < 2:
+            for t in to_calc:
+                self._calc_potential(t)
+            return len(to_calc)
+
+        pool = multiprocessing.Pool(min(workers,len(to_calc)),
+                                    initializer=_init_precompute_worker,
+                                    initargs=(self,))
+        try:
+            for t in pool.imap_unordered(_precompute_keyframe,to_calc):
+                pass
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        return len(to_calc)
+
+    def _calc_potential(self,t):
+        """
+        Calculate the potential surface for keyframe t and write it out.
+        """
+
+        print("calculating potential surface for frame {}".format(t))
+        sys.stdout.flush()
+
+        diff_smooth = self._workspace.smooth_diff(t,
+                                                  threshold=self._params["threshold"],
+                                                  num_iterate=self._params["num_iterate"],
+                                                  dilation_interval=self._params["dilation_interval"],
+                                                  disk_size=self._params["disk_size"],
+                                                  blur=self._params["blur"],
+                                                  method=self._params["smooth_method"])
+        force_grid = self._params.get("force_grid")
+        pot = pyfx.physics.potentials.Empirical(diff_smooth,kT=self._params["kT"],
+                                                force_grid=force_grid)
+
+        # Write to a temporary file and move into place, so an interrupted
+        # run (or another process calculating the same keyframe) never
+        # leaves a partial file behind.
+        pot_file = self._potential_files[t]
+        tmp_file = "{}.{}.tmp".format(pot_file,os.getpid())
+        with open(tmp_file,"wb") as f:
+            np.savez_compressed(f,
+                                version=POTENTIAL_VERSION,
+                                settings=self._well_settings(),
+                                well=np.asarray(diff_smooth,dtype=np.uint8))
+        os.replace(tmp_file,pot_file)
+
+        return pot
+
+    def _well_settings(self):
+        """
+        String describing everything that determines the smoothed wells:
+        the smooth_diff parameters, the background and how the workspace
+        measures frame differences.
+        """
+
+        settings = dict([(k,self._params[k]) for k in ["threshold",
+                                                       "num_iterate",
+                                                       "dilation_interval",
+                                                       "disk_size",
+                                                       "blur",
+                                                       "smooth_method"]])
+        settings["diff_method"] = str(self._workspace.diff_method)
+        settings["blur_sigma"] = self._workspace.background.blur_sigma
+        settings["background"] = self._workspace.bg_signature
+
+        return json.dumps(settings,sort_keys=True)
+
+    def _is_current(self,data):
+        """
+        Whether an open potential file (from np.load) was written with the
+        current file version and settings.  Only the small version and
+        settings entries are read; the well itself is left on disk.
+        """
+
+        return int(data["version"]) == POTENTIAL_VERSION and \
+               str(data["settings"]) == self._well_settings()
+
+    def _read_well(self,t):
+        """
+        Read the well for keyframe t from disk.  Returns None if it has not
+        been calculated, or was calculated with another file version or other
+        settings.
+        """
+
+        pot_file = self._potential_files[t]
+        if not os.path.isfile(pot_file):
+            return None
+
+        with np.load(pot_file) as data:
+            if not self._is_current(data):
+                return None
+            return data["well"]
+
+    def _is_calculated(self,t):
+        """
+        Whether the potential for keyframe t is on disk in the current
+        format, calculated with the current settings.
+        """
+
+        pot_file = self._potential_files[t]
+        if not os.path.isfile(pot_file):
+            return False
+
+        with np.load(pot_file) as data:
+            return self._is_current(data)
+
+    def _load_potential(self,t):
+        """
+        Load the potential for keyframe t from disk.  Returns None if it has
+        not been calculated (in the current format, with the current
+        settings).
+        """
+
+        well = self._read_well(t)
+        if well is None:
+            return None
+
+        return pyfx.physics.potentials.Empirical(well,kT=self._params["kT"],
+                                                 force_grid=self._params.get("force_grid"))
+
     def _update(self):
         """
         Update the potential given the current time in the workspace.
@@ -94,36 +305,54 @@ class DiffPotential(Processor):
             self.bake()
 
         t = self._workspace.current_time
+        keyframe = self._keyframes[t]
+
+        # Use the copy in memory, load from disk, or calculate (and write
+        # out, so we do not have to calculate again).  Potentials in memory
+        # are only used if the settings have not changed since.
+        cache_key = (keyframe,self._well_settings())
+        pot = self._potentials.get(cache_key)
+        if pot is None:
+            pot = self._load_potential(keyframe)
+            if pot is None:
+                pot = self._calc_potential(keyframe)
+
+            # Potentials grow as their spline and sampler are built, so
+            # count entries rather than bytes: each counts as one "byte"
+            # of a cache_size budget.
+            self._potentials.put(cache_key,pot,num_bytes=1)
+
+        # kT may have been changed since this potential was made
+        if pot.kT != self._params["kT"]:
+            pot.kT = self._params["kT"]
+
+        pot.rng = self._rng
+        self._last_retrieved_t = t
+        self._last_retrieved_pot = pot
 
-        pot_file = self._potential_files[t]
+    def __getstate__(self):
+        """
+        Do not send the potentials held in memory to other processes; they
+        load them from disk when they need them.
+        """
 
-        # If already calculated, return
-        if os.path.isfile(pot_file):
-            self._last_retrieved_t = t
-            self._last_retrieved_pot = pickle.load(open(pot_file,"rb"))
-            return
+        state = self.__dict__.copy()
+        state["_potentials"] = pyfx.util.LRUCache(self._cache_size)
+        state["_last_retrieved_t"] = -1
+        state["_last_retrieved_pot"] = None
 
-        print("calculating potential surface for frame {}".format(t))
-        diff_smooth = self._workspace.background.smooth_diff(self._img_files[t],
-                                                       threshold=self._params["threshold"],
-                                                       num_iterate=self._params["num_iterate"],
-                                                       dilation_interval=self._params["dilation_interval"],
-                                                       disk_size=self._params["disk_size"],
-                                                       blur=self._params["blur"])
-        pot = pyfx.physics.potentials.Empirical(diff_smooth,kT=self._params["kT"])
-
-        # Write out, so we do not have to calculate again
-        pickle.dump(pot,open(pot_file,"wb"))
-
-        # Keep the last pot that was retrieved/calculated in memory
-        self._last_retrieved_t = t
-        self._last_retrieved_pot = pot
+        return state
 
     def sample_coord(self):
 
         self._update()
         return self._last_retrieved_pot.sample_coord()
 
+    def sample_coords(self,num_coords=1):
+
+        self._update()
+        return self._last_retrieved_pot.sample_coords(num_coords)
+
     def get_energy(self,coord):
 
         self._update()
@@ -134,6 +363,16 @@ class DiffPotential(Processor):
         self._update()
         return self._last_retrieved_pot.get_forces(coord)
 
+    def get_energy_batch(self,coords):
+
+        self._update()
+        return self._last_retrieved_pot.get_energy_batch(coords)
+
+    def get_forces_batch(self,coords):
+
+        self._update()
+        return self._last_retrieved_pot.get_forces_batch(coords)
+
     @property
     def kT(self):
         self._update()
@@ -141,5 +380,35 @@ class DiffPotential(Processor):
 
     @kT.setter
     def kT(self,kT):
+        self._params["kT"] = kT
         self._update()
         self._last_retrieved_pot.kT = kT
+
+    @property
+    def signature(self):
+        """
+        String that changes whenever the settings that determine the
+        potential surfaces change.  Used to check that saved simulation
+        checkpoints still apply.
+        """
+
+        h = hashlib.sha1(self.__class__.__name__.encode("utf-8"))
+        h.update(json.dumps(self._params,sort_keys=True).encode("utf-8"))
+        h.update(self._well_settings().encode("utf-8"))
+        h.update(str(POTENTIAL_VERSION).encode("utf-8"))
+
+        return h.hexdigest()
+
+    @property
+    def rng(self):
+        """
+        np.random.Generator used to sample coordinates from the potential.
+        If None, use the global np.random state.
+        """
+        return self._rng
+
+    @rng.setter
+    def rng(self,rng):
+        self._rng = rng
+        if self._last_retrieved_pot is not None:
+            self._last_retrieved_pot.rng = rng
@@ -2,7 +2,16 @@ from .background import Background
 
 from .convert import to_image, to_array, to_file, rc_to_xy, xy_to_rc
 from .crop import crop, expand, find_pan_crop, find_zoom_crop, find_rotate_crop
-from .video import video_dimensions, video_to_array, to_video
+from .video import video_dimensions, video_frame_info, video_to_array, to_video
+from .video import VideoReader, VideoWriter
+from .png_writer import PNGWriter
+from .cache import LRUCache
+from .frame_provider import FrameProvider
+from .frame_store import FrameStore
+from .derived_cache import DerivedCache
 
+from . import composite
+from . import rng
+from .rng import RandomStreams
 from . import helper
 from .helper import alpha_composite
@@ -1,39 +1,111 @@
 
 import pyfx
+from . import frame_diff
 
 import numpy as np
-from skimage import filters, measure, morphology
+from scipy import ndimage
+from skimage import filters, morphology
+
+def _dilation_layers(bool_cut,num_iterate,dilation_interval,disk_size):
+    """
+    Count, for each pixel, the written-out layers that cover it, growing
+    bool_cut by repeated binary dilation with a disk.
+    """
+
+    disk = morphology.disk(disk_size)
+
+    out = np.zeros(bool_cut.shape,dtype=np.float)
+
+    tmp = np.copy(bool_cut)
+    for i in range(0,num_iterate):
+        tmp = morphology.binary_dilation(tmp,selem=disk)
+        if i % dilation_interval == 0:
+            out[tmp] += 1
+
+    return out
+
+def _distance_layers(bool_cut,num_iterate,dilation_interval,disk_size):
+    """
+    Same as _dilation_layers, calculated from the distance of each pixel to
+    bool_cut.  Dilating i + 1 times with a disk of radius disk_size covers
+    the pixels within (i + 1)*disk_size of bool_cut, so a pixel is in every
+    written-out layer whose radius is at least its distance.
+    """
+
+    dist = ndimage.distance_transform_edt(~bool_cut)
+
+    radii = np.array([(i + 1)*disk_size for i in range(0,num_iterate)
+                      if i % dilation_interval == 0],dtype=np.float)
+
+    num_covering = len(radii) - np.searchsorted(radii,dist,side="left")
+
+    return num_covering.astype(np.float)
+
+def _shrunken_gaussian(img,sigma,min_sigma=8):
+    """
+    Gaussian blur of a 2D array, calculated on a copy shrunk so the blur is
+    about min_sigma pixels wide, then interpolated back to full size.  For
+    wide blurs this is much faster than blurring at full resolution and
+    indistinguishable from it.
+    """
+
+    factor = max(int(sigma//min_sigma),1)
+    if factor == 1:
+        return filters.gaussian(img,sigma)
+
+    # Averaging blocks blurs a little already; take that out of the blur
+    small_sigma = np.sqrt(max(sigma**2 - (factor**2 - 1)/12,0))/factor
+
+    # Pad with one block of edge pixels so that, as at full resolution, the
+    # blur extends the edge pixels themselves rather than block averages.
+    padded = np.pad(img,factor,mode="edge")
+
+    small = frame_diff._shrink(padded,factor)
+    small = filters.gaussian(small,small_sigma)
+
+    out = frame_diff._grow(small,padded.shape,factor)
+
+    return out[factor:factor + img.shape[0],factor:factor + img.shape[1]]
 
 class Background:
     """
     Class to measure difference between each frame and a background frame.
     """
 
-    def __init__(self,bg_frame,blur_sigma=10):
+    def __init__(self,bg_frame,blur_sigma=10,dtype=np.float,diff_method="ssim"):
+        """
+        bg_frame: background frame (file, array, or PIL.Image)
+        blur_sigma: how much to blur frames before comparing them
+        dtype: float type used for the background arrays and calculations
+        diff_method: how to measure the difference between a frame and the
+                     background.  One of "ssim" (slowest, most exact),
+                     "pyramid" or "absdiff" (fastest); see
+                     pyfx.util.frame_diff.  May also be a class built with
+                     (bg_array_bw,blur_sigma) that has a diff(img_array_bw)
+                     method.
+        """
 
         self._bg_frame = bg_frame
         self._blur_sigma = blur_sigma
+        self._dtype = dtype
 
         self._bg_img = pyfx.util.to_image(bg_frame)
 
-        self._bg_array_color = pyfx.util.to_array(self._bg_frame,num_channels=3,dtype=np.float)
-        self._bg_array_bw = pyfx.util.to_array(self._bg_frame,num_channels=1,dtype=np.float)
-        self._bg_array_blur = filters.gaussian(self._bg_array_bw,self._blur_sigma)
+        self._bg_array_color = pyfx.util.to_array(self._bg_frame,num_channels=3,dtype=dtype)
+        self._bg_array_bw = pyfx.util.to_array(self._bg_frame,num_channels=1,dtype=dtype)
         self._bg_out = pyfx.util.to_array(self._bg_frame,num_channels=4,dtype=np.uint8)
 
+        self.diff_method = diff_method
+
     def frame_diff(self,img):
         """
-        Return differnce between img and background.
+        Return differnce between img and background (2D float array between
+        0 and 1), measured using diff_method.
         """
 
-        img_array_bw = pyfx.util.to_array(img,dtype=np.float,num_channels=1)
-        img_array_blur = filters.gaussian(img_array_bw,sigma=self._blur_sigma)
-
-        total_diff, diff_array = measure.compare_ssim(img_array_blur,
-                                                      self._bg_array_blur,
-                                                      full=True)
+        img_array_bw = pyfx.util.to_array(img,dtype=self._dtype,num_channels=1)
 
-        return 1 - diff_array
+        return self._diff.diff(img_array_bw)
 
     def smooth_diff(self,
                     img,
@@ -41,11 +113,16 @@ class Background:
                     num_iterate=20,
                     dilation_interval=2,
                     disk_size=35,
-                    blur=50):
+                    blur=50,
+                    diff=None,
+                    method="distance"):
         """
         Get a smoothed potential well for the difference between an image
-        and the background.  Calculate using a series of expanding dilations.
-        This is pretty darn slow, unfortunately.
+        and the background.  The well is built from layers: the parts of
+        the frame called as different, grown outward by disk_size pixels
+        num_iterate times, with every dilation_interval-th layer added to
+        the well.  The layers are then blurred and scaled so the bottom of
+        the well is 0 and the rim is 255.
 
         img: image in format recognized by pyfx
         threshold: difference between the frame and background that is called
@@ -54,27 +131,65 @@ class Background:
         dilation_interval: how often to write out the dilation
         disk_size: size of morphological element for dilation
         blur: how much to blur final result (gaussian sigma)
+        diff: frame_diff(img), if it has already been calculated.  If given,
+              img is not used.
+        method: how to build the well.  "distance" (default) finds every
+                layer from one Euclidean distance transform and blurs on a
+                shrunken image.  "dilation" does the series of binary
+                dilations with a disk and blurs at full resolution; it is
+                the original method and is much slower.  The two differ
+                by a few gray levels at most.
         """
 
-        frame_diff = self.frame_diff(img)
-        disk = morphology.disk(disk_size)
+        frame_diff = diff
+        if frame_diff is None:
+            frame_diff = self.frame_diff(img)
 
-        bool_cut = np.zeros(frame_diff.shape,dtype=np.bool)
-        bool_cut[frame_diff > threshold] = True
+        bool_cut = frame_diff > threshold
 
-        out = np.zeros(frame_diff.shape,dtype=np.float)
+        # Nothing differs from the background: the well is flat
+        if not np.any(bool_cut):
+            return 255*np.ones(frame_diff.shape,dtype=np.uint8)
 
-        tmp = np.copy(bool_cut)
-        for i in range(0,num_iterate):
-            tmp = morphology.binary_dilation(tmp,selem=disk)
-            if i % dilation_interval == 0:
-                out[tmp] += 1
+        if method == "distance":
+            out = _distance_layers(bool_cut,num_iterate,dilation_interval,disk_size)
+            out = _shrunken_gaussian(out,blur)
+        elif method == "dilation":
+            out = _dilation_layers(bool_cut,num_iterate,dilation_interval,disk_size)
+            out = filters.gaussian(out,blur)
+        else:
+            err = "method '{}' not recognized.  Should be one of:\n".format(method)
+            err += "distance,dilation\n"
+            raise ValueError(err)
 
-        out = filters.gaussian(out,blur)
         out = 1-out/np.max(out)
 
         return np.array(np.round(255*out,0),dtype=np.uint8)
 
+    @property
+    def diff_method(self):
+        return self._diff_method
+
+    @diff_method.setter
+    def diff_method(self,diff_method):
+
+        if isinstance(diff_method,str):
+            try:
+                diff_class = frame_diff.METHODS[diff_method]
+            except KeyError:
+                err = "diff_method '{}' not recognized.  Should be one of:\n".format(diff_method)
+                err += "{}\n".format(",".join(frame_diff.METHODS.keys()))
+                raise ValueError(err)
+        else:
+            diff_class = diff_method
+
+        # Everything that depends only on the background is calculated here
+        self._diff = diff_class(self._bg_array_bw,self._blur_sigma)
+        self._diff_method = diff_method
+
+    @property
+    def blur_sigma(self):
+        return self._blur_sigma
 
     @property
     def color(self):
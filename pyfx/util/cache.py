@@ -0,0 +1,176 @@
+__description__ = \
+"""
+Least-recently-used cache with a memory budget.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-21"
+
+import numpy as np
+
+import collections, threading
+
+class LRUCache:
+    """
+    Thread-safe, least-recently-used cache that holds at most max_bytes
+    worth of values.  When adding a value pushes the cache over budget, the
+    least recently used values are dropped until it fits again.  Values that
+    are larger than the whole budget are not stored.
+
+    The size of a value is taken from its nbytes attribute (numpy arrays)
+    unless num_bytes is given explicitly to put().
+    """
+
+    def __init__(self,max_bytes):
+        """
+        max_bytes: maximum number of bytes to hold in the cache.
+        """
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._num_bytes = 0
+
+        self.max_bytes = max_bytes
+
+        self._hits = 0
+        self._misses = 0
+
+    def get(self,key,default=None):
+        """
+        Return the value stored under key (marking it as recently used), or
+        default if it is not in the cache.
+        """
+
+        with self._lock:
+            try:
+                value, num_bytes = self._entries[key]
+            except KeyError:
+                self._misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+            return value
+
+    def put(self,key,value,num_bytes=None):
+        """
+        Store value under key.
+        """
+
+        if num_bytes is None:
+            num_bytes = _nbytes(value)
+
+        with self._lock:
+
+            if key in self._entries:
+                self._num_bytes -= self._entries.pop(key)[1]
+
+            if num_bytes > self._max_bytes:
+                return
+
+            self._entries[key] = (value,num_bytes)
+            self._num_bytes += num_bytes
+
+            self._evict()
+
+    def pop(self,key,default=None):
+        """
+        Remove key from the cache, returning its value (or default).
+        """
+
+        with self._lock:
+            try:
+                value, num_bytes = self._entries.pop(key)
+            except KeyError:
+                return default
+
+            self._num_bytes -= num_bytes
+
+            return value
+
+    def clear(self):
+        """
+        Empty the cache (counters are kept).
+        """
+
+        with self._lock:
+            self._entries = collections.OrderedDict()
+            self._num_bytes = 0
+
+    def _evict(self):
+        """
+        Drop least recently used entries until we are within budget.  Must be
+        called with the lock held.
+        """
+
+        while self._num_bytes > self._max_bytes:
+            key, (value, num_bytes) = self._entries.popitem(last=False)
+            self._num_bytes -= num_bytes
+
+    def __contains__(self,key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __getstate__(self):
+        """
+        Locks cannot be pickled; the copy gets a fresh one.
+        """
+
+        state = self.__dict__.copy()
+        del state["_lock"]
+
+        return state
+
+    def __setstate__(self,state):
+
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self,max_bytes):
+
+        if max_bytes < 0:
+            err = "max_bytes must be positive\n"
+            raise ValueError(err)
+
+        with self._lock:
+            self._max_bytes = int(max_bytes)
+            self._evict()
+
+    @property
+    def num_bytes(self):
+        """
+        Number of bytes currently held.
+        """
+        return self._num_bytes
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+def _nbytes(value):
+    """
+    Best guess at the number of bytes a value takes up.
+    """
+
+    try:
+        return int(value.nbytes)
+    except AttributeError:
+        pass
+
+    if type(value) in [list,tuple]:
+        return sum([_nbytes(v) for v in value])
+
+    return np.asarray(value).nbytes
@@ -0,0 +1,315 @@
+__description__ = \
+"""
+Vectorized alpha compositing on numpy arrays.
+
+RGBA arrays have straight (not premultiplied) alpha, which is how images are
+passed around the rest of pyfx.  For uint8 arrays, over() gives the same
+result as PIL.Image.alpha_composite (the per-pixel loop is PIL's), but works
+on the arrays directly and only on the part of the frame that top actually
+covers.  Float arrays (values between 0 and 1) are composited in float, so
+workspaces with a float working precision never round to 8 bits along the
+way.
+
+All functions take an optional out array.  out may be one of the inputs, in
+which case the compositing is done in place.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-22"
+
+import numpy as np
+from PIL import Image
+
+def _check_rgba(a,name,dtype=None):
+    """
+    Make sure "a" is an RGBA array (of dtype, if specified).
+    """
+
+    if type(a) is not np.ndarray or len(a.shape) != 3 or a.shape[2] != 4:
+        err = "{} must be an RGBA array\n".format(name)
+        raise ValueError(err)
+
+    if dtype is not None and a.dtype != dtype:
+        err = "{} must have dtype {}\n".format(name,np.dtype(dtype).name)
+        raise ValueError(err)
+
+def _check_out(out,shape,dtype):
+    """
+    Make sure out (if given) can hold the result.  Return an array to write
+    the result into.
+    """
+
+    if out is None:
+        return np.empty(shape,dtype=dtype)
+
+    if type(out) is not np.ndarray or out.shape != shape or out.dtype != dtype:
+        err = "out must be a {} array with shape {}\n".format(np.dtype(dtype).name,
+                                                             shape)
+        raise ValueError(err)
+
+    return out
+
+def _visible_box(alpha):
+    """
+    Return (row slice, column slice) bounding all pixels with alpha > 0, or
+    None if every pixel is transparent.
+    """
+
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(alpha[rows[0]:rows[-1]+1].any(axis=0))
+
+    return slice(rows[0],rows[-1]+1), slice(cols[0],cols[-1]+1)
+
+def _as_image(a):
+    """
+    Wrap a uint8 RGBA array as a PIL.Image without copying it (unless it is
+    not contiguous).
+    """
+
+    a = np.ascontiguousarray(a)
+
+    return Image.frombuffer("RGBA",(a.shape[1],a.shape[0]),a,"raw","RGBA",0,1)
+
+def _over_kernel(bottom,top,out):
+    """
+    Alpha composite uint8 RGBA arrays, writing into out.  The per-pixel work
+    is done by PIL's compositing loop, run directly on the array buffers.
+    """
+
+    composite = Image.alpha_composite(_as_image(bottom),_as_image(top))
+
+    # np.asarray(composite) goes through the array interface, which is about
+    # 3x slower than copying out of tobytes() for a full frame.
+    out[:] = np.frombuffer(composite.tobytes(),dtype=np.uint8).reshape(out.shape)
+
+def _over_float_kernel(bottom,top,out):
+    """
+    Alpha composite float RGBA arrays (values between 0 and 1), writing into
+    out.  Math is done in at least float32.
+    """
+
+    dtype = np.promote_types(bottom.dtype,np.float32)
+
+    top_alpha = top[:,:,3].astype(dtype)
+    bottom_alpha = bottom[:,:,3].astype(dtype)
+
+    # Output alpha: top_alpha + bottom_alpha*(1 - top_alpha)
+    out_alpha = 1 - top_alpha
+    out_alpha *= bottom_alpha
+    out_alpha += top_alpha
+
+    # Fraction of each output color that comes from the top layer.  If the
+    # output alpha is 0, the top alpha is also 0, so the bottom color is kept.
+    coef = np.divide(top_alpha,out_alpha,out=top_alpha,where=out_alpha > 0)
+
+    # bottom + coef*(top - bottom)
+    bottom_rgb = bottom[:,:,:3]
+    rgb = top[:,:,:3].astype(dtype)
+    rgb -= bottom_rgb
+    rgb *= coef[:,:,np.newaxis]
+    rgb += bottom_rgb
+
+    # Nothing is written into out until all reads of bottom and top are done
+    out[:,:,:3] = rgb
+    out[:,:,3] = out_alpha
+
+def over(bottom,top,out=None):
+    """
+    Place RGBA array top over RGBA array bottom (straight alpha).  Both must
+    be uint8 or both must be the same float type.  For uint8, this gives the
+    same result as PIL.Image.alpha_composite.
+
+    Only the region of top containing visible pixels is composited; the rest
+    of the output is a copy of bottom.  Layers that are mostly transparent
+    (sprites, glows, masks) are therefore cheap to composite.
+
+    bottom: uint8 or float RGBA array
+    top: RGBA array with the same shape and dtype as bottom
+    out: RGBA array of the same dtype to write the result into (may be bottom
+         or top).  If None, a new array is created.
+
+    Returns the composited RGBA array.
+    """
+
+    _check_rgba(bottom,"bottom")
+    if bottom.dtype != np.uint8 and not np.issubdtype(bottom.dtype,np.floating):
+        err = "bottom must be a uint8 or float array\n"
+        raise ValueError(err)
+    _check_rgba(top,"top",bottom.dtype)
+    if bottom.shape != top.shape:
+        err = "top and bottom must have the same shape\n"
+        raise ValueError(err)
+    out = _check_out(out,bottom.shape,bottom.dtype)
+
+    kernel = _over_kernel
+    if bottom.dtype != np.uint8:
+        kernel = _over_float_kernel
+
+    box = _visible_box(top[:,:,3])
+
+    # Nothing visible on top
+    if box is None:
+        if out is not bottom:
+            out[:] = bottom
+        return out
+
+    # Copy bottom outside of the visible box.  If top is visible across the
+    # whole frame, the kernel writes every pixel of out and there is nothing
+    # to copy.
+    covers_frame = box[0] == slice(0,bottom.shape[0]) and \
+                   box[1] == slice(0,bottom.shape[1])
+    if out is not bottom and not covers_frame:
+        if out is top:
+            inside = top[box].copy()
+            out[:] = bottom
+            kernel(bottom[box],inside,out[box])
+            return out
+        out[:] = bottom
+
+    kernel(bottom[box],top[box],out[box])
+
+    return out
+
+class Layer:
+    """
+    Transparent RGBA layer the size of a frame that keeps track of which parts
+    of it have been drawn on.  Sprites and other small overlays are written
+    into the layer, then composite() blends only the touched regions onto the
+    base frame.  With a few small sprites on a big frame, almost none of the
+    frame has to be blended.
+
+    Touched regions are tracked on a grid of tile_size x tile_size tiles.
+    Anything that writes into array directly must call mark() with the
+    region it changed.
+    """
+
+    def __init__(self,shape,tile_size=32):
+        """
+        shape: shape of the frame (rows, columns, ...)
+        tile_size: edge length (in pixels) of the tiles used to track regions
+        """
+
+        if tile_size < 1:
+            err = "tile_size must be 1 or more\n"
+            raise ValueError(err)
+
+        self._array = np.zeros((shape[0],shape[1],4),dtype=np.uint8)
+        self._tile_size = int(tile_size)
+
+        num_rows = -(-shape[0]//self._tile_size)
+        num_cols = -(-shape[1]//self._tile_size)
+        self._dirty = np.zeros((num_rows,num_cols),dtype=bool)
+
+    def mark(self,y_min,y_max,x_min,x_max):
+        """
+        Record that array[y_min:y_max,x_min:x_max] has been drawn on.
+        """
+
+        y_min = max(y_min,0)
+        x_min = max(x_min,0)
+        y_max = min(y_max,self._array.shape[0])
+        x_max = min(x_max,self._array.shape[1])
+        if y_max <= y_min or x_max <= x_min:
+            return
+
+        s = self._tile_size
+        self._dirty[y_min//s:(y_max - 1)//s + 1,x_min//s:(x_max - 1)//s + 1] = True
+
+    def regions(self):
+        """
+        List of non-overlapping (row slice, column slice) regions covering
+        everything that has been drawn on.  Each region is a horizontal run of
+        touched tiles.
+        """
+
+        s = self._tile_size
+        out = []
+        for i in np.flatnonzero(self._dirty.any(axis=1)):
+
+            # Find runs of touched tiles in this row of tiles
+            row = np.concatenate(([False],self._dirty[i],[False]))
+            edges = np.flatnonzero(row[1:] != row[:-1])
+
+            rows = slice(i*s,min((i + 1)*s,self._array.shape[0]))
+            for start, stop in zip(edges[::2],edges[1::2]):
+                out.append((rows,slice(start*s,min(stop*s,self._array.shape[1]))))
+
+        return out
+
+    def scale_alpha(self,scalar):
+        """
+        Multiply the alpha channel of every touched region by scalar.
+        """
+
+        if scalar == 1:
+            return
+
+        for region in self.regions():
+            alpha = self._array[region[0],region[1],3]
+            alpha[:] = alpha*scalar
+
+    def composite(self,bottom,out=None):
+        """
+        Place this layer over RGBA array bottom.
+
+        bottom: uint8 or float RGBA array with the same height and width as
+                the layer.  For float arrays, the layer is converted to the
+                same float type before compositing.
+        out: array to write the result into (may be bottom).  If None, a
+             copy of bottom is made.
+
+        Returns the composited array.
+        """
+
+        _check_rgba(bottom,"bottom")
+        if bottom.shape != self._array.shape:
+            err = "bottom must have the same shape as the layer\n"
+            raise ValueError(err)
+
+        if out is None:
+            out = bottom.copy()
+        elif out is not bottom:
+            out = _check_out(out,bottom.shape,bottom.dtype)
+            out[:] = bottom
+
+        for region in self.regions():
+            target = out[region]
+            top = self._array[region]
+            if target.dtype != np.uint8:
+                top = top.astype(target.dtype)
+                top /= 255
+            over(target,top,out=target)
+
+        return out
+
+    def clear(self):
+        """
+        Erase everything drawn on the layer.
+        """
+
+        for region in self.regions():
+            self._array[region] = 0
+        self._dirty[:] = False
+
+    @property
+    def array(self):
+        """
+        uint8 RGBA array holding the layer.
+        """
+        return self._array
+
+    @property
+    def shape(self):
+        return self._array.shape
+
+    @property
+    def dirty_fraction(self):
+        """
+        Fraction of the layer that has been marked as drawn on.
+        """
+
+        num_pixels = sum([(r.stop - r.start)*(c.stop - c.start)
+                          for r, c in self.regions()])
+
+        return num_pixels/(self._array.shape[0]*self._array.shape[1])
@@ -27,7 +27,7 @@ import numpy as np
 from PIL import Image
 from skimage import color
 
-import re
+import re, functools
 
 PIL_PATTERN = re.compile("PIL\.")
 
@@ -36,8 +36,24 @@ INT_TYPES = (np.int,np.intc,np.intp,np.int8,np.int16,np.int32,np.int64,
 
 FLOAT_TYPES = (np.float,np.float16,np.float32,np.float64)
 
+@functools.lru_cache(maxsize=None)
+def _dtype_kind(dtype):
+    """
+    Return "int" or "float" for a numpy data type (or None if it is neither).
+    Looking a type up in INT_TYPES/FLOAT_TYPES is slow enough to matter when
+    to_array is called many times per frame, so the answer is cached.
+    """
+
+    if dtype in INT_TYPES:
+        return "int"
+    if dtype in FLOAT_TYPES:
+        return "float"
+
+    return None
 
-def to_array(img,dtype=np.uint8,num_channels=4,copy=False):
+
+def to_array(img,dtype=np.uint8,num_channels=4,copy=False,trusted=False,
+             out=None):
     """
     Convert a file, array, or PIL image to an array with the specificed
     number of channels and data type.
@@ -48,10 +64,15 @@ def to_array(img,dtype=np.uint8,num_channels=4,copy=False):
     copy: whether or not to require the array to be copied. (If False and the
           array is already in the right format, just send the object back
           without doing anything to it)
+    trusted: the caller promises the values in img are already in bounds
+             (0-1 for floats, 0-255 for integers), so the min/max scans
+             are skipped.  (uint8 arrays are never scanned.)
+    out: array with the output shape and dtype to write the result into. If
+         given, out is returned.
     """
 
     # Make sure output specs are sane
-    if dtype not in FLOAT_TYPES and dtype not in INT_TYPES:
+    if _dtype_kind(dtype) is None:
         err = "dtype must be some form of numpy integer or float.\n"
         raise ValueError(err)
 
@@ -61,44 +82,65 @@ def to_array(img,dtype=np.uint8,num_channels=4,copy=False):
 
     # Read from a file
     if type(img) is str:
-        out = _from_file(img,dtype=dtype,num_channels=num_channels)
+        result = _from_file(img,dtype=dtype,num_channels=num_channels)
 
     # Convert between array types
     elif type(img) is np.ndarray:
 
+        if num_channels == 1:
+            shape = img.shape[:2]
+        else:
+            shape = (img.shape[0],img.shape[1],num_channels)
+        if out is not None:
+            _check_out(out,shape,dtype)
+
         # Don't do a conversion if this is already an ndarray with the correct
         # dimensions and data type
-        if img.dtype == dtype:
-            if num_channels == 1:
-                if len(img.shape) == 2:
-                    if copy: img = np.copy(img)
-                    return img
+        if img.dtype == dtype and img.shape == shape:
+            if out is not None:
+                out[...] = img
+                return out
+            if copy: img = np.copy(img)
+            return img
+
+        # Alpha is dropped going to three channels; do that before converting
+        # the data type so we only convert what we keep
+        if num_channels == 3 and len(img.shape) == 3 and img.shape[2] == 4:
+            img = img[:,:,:3]
+
+        # If the channels already match, convert the data type straight into out
+        if img.shape == shape:
+            return _convert_dtype(img,dtype,trusted=trusted,out=out)
+
+        # Adding an alpha channel: convert the data type straight into the
+        # color channels of the output
+        if num_channels == 4 and len(img.shape) == 3 and img.shape[2] == 3:
+            if out is None:
+                out = np.empty(shape,dtype=dtype)
+            _convert_dtype(img,dtype,trusted=trusted,out=out[:,:,:3])
+            if _dtype_kind(dtype) == "int":
+                out[:,:,3] = 255
             else:
-                if len(img.shape) == 3 and img.shape[2] == num_channels:
-                    if copy: img = np.copy(img)
-                    return img
-
-        # If we get here, we're going to need to convert the array to a
-        # different type.
-        if img.dtype in INT_TYPES:
-            if dtype in FLOAT_TYPES:
-                out = _int_to_float(img,dtype=dtype)
-            else:
-                out = np.array(img,dtype=dtype)
-        else:
-            out = _float_to_int(img,dtype=dtype)
+                out[:,:,3] = 1.0
+            return out
 
-        out = _convert_channels(out,dtype,num_channels)
+        a = _convert_dtype(img,dtype,trusted=trusted)
+        return _convert_channels(a,dtype,num_channels,out=out)
 
     # Try to treat as a PIL Image
     elif PIL_PATTERN.search(str(type(img))):
-        out = _image_to_array(img,dtype=dtype,num_channels=num_channels)
+        result = _image_to_array(img,dtype=dtype,num_channels=num_channels)
 
     else:
         err = "image type not recognized.\n"
         raise ValueError(err)
 
-    return out
+    if out is not None:
+        _check_out(out,result.shape,dtype)
+        out[...] = result
+        return out
+
+    return result
 
 def to_image(img):
     """
@@ -123,12 +165,14 @@ def to_image(img):
         err = "image type not recognized.\n"
         raise ValueError(err)
 
-def to_file(image,image_file):
+def to_file(image,image_file,**kwargs):
     """
     Write an image to a file.
 
     image: numpy.ndarray, or PIL.Image instance.
     image_file: output file
+    kwargs: passed to PIL.Image.save (for example, compress_level for png
+            files)
     """
 
     if type(image) is np.ndarray:
@@ -141,7 +185,7 @@ def to_file(image,image_file):
         err = "image type not recognized.\n"
         raise ValueError(err)
 
-    image.save(image_file)
+    image.save(image_file,**kwargs)
 
 def rc_to_xy(rc,shape):
     """
@@ -188,7 +232,7 @@ def _image_to_array(img,dtype=np.uint8,num_channels=4):
 
     # If non integer type, place on 0-1 scale
     max_possible_value = 255
-    if a.dtype not in INT_TYPES:
+    if _dtype_kind(a.dtype) != "int":
         if a.dtype != np.bool:
             max_possible_value = 1.0
             a = a/255
@@ -197,7 +241,7 @@ def _image_to_array(img,dtype=np.uint8,num_channels=4):
 
     return out
 
-def _convert_channels(a,dtype=np.uint8,num_channels=4):
+def _convert_channels(a,dtype=np.uint8,num_channels=4,out=None):
     """
     Convert an array "a" to whatever num_channels is requested. An RGB array
     going to a single channel is mixed using skimage.color.rgb2gray.  For a
@@ -205,12 +249,14 @@ def _convert_channels(a,dtype=np.uint8,num_channels=4):
     channel to a 3 or 4 channel, the single channel is duplicated across
     the RGB channels.  The maximum value for the array type is assigned to the
     new alpha channel.  Integers are forced to be 0-255.
+
+    If out is given, the result is written into it.
     """
 
     # Figure out what the maximum possible value of an entry is if we have to
     # construct a new channel
     max_possible_value = 255
-    if dtype not in INT_TYPES:
+    if _dtype_kind(dtype) != "int":
         max_possible_value = 1.0
 
     # sanity check
@@ -222,25 +268,31 @@ def _convert_channels(a,dtype=np.uint8,num_channels=4):
         err = "number of channels must be 1, 3, or 4\n"
         raise ValueError(err)
 
-    if num_channels == 1:
-        out = np.zeros((a.shape[0],a.shape[1]),dtype=a.dtype)
+    # Only allocate an output array once we know we need one
+    if out is None:
+        if num_channels == 1:
+            new = lambda: np.empty((a.shape[0],a.shape[1]),dtype=a.dtype)
+        else:
+            new = lambda: np.empty((a.shape[0],a.shape[1],num_channels),
+                                   dtype=a.dtype)
     else:
-        out = np.zeros((a.shape[0],a.shape[1],num_channels),dtype=a.dtype)
+        new = lambda: out
 
     # 1 input channel
     if len(a.shape) == 2:
 
         # ... to 1 output channel (no change --> return same object)
         if num_channels == 1:
-            out = a
+            result = a
 
         # ... to 3 or 4 output channels
         else:
-            out[:,:,0] = a[:,:]
-            out[:,:,1] = a[:,:]
-            out[:,:,2] = a[:,:]
+            result = new()
+            result[:,:,0] = a[:,:]
+            result[:,:,1] = a[:,:]
+            result[:,:,2] = a[:,:]
             if num_channels == 4:
-                out[:,:,3] = max_possible_value
+                result[:,:,3] = max_possible_value
 
     # 1, 2, 3 or 4 input channels (or 1 channel loaded into a 3rd array dimension)
     elif len(a.shape) == 3:
@@ -250,19 +302,20 @@ def _convert_channels(a,dtype=np.uint8,num_channels=4):
 
             # 1 or 2 channels
             if a.shape[2] == 1 or a.shape[2] == 2:
-                out[:,:] = a[:,:,0]
+                result = new()
+                result[:,:] = a[:,:,0]
 
             # 3 or 4 channels
             elif a.shape[2] == 3 or a.shape[2] == 4:
 
                 bw = color.rgb2gray(a)
-                if dtype in INT_TYPES:
-                    out = np.round(bw*255,0)
-                    out[out > 255] = 255
-                    out[out < 0] = 0
-                    out = np.array(out,dtype=dtype)
+                if _dtype_kind(dtype) == "int":
+                    result = np.round(bw*255,0)
+                    result[result > 255] = 255
+                    result[result < 0] = 0
+                    result = np.array(result,dtype=dtype)
                 else:
-                    out = np.array(bw,dtype=dtype)
+                    result = np.array(bw,dtype=dtype)
 
             else:
                 err = "input array must have 1,2,3, or 4 channels.\n"
@@ -273,17 +326,19 @@ def _convert_channels(a,dtype=np.uint8,num_channels=4):
 
             # 1 to 3 or 2 to 3 (drop input alpha channel for 2 to 3)
             if a.shape[2] == 1 or a.shape[2] == 2:
-                out[:,:,0] = a[:,:,0]
-                out[:,:,1] = a[:,:,0]
-                out[:,:,2] = a[:,:,0]
+                result = new()
+                result[:,:,0] = a[:,:,0]
+                result[:,:,1] = a[:,:,0]
+                result[:,:,2] = a[:,:,0]
 
             # 3 to 3
             elif a.shape[2] == 3:
-                out = a
+                result = a
 
             # 4 to 3
             elif a.shape[2] == 4:
-                out[:,:,:3] = a[:,:,:3]
+                result = new()
+                result[:,:,:3] = a[:,:,:3]
             else:
                 err = "matrix must have 1,2,3 or 4 channels\n"
                 raise ValueError(err)
@@ -293,41 +348,76 @@ def _convert_channels(a,dtype=np.uint8,num_channels=4):
 
             # 1 to 4
             if a.shape[2] == 1:
-                out[:,:,0] = a[:,:,0]
-                out[:,:,1] = a[:,:,0]
-                out[:,:,2] = a[:,:,0]
-                out[:,:,3] = max_possible_value
+                result = new()
+                result[:,:,0] = a[:,:,0]
+                result[:,:,1] = a[:,:,0]
+                result[:,:,2] = a[:,:,0]
+                result[:,:,3] = max_possible_value
 
             # 2 to 4  (treat second channel as alpha)
             elif a.shape[2] == 2:
-                out[:,:,0] = a[:,:,0]
-                out[:,:,1] = a[:,:,0]
-                out[:,:,2] = a[:,:,0]
-                out[:,:,3] = a[:,:,1]
+                result = new()
+                result[:,:,0] = a[:,:,0]
+                result[:,:,1] = a[:,:,0]
+                result[:,:,2] = a[:,:,0]
+                result[:,:,3] = a[:,:,1]
 
             # 3 to 4
             elif a.shape[2] == 3:
-                out[:,:,:3] = a[:,:,:3]
-                out[:,:,3] = max_possible_value
+                result = new()
+                result[:,:,:3] = a[:,:,:3]
+                result[:,:,3] = max_possible_value
 
             # 4 to 4
             elif a.shape[2] == 4:
-                out = a
+                result = a
             else:
                 err = "matrix must have 1,2,3 or 4 channels\n"
                 raise ValueError(err)
 
-    return out
+    if out is not None and result is not out:
+        out[...] = result
+        return out
+
+    return result
 
-def _float_to_int(a,dtype=np.uint8,zero_tolerance=1e-6):
+def _check_out(out,shape,dtype):
     """
-    Convert a float array to an integer array.
+    Make sure an out array has the expected shape and data type.
     """
 
-    if dtype not in INT_TYPES:
-        err = "dtype {} is not an integer type\n".format(dtype)
+    if type(out) is not np.ndarray or out.shape != tuple(shape) or \
+       out.dtype != dtype:
+        err = "out must be a {} array with shape {}\n".format(np.dtype(dtype).name,
+                                                             tuple(shape))
         raise ValueError(err)
 
+def _convert_dtype(a,dtype,trusted=False,out=None):
+    """
+    Convert the data type of array "a", keeping the number of channels.
+    """
+
+    if _dtype_kind(a.dtype) == "int":
+        if _dtype_kind(dtype) == "float":
+            return _int_to_float(a,dtype=dtype,trusted=trusted,out=out)
+
+        if out is None:
+            return np.array(a,dtype=dtype)
+        out[...] = a
+        return out
+
+    if _dtype_kind(dtype) == "int":
+        return _float_to_int(a,dtype=dtype,trusted=trusted,out=out)
+
+    return _float_to_float(a,dtype=dtype,trusted=trusted,out=out)
+
+def _check_float_bounds(a,zero_tolerance=1e-6):
+    """
+    Make sure float array "a" has values between 0 and 1, snapping values
+    within zero_tolerance of the bounds onto them.  Returns "a" or a fixed
+    copy.
+    """
+
     # Start with pointer to "a"
     b = a
 
@@ -350,43 +440,85 @@ def _float_to_int(a,dtype=np.uint8,zero_tolerance=1e-6):
             err += "array min: {}, array max: {}\n".format(np.min(b),np.max(b))
             raise ValueError(err)
 
-    out = np.array(np.round(b*255,0),dtype=dtype)
-    out[out > 255] = 255
-    out[out < 0]   = 0
+    return b
+
+def _float_to_int(a,dtype=np.uint8,zero_tolerance=1e-6,trusted=False,out=None):
+    """
+    Convert a float array to an integer array.
+    """
+
+    if _dtype_kind(dtype) != "int":
+        err = "dtype {} is not an integer type\n".format(dtype)
+        raise ValueError(err)
+
+    b = a
+    if not trusted:
+        b = _check_float_bounds(a,zero_tolerance)
+
+    # Values are between 0 and 1, so this is between 0 and 255
+    scaled = b*255
+    if _dtype_kind(scaled.dtype) == "float":
+        np.rint(scaled,out=scaled)
+
+    if out is None:
+        return scaled.astype(dtype)
+
+    np.copyto(out,scaled,casting="unsafe")
 
     return out
 
+def _float_to_float(a,dtype=np.float,zero_tolerance=1e-6,trusted=False,out=None):
+    """
+    Convert a float array to a float array of another precision.
+    """
 
-def _int_to_float(a,dtype=np.float):
+    if _dtype_kind(dtype) != "float":
+        err = "dtype {} is not an float type\n".format(dtype)
+        raise ValueError(err)
+
+    b = a
+    if not trusted:
+        b = _check_float_bounds(a,zero_tolerance)
+
+    if out is None:
+        return np.array(b,dtype=dtype)
+
+    np.copyto(out,b,casting="unsafe")
+
+    return out
+
+def _int_to_float(a,dtype=np.float,trusted=False,out=None):
     """
     Convert an integer array to a float array.
     """
 
-    if dtype not in FLOAT_TYPES:
+    if _dtype_kind(dtype) != "float":
         err = "dtype {} is not an float type\n".format(dtype)
         raise ValueError(err)
 
     # Start with pointer to "a"
     b = a
 
-    # Check min/max bounds
-    if np.min(b) < 0 or np.max(b) > 255:
+    # Check min/max bounds (uint8 cannot be out of bounds)
+    if not trusted and a.dtype != np.uint8:
+        if np.min(b) < 0 or np.max(b) > 255:
 
-        # Truncate values of -1 and 256 --> maybe reached by a rounding
-        # error elsewhere.
-        b = np.copy(a)
-        b[a == -1] = 0
-        b[a == 256] = 255
+            # Truncate values of -1 and 256 --> maybe reached by a rounding
+            # error elsewhere.
+            b = np.copy(a)
+            b[a == -1] = 0
+            b[a == 256] = 255
 
-        # If that still didn't fix it, throw an error
-        if np.min(b) < 0 or np.max(b) > 255:
-            err = "int array must have values between 0 and 255\n"
-            err += "array min: {}, array max: {}\n".format(np.min(b),np.max(b))
-            raise ValueError(err)
+            # If that still didn't fix it, throw an error
+            if np.min(b) < 0 or np.max(b) > 255:
+                err = "int array must have values between 0 and 255\n"
+                err += "array min: {}, array max: {}\n".format(np.min(b),np.max(b))
+                raise ValueError(err)
 
-    out = np.array(b/255,dtype=dtype)
-    out[out < 0] = 0.0
-    out[out > 1] = 1.0
+    # Values are between 0 and 255, so this is between 0 and 1
+    if out is None:
+        out = np.empty(b.shape,dtype=dtype)
+    np.divide(b,255,out=out,dtype=out.dtype)
 
     return out
 
@@ -0,0 +1,115 @@
+__description__ = \
+"""
+Cache of products derived from workspace frames (grayscale versions,
+blurs, differences from the background, thresholded masks...).
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-24"
+
+from .cache import LRUCache
+
+import numpy as np
+
+def _freeze(params):
+    """
+    Turn a dictionary (or other collection) of parameters into something
+    hashable that can be part of a cache key.
+    """
+
+    if isinstance(params,dict):
+        return tuple(sorted([(k,_freeze(v)) for k, v in params.items()]))
+
+    if isinstance(params,(list,tuple)):
+        return tuple([_freeze(v) for v in params])
+
+    if isinstance(params,np.ndarray):
+        return (params.shape,params.tobytes())
+
+    return params
+
+class DerivedCache:
+    """
+    Least-recently-used cache of products derived from frames, keyed by
+    (frame t, product kind, parameters).  Effects and processors working on
+    the same frame ask for a product with get(); the first one to ask
+    calculates it and everyone after that gets the cached copy.
+
+    Cached arrays are read-only.  Copy them before modifying them.
+
+    The cache is not copied when a workspace is sent to a worker process;
+    each process fills its own.
+    """
+
+    def __init__(self,max_bytes=2**28):
+        """
+        max_bytes: memory budget for cached products
+        """
+
+        self._cache = LRUCache(max_bytes)
+
+    def get(self,t,kind,params,calculate):
+        """
+        Return the product kind for frame t, calculating it if it is not in
+        the cache.
+
+        t: frame the product was derived from
+        kind: name of the product (say, "frame_diff")
+        params: dictionary of everything (besides t) that the product depends
+                on
+        calculate: function with no arguments that calculates the product
+        """
+
+        key = (t,kind,_freeze(params))
+
+        value = self._cache.get(key)
+        if value is None:
+            value = calculate()
+            if isinstance(value,np.ndarray):
+                value.flags.writeable = False
+            self._cache.put(key,value)
+
+        return value
+
+    def clear(self):
+        """
+        Drop every cached product (say, after the background changes).
+        """
+
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __getstate__(self):
+        """
+        Copies start out empty.
+        """
+
+        return {"max_bytes":self._cache.max_bytes}
+
+    def __setstate__(self,state):
+
+        self._cache = LRUCache(state["max_bytes"])
+
+    @property
+    def max_bytes(self):
+        return self._cache.max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self,max_bytes):
+        self._cache.max_bytes = max_bytes
+
+    @property
+    def num_bytes(self):
+        """
+        Number of bytes currently held.
+        """
+        return self._cache.num_bytes
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
@@ -0,0 +1,248 @@
+__description__ = \
+"""
+Ways of measuring how much each pixel of a frame differs from the background
+(see Background.frame_diff).  Each method is a class built once from the
+grayscale background; everything that only depends on the background (its
+blur, local means and variances) is calculated then, not for every frame.
+
+    "ssim": 1 - SSIM between the blurred frame and the blurred background
+            at full resolution.  This is the original (and slowest) method.
+    "pyramid": the same calculation on an image shrunk by a factor of 2,
+               interpolated back up to full size.  Frames are blurred before
+               comparing, so very little detail is lost.
+    "absdiff": absolute difference between the blurred frame and the blurred
+               background, on an image shrunk by a factor of 4.  Cheapest.
+               Values are differences in gray level (0 to 1), not
+               dissimilarities, so thresholds tuned for "ssim" may need to
+               be lowered.
+
+A new method can be any class that is built with (bg_array_bw,blur_sigma)
+and has a diff(img_array_bw) method returning a 2D array between 0 and 1.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-24"
+
+import numpy as np
+from scipy import ndimage
+from skimage import filters
+
+# SSIM constants (Wang et al. 2004; the skimage defaults)
+K1 = 0.01
+K2 = 0.03
+WIN_SIZE = 7
+
+# Gray levels of float images used in pyfx run from 0 to 1, but skimage
+# assumes a range of -1 to 1 for floats.  Keep skimage's value so "ssim"
+# matches skimage.measure.compare_ssim.
+DATA_RANGE = 2.0
+
+def _shrink(a,factor):
+    """
+    Shrink a 2D array by an integer factor, averaging factor x factor
+    blocks.  Edges are padded by repeating the last row/column.
+    """
+
+    if factor == 1:
+        return a
+
+    rows = -(-a.shape[0]//factor)*factor
+    cols = -(-a.shape[1]//factor)*factor
+    a = np.pad(a,((0,rows - a.shape[0]),(0,cols - a.shape[1])),mode="edge")
+
+    return a.reshape((rows//factor,factor,cols//factor,factor)).mean(axis=(1,3))
+
+def _interp_indexes(out_size,in_size,factor):
+    """
+    Indexes and weights for linearly interpolating an axis of in_size
+    block means up to out_size pixels.
+    """
+
+    # Block i is centered on pixel i*factor + (factor - 1)/2
+    x = (np.arange(out_size) - (factor - 1)/2)/factor
+    x = np.clip(x,0,in_size - 1)
+
+    lo = np.floor(x).astype(np.int)
+    hi = np.minimum(lo + 1,in_size - 1)
+    w = x - lo
+
+    return lo, hi, w
+
+def _grow(a,shape,factor):
+    """
+    Interpolate an array shrunk by _shrink back up to shape.
+    """
+
+    if factor == 1:
+        return a
+
+    lo, hi, w = _interp_indexes(shape[0],a.shape[0],factor)
+    a = a[lo]*(1 - w[:,np.newaxis]) + a[hi]*w[:,np.newaxis]
+
+    lo, hi, w = _interp_indexes(shape[1],a.shape[1],factor)
+    a = a[:,lo]*(1 - w) + a[:,hi]*w
+
+    return a
+
+class FrameDiff:
+    """
+    Base class for frame difference methods.  Frames are shrunk by
+    downsample, blurred, compared to the (precomputed) blurred background
+    by the subclass's _compare method, and grown back to full size.
+    """
+
+    def __init__(self,bg_array_bw,blur_sigma=10,downsample=1):
+        """
+        bg_array_bw: 2D float array holding the grayscale background
+        blur_sigma: how much to blur frames before comparing them (pixels at
+                    full resolution)
+        downsample: integer factor to shrink frames by before comparing them
+        """
+
+        downsample = int(downsample)
+        if downsample < 1:
+            err = "downsample must be 1 or more\n"
+            raise ValueError(err)
+
+        self._shape = bg_array_bw.shape
+        self._dtype = bg_array_bw.dtype
+        self._blur_sigma = blur_sigma
+        self._downsample = downsample
+
+        # Averaging blocks blurs a little already; take that out of the blur
+        # done at the coarse level.
+        if downsample == 1:
+            self._sigma = blur_sigma
+        else:
+            var = blur_sigma**2 - (downsample**2 - 1)/12
+            self._sigma = np.sqrt(max(var,0))/downsample
+
+        self._prepare(self._blur(bg_array_bw))
+
+    def _blur(self,img_array_bw):
+        """
+        Shrink and blur a grayscale image.
+        """
+
+        img = _shrink(img_array_bw,self._downsample)
+
+        return filters.gaussian(img,sigma=self._sigma)
+
+    def _prepare(self,bg_blur):
+        """
+        Precalculate whatever is needed about the blurred background.
+        """
+
+        self._bg_blur = bg_blur
+
+    def _compare(self,img_blur):
+        """
+        Compare a blurred frame to the background.  Must be defined by the
+        subclass.
+        """
+
+        err = "_compare must be defined in a subclass\n"
+        raise NotImplementedError(err)
+
+    def diff(self,img_array_bw):
+        """
+        Return the difference between grayscale image img_array_bw and the
+        background as a 2D array the size of the frame.
+        """
+
+        if img_array_bw.shape != self._shape:
+            err = "image must have the same shape as the background\n"
+            raise ValueError(err)
+
+        out = self._compare(self._blur(img_array_bw))
+
+        return _grow(out,self._shape,self._downsample)
+
+    @property
+    def downsample(self):
+        return self._downsample
+
+class SSIMDiff(FrameDiff):
+    """
+    1 - SSIM between the blurred frame and blurred background.  With
+    downsample=1, this is identical to
+
+        1 - skimage.measure.compare_ssim(img_blur,bg_blur,full=True)[1]
+
+    but the local mean and variance of the background are only calculated
+    once.
+    """
+
+    def __init__(self,bg_array_bw,blur_sigma=10,downsample=1):
+        """
+        bg_array_bw: 2D float array holding the grayscale background
+        blur_sigma: how much to blur frames before comparing them (pixels at
+                    full resolution)
+        downsample: integer factor to shrink frames by before comparing them.
+                    The SSIM window shrinks with it (to no less than 3
+                    pixels), so it covers about the same part of the frame.
+        """
+
+        self._win_size = max((WIN_SIZE//int(downsample)) | 1,3)
+
+        super().__init__(bg_array_bw,blur_sigma,downsample)
+
+    def _prepare(self,bg_blur):
+
+        bg_blur = bg_blur.astype(np.float64)
+
+        num_points = self._win_size**2
+        self._cov_norm = num_points/(num_points - 1)
+        self._C1 = (K1*DATA_RANGE)**2
+        self._C2 = (K2*DATA_RANGE)**2
+
+        self._bg_blur = bg_blur
+        self._uy = ndimage.uniform_filter(bg_blur,size=self._win_size)
+        uyy = ndimage.uniform_filter(bg_blur*bg_blur,size=self._win_size)
+        self._vy = self._cov_norm*(uyy - self._uy*self._uy)
+
+    def _compare(self,img_blur):
+
+        x = img_blur.astype(np.float64)
+        size = self._win_size
+
+        ux = ndimage.uniform_filter(x,size=size)
+        uxx = ndimage.uniform_filter(x*x,size=size)
+        uxy = ndimage.uniform_filter(x*self._bg_blur,size=size)
+
+        uy = self._uy
+        vx = self._cov_norm*(uxx - ux*ux)
+        vxy = self._cov_norm*(uxy - ux*uy)
+
+        A1 = 2*ux*uy + self._C1
+        A2 = 2*vxy + self._C2
+        B1 = ux**2 + uy**2 + self._C1
+        B2 = vx + self._vy + self._C2
+
+        return 1 - (A1*A2)/(B1*B2)
+
+class PyramidSSIMDiff(SSIMDiff):
+    """
+    SSIMDiff calculated on a frame shrunk by a factor of 2 (by default).
+    """
+
+    def __init__(self,bg_array_bw,blur_sigma=10,downsample=2):
+
+        super().__init__(bg_array_bw,blur_sigma,downsample)
+
+class AbsDiff(FrameDiff):
+    """
+    Absolute difference between the blurred frame and blurred background,
+    calculated on a frame shrunk by a factor of 4 (by default).
+    """
+
+    def __init__(self,bg_array_bw,blur_sigma=10,downsample=4):
+
+        super().__init__(bg_array_bw,blur_sigma,downsample)
+
+    def _compare(self,img_blur):
+
+        return np.abs(img_blur - self._bg_blur)
+
+METHODS = {"ssim":SSIMDiff,
+           "pyramid":PyramidSSIMDiff,
+           "absdiff":AbsDiff}
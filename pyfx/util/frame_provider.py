@@ -0,0 +1,170 @@
+__description__ = \
+"""
+Decode frames ahead of time and cache them.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-21"
+
+import pyfx
+from .cache import LRUCache
+
+import numpy as np
+
+from concurrent import futures
+import os, threading
+
+class FrameProvider:
+    """
+    Serve decoded frames (4-channel, uint8 arrays) from a frame source, such
+    as a list of image files or a VideoReader.
+
+    Every time frame t is requested, frames t+1 ... t+read_ahead are decoded
+    by a pool of background threads, so a sequential render rarely waits on
+    decoding.  Decoded frames are held in a least-recently-used cache of at
+    most max_bytes, so requesting the same frame again (say, once by the
+    workspace and once by an effect) does not decode it again.
+
+    get() returns the cached frame itself, marked read-only.  Copy it before
+    modifying it.
+    """
+
+    def __init__(self,frames,read_ahead=4,num_threads=2,max_bytes=2**30):
+        """
+        frames: list-like frame source.  Each entry must be readable by
+                pyfx.util.to_array.  Sources other than lists and tuples (for
+                example, a VideoReader) are read by a single thread, in order.
+        read_ahead: number of frames to decode ahead of the last frame
+                    requested.  If 0, do not decode ahead.
+        num_threads: number of threads decoding frames
+        max_bytes: memory budget for the decoded frame cache
+        """
+
+        if read_ahead < 0:
+            err = "read_ahead must be 0 or more\n"
+            raise ValueError(err)
+
+        if num_threads < 1:
+            err = "num_threads must be 1 or more\n"
+            raise ValueError(err)
+
+        self._frames = frames
+        self._read_ahead = int(read_ahead)
+
+        # Only lists of files can be decoded in parallel safely
+        if type(frames) in [list,tuple]:
+            self._num_threads = int(num_threads)
+        else:
+            self._num_threads = 1
+
+        self._cache = LRUCache(max_bytes)
+
+        self._start_pool()
+
+    def _start_pool(self):
+        """
+        Start the decoding thread pool.
+        """
+
+        self._pid = os.getpid()
+        self._executor = futures.ThreadPoolExecutor(max_workers=self._num_threads)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _decode(self,t):
+        """
+        Decode frame t and cache it (run by a pool thread).
+        """
+
+        try:
+            frame = pyfx.util.to_array(self._frames[t],dtype=np.uint8,
+                                       num_channels=4)
+            frame.flags.writeable = False
+            self._cache.put(t,frame)
+        finally:
+            with self._lock:
+                self._in_flight.pop(t,None)
+
+        return frame
+
+    def _submit(self,t):
+        """
+        Return a future for frame t, starting a decode if one is not already
+        running.
+        """
+
+        with self._lock:
+            try:
+                return self._in_flight[t]
+            except KeyError:
+                future = self._executor.submit(self._decode,t)
+                self._in_flight[t] = future
+
+                return future
+
+    def get(self,t):
+        """
+        Get frame t as a read-only 4-channel, uint8 array.
+        """
+
+        num_frames = len(self._frames)
+        if t < 0:
+            t = num_frames + t
+        if t < 0 or t >= num_frames:
+            err = "frame {} is outside of the frame source\n".format(t)
+            raise IndexError(err)
+
+        # A forked child cannot use the parent's threads
+        if self._pid != os.getpid():
+            self._start_pool()
+
+        frame = self._cache.get(t)
+        if frame is None:
+            frame = self._submit(t).result()
+
+        # Queue up the next frames
+        for i in range(t + 1,min(t + 1 + self._read_ahead,num_frames)):
+            if i not in self._cache:
+                self._submit(i)
+
+        return frame
+
+    def clear(self):
+        """
+        Drop all cached frames.
+        """
+
+        self._cache.clear()
+
+    def close(self):
+        """
+        Shut down the decoding threads.
+        """
+
+        if self._pid == os.getpid():
+            self._executor.shutdown(wait=True)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getstate__(self):
+        """
+        Threads cannot be pickled; the copy starts its own pool.
+        """
+
+        state = self.__dict__.copy()
+        for k in ["_executor","_in_flight","_lock"]:
+            del state[k]
+
+        return state
+
+    def __setstate__(self,state):
+
+        self.__dict__.update(state)
+        self._start_pool()
+
+    @property
+    def cache(self):
+        """
+        LRUCache holding decoded frames.
+        """
+        return self._cache
@@ -0,0 +1,144 @@
+__description__ = \
+"""
+Store decoded frames on disk as a memory-mapped array.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-22"
+
+import pyfx
+
+import numpy as np
+
+import os, json, shutil, glob
+
+class FrameStore:
+    """
+    Decoded frames, stored once as a single uint8 [frame,height,width,RGBA]
+    .npy file and memory-mapped back in.  After the first decode, reading
+    a frame is just a page-cache lookup.
+
+    The store is tagged with a signature of the source it was built from
+    (file names, sizes and modification times).  If the source changes, the
+    store is rebuilt the next time it is opened.
+
+    get(t) returns read-only views into the memory map.
+    """
+
+    def __init__(self,store_dir,src,frames):
+        """
+        store_dir: directory holding the store
+        src: source the frames came from (string or list of files), used to
+             decide whether an existing store is still valid
+        frames: list-like frame source (used to build the store, if needed)
+        """
+
+        self._store_dir = store_dir
+        self._array_file = os.path.join(store_dir,"frames.npy")
+        self._json_file = os.path.join(store_dir,"signature.json")
+
+        signature = src_signature(src)
+
+        if not self._is_valid(signature):
+            self._build(frames,signature)
+
+        self._array = np.load(self._array_file,mmap_mode="r")
+
+    def _is_valid(self,signature):
+        """
+        Whether an up-to-date store already exists.
+        """
+
+        if not os.path.isfile(self._json_file) or \
+           not os.path.isfile(self._array_file):
+            return False
+
+        f = open(self._json_file,"r")
+        stored = json.load(f)
+        f.close()
+
+        return stored == signature
+
+    def _build(self,frames,signature):
+        """
+        Decode every frame into the store.  The signature is written last, so
+        an interrupted build is never mistaken for a complete store.
+        """
+
+        if os.path.isdir(self._store_dir):
+            shutil.rmtree(self._store_dir)
+        os.mkdir(self._store_dir)
+
+        print("building frame store (only happens once per source)")
+
+        provider = pyfx.util.FrameProvider(frames,read_ahead=8)
+        first = provider.get(0)
+
+        shape = (len(frames),first.shape[0],first.shape[1],4)
+        out = np.lib.format.open_memmap(self._array_file,mode="w+",
+                                        dtype=np.uint8,shape=shape)
+        out[0] = first
+        for t in range(1,len(frames)):
+            out[t] = provider.get(t)
+        out.flush()
+        del out
+
+        provider.close()
+
+        f = open(self._json_file,"w")
+        json.dump(signature,f)
+        f.close()
+
+    def get(self,t):
+        """
+        Get frame t as a read-only 4-channel, uint8 array (a view into the
+        memory map).
+        """
+
+        return self._array[t].view(np.ndarray)
+
+    def __getitem__(self,t):
+        return self.get(t)
+
+    def __len__(self):
+        return self._array.shape[0]
+
+    def __getstate__(self):
+        """
+        Pickle the location of the store, not the frames.
+        """
+
+        state = self.__dict__.copy()
+        del state["_array"]
+
+        return state
+
+    def __setstate__(self,state):
+
+        self.__dict__.update(state)
+        self._array = np.load(self._array_file,mmap_mode="r")
+
+    @property
+    def shape(self):
+        return self._array.shape
+
+def src_signature(src):
+    """
+    Describe a frame source (video file, directory of png files, or list of
+    image files) by its file names, sizes and modification times.
+    """
+
+    if type(src) is str:
+        if os.path.isdir(src):
+            files = glob.glob(os.path.join(src,"*.png"))
+            files.sort()
+        else:
+            files = [src]
+    else:
+        files = list(src)
+
+    out = []
+    for f in files:
+        stat = os.stat(f)
+        out.append([os.path.abspath(f),stat.st_size,stat.st_mtime])
+
+    return out
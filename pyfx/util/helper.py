@@ -11,34 +11,39 @@ import numpy as np
 
 import sys, shutil, random, string, os, warnings, re
 
-def alpha_composite(bottom,top,return_as_pil=False):
+def alpha_composite(bottom,top,return_as_pil=False,out=None):
     """
     Place image "top" over image "bottom" using alpha compositing.  If
     return_as_pil, return as a PIL.Image instance.  Otherwise, return a
-    0-255, 4-channel array.
+    0-255, 4-channel array.  If bottom is a float array, the compositing is
+    done (and returned) in that float type instead.
+
+    out: 4-channel array to write the result into.  This can be bottom or
+         top (if they are already 4-channel arrays of the output type) to do
+         the compositing in place.  If None, a new array is created.
     """
 
-    bottom_img = pyfx.util.to_image(bottom)
-    top_img = pyfx.util.to_image(top)
+    dtype = np.uint8
+    if type(bottom) is np.ndarray and np.issubdtype(bottom.dtype,np.floating):
+        dtype = bottom.dtype
 
-    # Sanity checks
-    if top_img.mode != 'RGBA' or bottom_img.mode != 'RGBA':
-        err = "top and bottom must have alpha channels for compositing\n"
-        raise ValueError(err)
+    bottom = pyfx.util.to_array(bottom,dtype=dtype,num_channels=4)
+    top = pyfx.util.to_array(top,dtype=dtype,num_channels=4)
 
-    if top_img.size != bottom_img.size:
+    # Sanity checks
+    if top.shape != bottom.shape:
         err = "top and bottom must have the same shape\n"
         raise ValueError(err)
 
     # Do compositing
-    composite = Image.alpha_composite(bottom_img,top_img)
+    composite = pyfx.util.composite.over(bottom,top,out=out)
 
     # Return as an Image instance
     if return_as_pil:
-        return composite
+        return pyfx.util.to_image(composite)
 
     # Return as array
-    return pyfx.util.to_array(composite,dtype=np.uint8,num_channels=4)
+    return composite
 
 
 def foreground_mask(workspace,time_interval=(0,-1),threshold=0.1):
@@ -56,8 +61,7 @@ def foreground_mask(workspace,time_interval=(0,-1),threshold=0.1):
     out_array = np.zeros((ws.shape[0],ws.shape[1]),dtype=np.float)
     for i, t in enumerate(ws.times[time_interval[0]:time_interval[-1]]):
         print(i,'/',num_to_check); sys.stdout.flush()
-        frame = ws.get_frame(t)
-        frame_diff = ws.background.frame_diff(frame)
+        frame_diff = ws.frame_diff(t)
 
         out_array = out_array + frame_diff
 
@@ -224,10 +228,18 @@ def channel_stretch(img,cutoff=0.005):
 def adjust_white_balance(img,white_point=(255,255,255)):
     """
     Given an RGB value that is defined as actual white (on 0-255 scale),
-    transform pixels in image to adjust white balance.
+    transform pixels in image to adjust white balance.  Float arrays (0-1)
+    come back as the same float type; everything else as a 0-255 array.
     """
 
-    img = pyfx.util.to_array(img,num_channels=3)
+    if type(img) is np.ndarray and np.issubdtype(img.dtype,np.floating):
+        dtype = img.dtype
+        max_value = 1.0
+    else:
+        dtype = np.uint8
+        max_value = 255
+
+    img = pyfx.util.to_array(img,num_channels=3,dtype=dtype)
 
     try:
         if len(white_point) != 3:
@@ -239,12 +251,19 @@ def adjust_white_balance(img,white_point=(255,255,255)):
     white_point = np.array(white_point,dtype=np.float)
     transform_matrix = (255/white_point)*np.eye((3))
 
+    # Do float images in their own precision (at least float32)
+    if dtype != np.uint8:
+        transform_matrix = transform_matrix.astype(np.promote_types(dtype,np.float32))
+
     new_img = np.dot(img,transform_matrix)
     new_img[np.isnan(new_img)] = 0
-    new_img[new_img > 255] = 255
+    new_img[new_img > max_value] = max_value
     new_img[new_img < 0] = 0
 
-    return np.array(np.round(new_img),dtype=np.uint8)
+    if dtype == np.uint8:
+        new_img = np.round(new_img)
+
+    return np.array(new_img,dtype=dtype)
 
 def smooth(x,window_len=0):
     """
@@ -351,7 +370,8 @@ def position_by_string(shape,position_string="",return_xy=False):
 def harmonic_langenvin(num_steps,
                        spring_constant=1.0,
                        force_sd=1.0,
-                       max_value=None):
+                       max_value=None,
+                       rng=None):
     """
     Build a shaking trajectory.  This makes the a particle wander randomly
     over a harmonic potential centered at 0.  This can be used to simulate
@@ -370,6 +390,8 @@ def harmonic_langenvin(num_steps,
     force_sd: how hard does the particle get jostled each step (sqrt(temperature))
     max_value: how far to let the particle get away from zero.  if None, bound
                at 3 x force_sd.
+    rng: np.random.Generator used for the random forces.  If None, use the
+         global np.random state.
     """
 
     try:
@@ -417,6 +439,7 @@ def harmonic_langenvin(num_steps,
     p = pyfx.physics.Particle()
     harmonic = pyfx.physics.potentials.Spring1D(spring_constant=spring_constant[0])
     langevin = pyfx.physics.potentials.Random(force_sd=force_sd[0])
+    langevin.rng = rng
 
     # Let it wander around the potential surface
     x = []
@@ -0,0 +1,180 @@
+__description__ = \
+"""
+Write frames out as png files in the background.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-21"
+
+import pyfx
+
+from concurrent import futures
+import os, threading, time
+
+class PNGWriter:
+    """
+    Write a sequence of frames to png files using a pool of threads, so png
+    encoding and disk writes overlap with whatever is producing the frames.
+
+    At most queue_size frames are waiting to be (or being) written at any
+    time.  If that many are already queued, write() blocks until one
+    finishes.  How often, and how long, write() had to wait is recorded in
+    stats; lots of waiting means frames are produced faster than they can be
+    written.
+
+    Frames should not be modified after they are passed to write().  Call
+    close() (or use as a context manager) to wait for all frames to be
+    written.
+    """
+
+    def __init__(self,
+                 out_dir,
+                 num_threads=2,
+                 queue_size=8,
+                 compress_level=6,
+                 fmt="frame{:08d}.png"):
+        """
+        out_dir: directory to write frames into (must exist)
+        num_threads: number of threads encoding and writing frames
+        queue_size: maximum number of frames waiting to be written
+        compress_level: png compression (0, fastest, to 9, smallest)
+        fmt: format string used to build the file name from the frame time
+        """
+
+        if not os.path.isdir(out_dir):
+            err = "output directory {} does not exist\n".format(out_dir)
+            raise FileNotFoundError(err)
+
+        if num_threads < 1:
+            err = "num_threads must be 1 or more\n"
+            raise ValueError(err)
+
+        if queue_size < 1:
+            err = "queue_size must be 1 or more\n"
+            raise ValueError(err)
+
+        if compress_level < 0 or compress_level > 9:
+            err = "compress_level must be between 0 and 9\n"
+            raise ValueError(err)
+
+        self._out_dir = out_dir
+        self._compress_level = int(compress_level)
+        self._fmt = fmt
+
+        self._executor = futures.ThreadPoolExecutor(max_workers=num_threads)
+        self._slots = threading.Semaphore(queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._error = None
+        self._closed = False
+
+        self._num_written = 0
+        self._num_blocked = 0
+        self._time_blocked = 0.0
+
+    def _write(self,img,out_file):
+        """
+        Encode and write a single frame (run by a pool thread).
+        """
+
+        try:
+            pyfx.util.to_file(img,out_file,compress_level=self._compress_level)
+        finally:
+            self._slots.release()
+
+    def _done(self,future):
+        """
+        Record the outcome of a finished write.
+        """
+
+        with self._lock:
+            self._pending.discard(future)
+            if future.exception() is not None:
+                if self._error is None:
+                    self._error = future.exception()
+            else:
+                self._num_written += 1
+
+    def _check_error(self):
+
+        if self._error is not None:
+            err = "writing frames to {} failed ({})\n".format(self._out_dir,
+                                                            self._error)
+            raise RuntimeError(err)
+
+    def write(self,img,t):
+        """
+        Queue img (array or PIL.Image) to be written as the frame for time t.
+        """
+
+        if self._closed:
+            err = "cannot write to a closed PNGWriter\n"
+            raise ValueError(err)
+
+        self._check_error()
+
+        # Wait for a free slot, recording any backpressure
+        if not self._slots.acquire(blocking=False):
+            start = time.perf_counter()
+            self._slots.acquire()
+            self._num_blocked += 1
+            self._time_blocked += time.perf_counter() - start
+
+        out_file = os.path.join(self._out_dir,self._fmt.format(t))
+        try:
+            future = self._executor.submit(self._write,img,out_file)
+        except:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def flush(self):
+        """
+        Wait until every queued frame has been written.
+        """
+
+        with self._lock:
+            pending = list(self._pending)
+        futures.wait(pending)
+
+        self._check_error()
+
+    def close(self):
+        """
+        Write out all queued frames and shut down the thread pool.
+        """
+
+        if self._closed:
+            return
+        self._closed = True
+
+        self._executor.shutdown(wait=True)
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+
+        # Always let queued frames finish, but do not mask an exception raised
+        # in the with block with a write error.
+        if exc_type is None:
+            self.close()
+        else:
+            self._closed = True
+            self._executor.shutdown(wait=True)
+
+    @property
+    def stats(self):
+        """
+        Dictionary of writer statistics:
+            num_written: frames written to disk
+            num_blocked: number of write() calls that had to wait for a slot
+            time_blocked: total time (s) spent waiting in write()
+        """
+
+        return {"num_written":self._num_written,
+                "num_blocked":self._num_blocked,
+                "time_blocked":self._time_blocked}
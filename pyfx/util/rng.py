@@ -0,0 +1,115 @@
+__description__ = \
+"""
+Reproducible random number streams.
+
+Every random draw in pyfx can come from an np.random.Generator rather than
+the global np.random state.  A RandomStreams instance turns one seed into
+any number of independent generators, each named by a key such as
+("GlowingParticles.0",t).  The generator for a key does not depend on what
+other generators have been made or how much they have been used, so a
+worker rendering frame t gets the same random numbers for that frame as a
+serial render does.
+
+Objects that take an rng argument treat None as "use the global np.random
+state", which keeps older scripts that call np.random.seed working.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-23"
+
+import numpy as np
+
+import zlib
+
+def _key_to_int(k):
+    """
+    Convert one element of a stream key (string or non-negative integer) to
+    an integer that is the same in every process.
+    """
+
+    if isinstance(k,str):
+        return zlib.crc32(k.encode("utf-8"))
+
+    try:
+        k = int(k)
+    except (TypeError,ValueError):
+        err = "stream key elements must be strings or non-negative integers\n"
+        raise ValueError(err)
+
+    if k < 0:
+        err = "stream key elements must be strings or non-negative integers\n"
+        raise ValueError(err)
+
+    return k
+
+class RandomStreams:
+    """
+    Factory for independent, reproducible np.random.Generator streams derived
+    from a single seed.
+
+    Streams are counter based: the generator for a key is built from the
+    seed and the key alone (np.random.SeedSequence spawn keys feeding a
+    Philox bit generator), never by drawing from another stream.
+    """
+
+    def __init__(self,seed=None):
+        """
+        seed: non-negative integer seed.  If None, draw a fresh seed from the
+              operating system (readable afterward as the seed property so
+              the run can be repeated).
+        """
+
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+
+        try:
+            seed = int(seed)
+            if seed < 0:
+                raise ValueError
+        except (TypeError,ValueError):
+            err = "seed must be a non-negative integer\n"
+            raise ValueError(err)
+
+        self._seed = seed
+
+    def generator(self,*key):
+        """
+        Return a new np.random.Generator for key.  Calling this twice with the
+        same key gives two generators that produce identical numbers.
+
+        key: strings and/or non-negative integers naming the stream (say, an
+             effect name and a frame number).
+        """
+
+        spawn_key = tuple([_key_to_int(k) for k in key])
+        seed_seq = np.random.SeedSequence(self._seed,spawn_key=spawn_key)
+
+        return np.random.Generator(np.random.Philox(seed_seq))
+
+    @property
+    def seed(self):
+        return self._seed
+
+def get_rng(rng=None):
+    """
+    Return something to draw random numbers from: rng itself, or the global
+    np.random state if rng is None.  The result supports the draws that
+    np.random and np.random.Generator share (random, normal, pareto, choice).
+    Use integers() for random integers.
+    """
+
+    if rng is None:
+        return np.random
+
+    return rng
+
+def integers(rng,low,high,size=None):
+    """
+    Random integers from low (inclusive) to high (exclusive), drawn from rng
+    (an np.random.Generator) or from the global np.random state if rng is
+    None.
+    """
+
+    if rng is None:
+        return np.random.randint(low,high,size)
+
+    return rng.integers(low,high,size)
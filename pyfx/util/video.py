@@ -4,6 +4,8 @@ import numpy as np
 
 import ffmpeg
 
+import os, threading, queue, collections
+
 def video_dimensions(filename):
     """
     Get dimensions of frames in a video file.
@@ -41,43 +43,458 @@ def video_to_array(filename):
 
     return video
 
-def to_video(img_set,output_file):
-
-    pass
-
-"""
-process1 = (
-    ffmpeg
-    .input(in_filename)
-    .output('pipe:', format='rawvideo', pix_fmt='rgb24')
-    .run_async(pipe_stdout=True)
-)
-
-process2 = (
-    ffmpeg
-    .input('pipe:', format='rawvideo', pix_fmt='rgb24', s='{}x{}'.format(width, height))
-    .output(out_filename, pix_fmt='yuv420p')
-    .overwrite_output()
-    .run_async(pipe_stdin=True)
-)
-
-while True:
-    in_bytes = process1.stdout.read(width * height * 3)
-    if not in_bytes:
-        break
-    in_frame = (
-        np
-        .frombuffer(in_bytes, np.uint8)
-        .reshape([height, width, 3])
-    )
-    out_frame = in_frame * 0.3
-    process2.stdin.write(
-        frame
-        .astype(np.uint8)
-        .tobytes()
-    )
+def video_frame_info(filename):
+    """
+    Get the number of frames and the frame rate of the video stream in a
+    video file.  If the container does not record the number of frames, count
+    them (this requires ffprobe to read through the file, but not decode it).
+    """
+
+    probe = ffmpeg.probe(filename,select_streams="v:0")
+    video_stream = probe["streams"][0]
+
+    num, den = video_stream["r_frame_rate"].split("/")
+    frame_rate = float(num)/float(den)
+
+    try:
+        num_frames = int(video_stream["nb_frames"])
+    except (KeyError,ValueError):
+        probe = ffmpeg.probe(filename,select_streams="v:0",count_packets=None)
+        num_frames = int(probe["streams"][0]["nb_read_packets"])
+
+    return num_frames, frame_rate
+
+class VideoReader:
+    """
+    Lazy, list-like access to the frames of a video file.  Frames are decoded
+    on demand by an ffmpeg process writing raw rgb24 frames to a pipe, so only
+    a handful of frames are ever held in memory.
+
+    A background thread keeps up to buffer_size decoded frames queued ahead
+    of the last frame requested.  Sequential access (reader[0], reader[1],
+    ...) therefore streams straight out of the pipe.  Requesting a frame
+    before the current position, or far ahead of it, restarts the decoder
+    with a seek to that frame.  The most recent num_recent frames are kept,
+    so asking for the same frame repeatedly does not decode it again.
+
+    Frames are returned as read-only [height,width,3] uint8 arrays.
+    """
+
+    def __init__(self,filename,buffer_size=16,num_recent=4):
+        """
+        filename: video file
+        buffer_size: maximum number of frames to decode ahead of the frame
+                     last requested.
+        num_recent: number of recently returned frames to keep in memory.
+        """
+
+        if not os.path.isfile(filename):
+            err = "video file {} not found\n".format(filename)
+            raise FileNotFoundError(err)
+
+        if buffer_size < 1:
+            err = "buffer_size must be 1 or more\n"
+            raise ValueError(err)
+
+        if num_recent < 1:
+            err = "num_recent must be 1 or more\n"
+            raise ValueError(err)
+
+        self._filename = filename
+        self._buffer_size = int(buffer_size)
+        self._num_recent = int(num_recent)
+
+        self._width, self._height = video_dimensions(filename)
+        self._num_frames, self._frame_rate = video_frame_info(filename)
+        self._frame_bytes = self._width*self._height*3
+
+        self._reset()
+
+    def _reset(self):
+        """
+        Forget about any running decoder (without touching it).
+        """
+
+        self._pid = os.getpid()
+        self._process = None
+        self._thread = None
+        self._stop = None
+        self._queue = None
+        self._next_t = 0
+        self._recent = collections.OrderedDict()
+
+    def _start(self,t):
+        """
+        Start decoding from frame t.
+        """
+
+        self.close()
+
+        stream = ffmpeg.input(self._filename,ss=t/self._frame_rate)
+        stream = stream.output("pipe:",format="rawvideo",pix_fmt="rgb24")
+        stream = stream.global_args("-loglevel","error")
+        self._process = stream.run_async(pipe_stdout=True)
+
+        self._stop = threading.Event()
+        self._queue = queue.Queue(maxsize=self._buffer_size)
+        self._thread = threading.Thread(target=self._fill,
+                                        args=(self._process,self._queue,
+                                              self._stop),
+                                        daemon=True)
+        self._thread.start()
+
+        self._next_t = t
+
+    def _fill(self,process,frame_queue,stop):
+        """
+        Read frames from the decoder pipe into frame_queue (run by the
+        background thread).  A None on the queue means the stream ended.
+        """
+
+        shape = (self._height,self._width,3)
+        while not stop.is_set():
+
+            in_bytes = process.stdout.read(self._frame_bytes)
+            if len(in_bytes) < self._frame_bytes:
+                frame = None
+            else:
+                frame = np.frombuffer(in_bytes,np.uint8).reshape(shape)
+
+            # Block while the look-ahead buffer is full, but keep an eye on
+            # the stop signal
+            while not stop.is_set():
+                try:
+                    frame_queue.put(frame,timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+            if frame is None:
+                break
+
+    def close(self):
+        """
+        Stop the decoder, if running.
+        """
+
+        # We were copied into another process (e.g. a forked render worker).
+        # The decoder belongs to the parent, so start over.
+        if self._pid != os.getpid():
+            recent = self._recent
+            self._reset()
+            self._recent = recent
+            return
+
+        if self._process is None:
+            return
+
+        self._stop.set()
+        self._process.kill()
+        self._thread.join()
+        self._process.stdout.close()
+        self._process.wait()
+
+        self._process = None
+        self._thread = None
+        self._stop = None
+        self._queue = None
+
+    def __getitem__(self,t):
+
+        if t < 0:
+            t = self._num_frames + t
+        if t < 0 or t >= self._num_frames:
+            err = "frame {} is outside of video\n".format(t)
+            raise IndexError(err)
+
+        # Recently decoded frame
+        try:
+            frame = self._recent[t]
+            self._recent.move_to_end(t)
+            return frame
+        except KeyError:
+            pass
+
+        if self._pid != os.getpid():
+            self.close()
+
+        # Seek if the decoder will not reach this frame soon
+        if self._process is None or t < self._next_t or \
+           t - self._next_t > self._buffer_size:
+            self._start(t)
+
+        # Read forward to the frame
+        while self._next_t <= t:
+
+            frame = self._queue.get()
+            if frame is None:
+                self.close()
+                err = "could not decode frame {} from {}\n".format(t,self._filename)
+                raise IndexError(err)
+
+            self._recent[self._next_t] = frame
+            if len(self._recent) > self._num_recent:
+                self._recent.popitem(last=False)
+
+            self._next_t += 1
+
+        return self._recent[t]
+
+    def __len__(self):
+        return self._num_frames
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __getstate__(self):
+        """
+        Decoder processes and threads cannot be pickled; the copy starts its
+        own decoder when first used.
+        """
+
+        state = self.__dict__.copy()
+        for k in ["_process","_thread","_stop","_queue"]:
+            state[k] = None
+        state["_recent"] = collections.OrderedDict()
+        state["_next_t"] = 0
+
+        return state
+
+    def __setstate__(self,state):
+
+        self.__dict__.update(state)
+        self._pid = os.getpid()
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def shape(self):
+        """
+        Height and width of frames.
+        """
+        return (self._height,self._width)
+
+    @property
+    def frame_rate(self):
+        return self._frame_rate
+
+class VideoWriter:
+    """
+    Encode frames into a video file by piping raw frames into an ffmpeg
+    encoder process.
+
+    write() places frames on a bounded queue and returns immediately; a
+    background thread feeds the queue to ffmpeg.  Encoding therefore
+    overlaps with whatever is producing the frames.  If the encoder falls
+    queue_size frames behind, write() blocks until it catches up.  Frames
+    should not be modified after they are passed to write().
+
+    Call close() (or use as a context manager) to flush the queue and finish
+    the file.
+    """
+
+    def __init__(self,
+                 output_file,
+                 shape,
+                 frame_rate=30,
+                 codec="libx264",
+                 crf=18,
+                 pix_fmt="yuv420p",
+                 input_pix_fmt="rgb24",
+                 queue_size=8,
+                 overwrite=False):
+        """
+        output_file: video file to write
+        shape: (height,width) of frames
+        frame_rate: frames per second
+        codec: ffmpeg video codec (libx264, libx265, ffv1, ...)
+        crf: constant rate factor (quality) for the codec.  If None, do not
+             pass a crf to ffmpeg.
+        pix_fmt: pixel format of the encoded video
+        input_pix_fmt: raw format frames are sent to ffmpeg in.  rgb24 or rgba.
+        queue_size: maximum number of frames waiting to be encoded
+        overwrite: whether or not to overwrite an existing output_file
+        """
+
+        if os.path.exists(output_file) and not overwrite:
+            err = "output file {} exists\n".format(output_file)
+            raise FileExistsError(err)
+
+        if input_pix_fmt == "rgb24":
+            self._num_channels = 3
+        elif input_pix_fmt == "rgba":
+            self._num_channels = 4
+        else:
+            err = "input_pix_fmt must be rgb24 or rgba\n"
+            raise ValueError(err)
+
+        if queue_size < 1:
+            err = "queue_size must be 1 or more\n"
+            raise ValueError(err)
+
+        self._output_file = output_file
+        self._shape = (int(shape[0]),int(shape[1]))
+
+        output_kwargs = {"vcodec":codec,"pix_fmt":pix_fmt}
+        if crf is not None:
+            output_kwargs["crf"] = crf
+
+        size = "{}x{}".format(self._shape[1],self._shape[0])
+        stream = ffmpeg.input("pipe:",format="rawvideo",pix_fmt=input_pix_fmt,
+                              s=size,framerate=frame_rate)
+        stream = stream.output(output_file,**output_kwargs)
+        stream = stream.overwrite_output().global_args("-loglevel","error")
+        self._process = stream.run_async(pipe_stdin=True)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._num_written = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._feed,daemon=True)
+        self._thread.start()
+
+    def _feed(self):
+        """
+        Send queued frames to the encoder (run by the background thread).  A
+        None on the queue means no more frames are coming.
+        """
+
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+
+            # Keep draining the queue after an error so write() never blocks
+            if self._error is not None:
+                continue
+
+            try:
+                self._process.stdin.write(frame.data)
+            except Exception as e:
+                self._error = e
+
+    def _check_error(self):
+
+        if self._error is not None:
+            err = "encoding {} failed ({})\n".format(self._output_file,
+                                                    self._error)
+            raise RuntimeError(err)
+
+    def write(self,img):
+        """
+        Queue an image (array, PIL.Image or file) to be encoded as the next
+        frame.
+        """
+
+        if self._closed:
+            err = "cannot write to a closed VideoWriter\n"
+            raise ValueError(err)
+
+        self._check_error()
+
+        frame = pyfx.util.to_array(img,num_channels=self._num_channels,
+                                   dtype=np.uint8)
+        if frame.shape[:2] != self._shape:
+            err = "frame shape {} does not match video shape {}\n".format(frame.shape[:2],
+                                                                          self._shape)
+            raise ValueError(err)
+
+        self._queue.put(np.ascontiguousarray(frame))
+        self._num_written += 1
+
+    def close(self):
+        """
+        Flush queued frames and finish the video file.
+        """
+
+        if self._closed:
+            return
+        self._closed = True
+
+        self._queue.put(None)
+        self._thread.join()
+
+        try:
+            self._process.stdin.close()
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+        self._process.wait()
+
+        if self._error is None and self._process.returncode != 0:
+            self._error = "ffmpeg exited with code {}".format(self._process.returncode)
+
+        self._check_error()
+
+    def abort(self):
+        """
+        Stop encoding without flushing the queue.  The output file will likely
+        be incomplete.
+        """
+
+        if self._closed:
+            return
+        self._closed = True
+
+        self._process.kill()
+        self._error = "aborted"
+        self._queue.put(None)
+        self._thread.join()
+        self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def num_written(self):
+        """
+        Number of frames passed to write().
+        """
+        return self._num_written
+
+def to_video(img_set,output_file,frame_rate=30,overwrite=False,**kwargs):
+    """
+    Encode a collection of images into a video file.
+
+    img_set: iterable of images (arrays, PIL.Image instances or files), in
+             frame order.  All images must have the same dimensions.
+    output_file: video file to write
+    frame_rate: frames per second
+    overwrite: whether or not to overwrite an existing output_file
+    kwargs: passed to VideoWriter (codec, crf, pix_fmt, ...)
+    """
+
+    writer = None
+    try:
+        for img in img_set:
+
+            img = pyfx.util.to_array(img,num_channels=3,dtype=np.uint8)
+            if writer is None:
+                writer = VideoWriter(output_file,img.shape[:2],
+                                     frame_rate=frame_rate,
+                                     overwrite=overwrite,**kwargs)
+            writer.write(img)
+
+    except:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is None:
+        err = "img_set is empty\n"
+        raise ValueError(err)
 
-process2.stdin.close()
-process1.wait()
-process2.wait()
-"""
+    writer.close()
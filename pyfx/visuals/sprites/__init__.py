@@ -1,2 +1,4 @@
 
+from .cache import SpriteCache, default_cache
 from .glowing_particle import GlowingParticle, GlowingParticleGenerator
+from .glow_renderer import GlowRenderer
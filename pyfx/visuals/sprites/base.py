@@ -28,9 +28,12 @@ class Sprite:
         self._sprite[:,:,:3] = 255
         self._sprite[:,:,3] = 255
 
-    def write_to_image(self,coord,img_matrix):
+    def _placement(self,coord,shape):
         """
-        Write the sprite to an image.
+        Work out where the sprite centered at coord lands in an image with
+        the given shape.  Sets out_of_frame.  Returns the image and sprite
+        slices ((y_min,y_max,x_min,x_max),(j_min,j_max,i_min,i_max)), or
+        None if none of the sprite is in the image.
         """
 
         # Now figure out where this should go in the output matrix
@@ -53,16 +56,16 @@ class Sprite:
             i_min = abs(x_min)
             if i_min >= self.sprite.shape[1]:
                 self._out_of_frame = True
-                return img_matrix
+                return None
             x_min = 0
 
-        if x_max >= img_matrix.shape[1]:
+        if x_max >= shape[1]:
 
-            i_max = i_max - (x_max - img_matrix.shape[1])
+            i_max = i_max - (x_max - shape[1])
             if i_max <= 0:
                 self._out_of_frame = True
-                return img_matrix
-            x_max = img_matrix.shape[1]
+                return None
+            x_max = shape[1]
 
         # Deal with y/j-bounds
         if y_min < 0:
@@ -70,23 +73,59 @@ class Sprite:
             j_min = abs(y_min)
             if j_min >= self.sprite.shape[0]:
                 self._out_of_frame = True
-                return img_matrix
+                return None
             y_min = 0
 
-        if y_max >= img_matrix.shape[0]:
+        if y_max >= shape[0]:
 
-            j_max = j_max - (y_max - img_matrix.shape[0])
+            j_max = j_max - (y_max - shape[0])
             if j_max <= 0:
                 self._out_of_frame = True
-                return img_matrix
-            y_max = img_matrix.shape[0]
+                return None
+            y_max = shape[0]
+
+        return (y_min,y_max,x_min,x_max), (j_min,j_max,i_min,i_max)
+
+    def update_out_of_frame(self,coord,shape):
+        """
+        Set out_of_frame as though the sprite were written at coord into an
+        image with the given shape, without drawing anything.
+        """
+
+        self._placement(coord,shape)
+
+    def write_to_image(self,coord,img_matrix):
+        """
+        Write the sprite to an image.
+
+        coord: position of the sprite center
+        img_matrix: RGBA array or pyfx.util.composite.Layer.  A Layer records
+                    the region the sprite was written into.
+        """
+
+        out = img_matrix
+        if isinstance(img_matrix,pyfx.util.composite.Layer):
+            img_matrix = img_matrix.array
+
+        placement = self._placement(coord,img_matrix.shape)
+        if placement is None:
+            return out
+        (y_min,y_max,x_min,x_max), (j_min,j_max,i_min,i_max) = placement
+
+        region = img_matrix[y_min:y_max,x_min:x_max,:]
+        sprite = self.sprite[j_min:j_max,i_min:i_max,:]
 
-        a = pyfx.util.alpha_composite(img_matrix[y_min:y_max,x_min:x_max,:],
-                                      self.sprite[j_min:j_max,i_min:i_max,:])
+        # Composite straight into the image, in the image's data type
+        if region.dtype == np.uint8 or np.issubdtype(region.dtype,np.floating):
+            pyfx.util.alpha_composite(region,sprite,out=region)
+        else:
+            region[:,:] = pyfx.util.alpha_composite(region,sprite)
 
-        img_matrix[y_min:y_max,x_min:x_max] = a[:,:]
+        # Record where the sprite went
+        if out is not img_matrix:
+            out.mark(y_min,y_max,x_min,x_max)
 
-        return img_matrix
+        return out
 
 
     @property
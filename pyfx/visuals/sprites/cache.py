@@ -0,0 +1,126 @@
+__description__ = \
+"""
+Cache of sprite bitmaps, shared between sprites and effects.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-23"
+
+import pyfx
+
+import numpy as np
+
+class SpriteCache:
+    """
+    Least-recently-used cache of sprite bitmaps keyed by the parameters used
+    to draw them.
+
+    Parameters are quantized into bins before building the key (say, radius
+    to the nearest 0.1 pixel), and sprites are drawn with the quantized
+    values.  Particles with nearly identical parameters therefore share one
+    bitmap rather than each drawing their own.  Cached bitmaps are
+    read-only.
+
+    By default, all sprites share the cache returned by default_cache().
+    """
+
+    def __init__(self,
+                 max_bytes=2**26,
+                 radius_bin=0.1,
+                 hue_bin=1/360,
+                 intensity_bin=0.02,
+                 alpha_bin=1/255):
+        """
+        max_bytes: memory budget for cached bitmaps
+        radius_bin: bin width for radii (pixels)
+        hue_bin: bin width for hue (0 to 1 scale)
+        intensity_bin: bin width for intensity (0 to 1 scale)
+        alpha_bin: bin width for alpha (0 to 1 scale)
+
+        A bin width of 0 turns off quantization for that parameter.
+        """
+
+        self._bins = {"radius":radius_bin,
+                      "hue":hue_bin,
+                      "intensity":intensity_bin,
+                      "alpha":alpha_bin}
+        for k in self._bins:
+            if self._bins[k] < 0:
+                err = "{}_bin must be 0 or more\n".format(k)
+                raise ValueError(err)
+
+        self._cache = pyfx.util.LRUCache(max_bytes)
+
+    def quantize(self,name,value):
+        """
+        Round value to the center of its bin.
+
+        name: parameter name (radius, hue, intensity or alpha).  Values of
+              other parameters are returned unchanged.
+        """
+
+        step = self._bins.get(name,0)
+        if step == 0:
+            return value
+
+        return float(np.round(value/step)*step)
+
+    def get(self,key):
+        """
+        Return the cached value stored under key, or None.
+        """
+
+        return self._cache.get(key)
+
+    def put(self,key,value):
+        """
+        Store value (a sprite bitmap or a tuple holding one) under key.
+        """
+
+        self._cache.put(key,value)
+
+    def clear(self):
+        """
+        Drop all cached bitmaps.
+        """
+
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    @property
+    def max_bytes(self):
+        return self._cache.max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self,max_bytes):
+        self._cache.max_bytes = max_bytes
+
+    @property
+    def num_bytes(self):
+        """
+        Number of bytes currently held.
+        """
+        return self._cache.num_bytes
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+_default_cache = None
+
+def default_cache():
+    """
+    Return the sprite cache shared by every sprite that was not given its
+    own.  Each process has its own copy.
+    """
+
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SpriteCache()
+
+    return _default_cache
@@ -0,0 +1,328 @@
+__description__ = \
+"""
+Render many glowing particles at once by splatting them into accumulation
+buffers and blurring, rather than compositing one sprite per particle.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2018-12-23"
+
+from .glowing_particle import glow_profile
+
+import matplotlib
+import numpy as np
+from scipy import ndimage, optimize
+
+# Widths of the gaussians used to build every glow (half-octave spacing)
+SIGMAS = 2**(np.arange(-2,12)/2)
+
+# Gaussians narrower than this are drawn directly at full resolution
+MAX_DIRECT_SIGMA = 3
+
+# Gaussian filters are truncated at this many standard deviations
+TRUNCATE = 4.0
+
+class GlowRenderer:
+    """
+    Draw a whole collection of glowing particles (see GlowingParticle) onto a
+    transparent RGBA layer in one pass.
+
+    The glow of a particle of each radius (binned by radius_bin) is fit, once,
+    as a weighted sum of gaussians with fixed widths (SIGMAS).  To render,
+    each particle adds its weights for every gaussian at its center, then
+    each set of weights is blurred with a separable gaussian filter.  Narrow
+    gaussians are drawn directly; wide gaussians are blurred on a coarse
+    image pyramid level and interpolated back up.  The cost scales with the
+    number of pixels plus the number of particles, not the number of
+    particles times the size of their sprites.
+
+    The output matches the sprite path (Sprite.write_to_image for each
+    particle) to within a few alpha levels for isolated particles.  Where
+    glows overlap, they add (up to an alpha of 1) rather than being layered
+    one over the other.
+    """
+
+    def __init__(self,
+                 shape,
+                 num_rings=8,
+                 expansion_factor=1.3,
+                 alpha_decay=1,
+                 radius_bin=0.1):
+        """
+        shape: shape of the frame (rows, columns, ...)
+        num_rings, expansion_factor, alpha_decay: shape of the particle glow
+            (see GlowingParticle)
+        radius_bin: particles whose radii fall into the same bin share a glow
+        """
+
+        if radius_bin <= 0:
+            err = "radius_bin must be larger than 0\n"
+            raise ValueError(err)
+
+        self._shape = (int(shape[0]),int(shape[1]))
+        self._num_rings = num_rings
+        self._expansion_factor = expansion_factor
+        self._alpha_decay = alpha_decay
+        self._radius_bin = radius_bin
+
+        # Radius -> (sprite size, gaussian weights)
+        self._fits = {}
+
+        # Pyramid level for each gaussian: level L is downsampled by 2**L and
+        # the gaussian is at least 2 pixels wide at that level.  (Narrower
+        # than that, the error from splatting and interpolating shows.)
+        self._levels = np.zeros(len(SIGMAS),dtype=np.int)
+        wide = SIGMAS > MAX_DIRECT_SIGMA
+        self._levels[wide] = np.maximum(np.floor(np.log2(SIGMAS[wide])) - 1,1)
+        self._num_levels = np.max(self._levels) + 1
+
+    def _fit(self,radius):
+        """
+        Fit the glow of a particle with this (binned) radius as a sum of
+        gaussians.  Returns the sprite size and weights for each of SIGMAS.
+        """
+
+        try:
+            return self._fits[radius]
+        except KeyError:
+            pass
+
+        profile, size = glow_profile(radius,1,self._num_rings,
+                                     self._expansion_factor,self._alpha_decay)
+
+        d = np.arange(-size,size + 1)
+        d2 = (d[:,np.newaxis]**2 + d[np.newaxis,:]**2).ravel()
+        basis = np.stack([np.exp(-d2/(2*s*s)) for s in SIGMAS],axis=1)
+
+        # The sprite extends two pixels further past its center on the bottom
+        # and right; only the symmetric part around the center is fit.
+        weights = optimize.nnls(basis,profile[:-2,:-2].ravel())[0]
+
+        self._fits[radius] = (size,weights)
+
+        return self._fits[radius]
+
+    def _bin(self,radii):
+        """
+        Bin radii the same way SpriteCache does.
+        """
+
+        radii = np.asarray(radii,dtype=np.float)
+        binned = np.round(radii/self._radius_bin)*self._radius_bin
+        binned[binned == 0] = radii[binned == 0]
+
+        return binned
+
+    def _place(self,coords,radii):
+        """
+        Work out where each particle's sprite would be placed by
+        Sprite.write_to_image.  Returns the center pixel (row, column) of each
+        particle, whether any of it lands in the frame, the index of its
+        radius class and the list of (size,weights) fits for those classes.
+        """
+
+        classes, inverse = np.unique(self._bin(radii),return_inverse=True)
+        fits = [self._fit(float(r)) for r in classes]
+        sizes = np.array([f[0] for f in fits],dtype=np.int)[inverse]
+
+        # Top-left corner of each sprite, exactly as write_to_image does it
+        coords = np.asarray(coords,dtype=np.float)
+        corner = np.round(coords - sizes[:,np.newaxis] - 1).astype(np.int)
+        width = 2*sizes + 3
+
+        visible = np.logical_and(corner > -width[:,np.newaxis],
+                                 corner < np.array(self._shape))
+        visible = np.all(visible,axis=1)
+
+        return corner + sizes[:,np.newaxis], visible, inverse, fits
+
+    def in_frame(self,coords,radii):
+        """
+        Boolean array saying whether any part of each particle's sprite
+        would be drawn in the frame (the opposite of Sprite.out_of_frame).
+        """
+
+        if len(radii) == 0:
+            return np.zeros(0,dtype=bool)
+
+        return self._place(coords,radii)[1]
+
+    def render(self,coords,radii,intensities,hues,alpha=1.0):
+        """
+        Draw the particles onto a new transparent layer.
+
+        coords: (N,2) array of particle centers (row, column)
+        radii: (N,) array of particle radii
+        intensities: (N,) array of particle intensities (0 to 1 scale)
+        hues: (N,) array of particle hues (0 to 1 scale)
+        alpha: maximum alpha at the center of a particle (0 to 1 scale)
+
+        Returns a uint8 RGBA array the size of the frame.
+        """
+
+        out = np.zeros((self._shape[0],self._shape[1],4),dtype=np.uint8)
+        if len(radii) == 0:
+            return out
+
+        centers, visible, inverse, fits = self._place(coords,radii)
+        hues = np.broadcast_to(np.asarray(hues,dtype=np.float),visible.shape)
+
+        centers = centers[visible]
+        inverse = inverse[visible]
+        intensities = np.broadcast_to(intensities,visible.shape)[visible]
+        hues = hues[visible]
+        if len(centers) == 0:
+            return out
+
+        # Fully saturated color of each particle.  If all particles share a
+        # hue, only the glow itself has to be accumulated; otherwise the
+        # color-weighted glow is accumulated as well.
+        hsv = np.ones((len(hues),3),dtype=np.float)
+        hsv[:,0] = hues
+        colors = matplotlib.colors.hsv_to_rgb(hsv)
+        if np.all(hues == hues[0]):
+            scale = intensities[:,np.newaxis]
+        else:
+            scale = np.concatenate((colors,np.ones((len(hues),1))),axis=1)
+            scale = scale*intensities[:,np.newaxis]
+
+        # Weight of each gaussian for each radius class
+        class_weights = np.array([f[1] for f in fits])
+
+        # Pad the frame so sprites hanging off the edge still contribute, and
+        # so it divides evenly into every pyramid level.
+        max_size = max([f[0] for f in fits]) + 3
+        step = 2**(self._num_levels - 1)
+        margin = -(-(max_size + step)//step)*step
+        padded = [-(-(s + 2*margin)//step)*step for s in self._shape]
+        centers = centers + margin
+
+        acc = self._splat_direct(centers,inverse,class_weights,scale,padded)
+        acc += self._splat_pyramid(centers,inverse,class_weights,scale,padded)
+        acc = acc[margin:margin + self._shape[0],margin:margin + self._shape[1]]
+
+        # Glow strength (0 to 1) at each pixel
+        img = np.clip(acc[:,:,-1],0,1)
+        out[:,:,3] = alpha*255*img
+
+        # Value fixed at 1, saturation 1 - img (see GlowingParticle).  With a
+        # single hue, the color only depends on img, so look it up.
+        if acc.shape[2] == 1:
+            levels = np.linspace(0,1,1024)[:,np.newaxis]
+            lut = (255*(colors[0] + levels*(1 - colors[0]))).astype(np.uint8)
+            out[:,:,:3] = lut[np.rint(img*1023).astype(np.int)]
+        else:
+            total = np.maximum(acc[:,:,-1:],np.finfo(np.float32).tiny)
+            color = acc[:,:,:3]/total
+            img = img[:,:,np.newaxis]
+            out[:,:,:3] = 255*(color + img*(1 - color))
+
+        # Fully transparent pixels are left empty
+        out[:,:,:3] *= out[:,:,3:] > 0
+
+        return out
+
+    def _splat_direct(self,centers,inverse,class_weights,scale,shape):
+        """
+        Draw the narrow gaussians directly around each center.
+        """
+
+        direct = np.flatnonzero(self._levels == 0)
+        radius = int(TRUNCATE*np.max(SIGMAS[direct]) + 0.5)
+
+        d = np.arange(-radius,radius + 1)
+        d2 = np.ravel(d[:,np.newaxis]**2 + d[np.newaxis,:]**2)
+        kernels = np.stack([np.exp(-d2/(2*SIGMAS[j]**2)) for j in direct])
+
+        # Kernel for each radius class, then for each particle and channel
+        class_kernels = np.dot(class_weights[:,direct],kernels).astype(np.float32)
+        per_particle = class_kernels[inverse][:,np.newaxis,:]*scale[:,:,np.newaxis]
+
+        rows = centers[:,0,np.newaxis,np.newaxis] + d[np.newaxis,:,np.newaxis]
+        cols = centers[:,1,np.newaxis,np.newaxis] + d[np.newaxis,np.newaxis,:]
+        flat = np.ravel(rows*shape[1] + cols)
+
+        num_channels = scale.shape[1]
+        out = np.zeros((shape[0]*shape[1],num_channels),dtype=np.float32)
+        for c in range(num_channels):
+            out[:,c] = np.bincount(flat,per_particle[:,c].ravel(),
+                                   minlength=len(out))
+
+        return out.reshape((shape[0],shape[1],num_channels))
+
+    def _splat_pyramid(self,centers,inverse,class_weights,scale,shape):
+        """
+        Draw the wide gaussians.  Each is splatted (bilinearly) onto the
+        pyramid level for its width and blurred there.  Levels are then
+        interpolated up, coarsest first.  The blur used on each level is
+        narrowed to make up for the spread added by splatting and
+        interpolating.
+        """
+
+        num_channels = scale.shape[1]
+
+        acc = None
+        for level in range(self._num_levels - 1,0,-1):
+
+            f = 2**level
+            level_shape = (shape[0]//f,shape[1]//f,num_channels)
+
+            # Interpolate the coarser levels up to this one
+            if acc is None:
+                level_acc = np.zeros(level_shape,dtype=np.float32)
+            else:
+                level_acc = _upsample(acc)
+
+            # Variance (in this level's pixels) added by bilinear splatting
+            # and the linear interpolation steps back up to full resolution
+            spread = (1 + np.sum(4.0**(np.arange(1,level + 1) - level)))/6
+
+            # Center of level pixel i is at full resolution pixel f*i + (f-1)/2
+            u = (centers - (f - 1)/2)/f
+            i0 = np.floor(u).astype(np.int)
+            t = u - i0
+
+            for j in np.flatnonzero(self._levels == level):
+
+                # Each gaussian has a peak of 1, so its total is 2*pi*sigma**2
+                # full resolution pixels (f**2 fewer on this level)
+                mass = class_weights[inverse,j,np.newaxis]*scale
+                mass *= 2*np.pi*SIGMAS[j]**2/f**2
+                if not np.any(mass):
+                    continue
+
+                buffer = np.zeros(level_shape,dtype=np.float32)
+                for dy, wy in [(0,1 - t[:,0]),(1,t[:,0])]:
+                    for dx, wx in [(0,1 - t[:,1]),(1,t[:,1])]:
+                        np.add.at(buffer,(i0[:,0] + dy,i0[:,1] + dx),
+                                  mass*(wy*wx)[:,np.newaxis])
+
+                sigma = np.sqrt((SIGMAS[j]/f)**2 - spread)
+                level_acc += ndimage.gaussian_filter(buffer,(sigma,sigma,0),
+                                                     mode="constant",
+                                                     truncate=TRUNCATE)
+
+            acc = level_acc
+
+        return _upsample(acc)
+
+def _upsample(a):
+    """
+    Double the size of the first two axes of a by linear interpolation.
+    Pixel i of the output is centered at i/2 - 1/4 in the input, so even
+    pixels are 1/4 of the way from the previous input pixel and odd pixels
+    1/4 of the way to the next one.
+    """
+
+    for axis in [0,1]:
+
+        a = np.moveaxis(a,axis,0)
+        before = np.concatenate((a[:1],a[:-1]))
+        after = np.concatenate((a[1:],a[-1:]))
+
+        out = np.empty((2*a.shape[0],) + a.shape[1:],dtype=a.dtype)
+        out[0::2] = 0.25*before + 0.75*a
+        out[1::2] = 0.75*a + 0.25*after
+
+        a = np.moveaxis(out,0,axis)
+
+    return a
@@ -1,10 +1,47 @@
+import pyfx
 
 from .base import Sprite
+from .cache import default_cache
 
 import matplotlib
 import numpy as np
 from skimage import draw, filters
 
+def glow_profile(radius,alpha=1,num_rings=8,expansion_factor=1.3,alpha_decay=1):
+    """
+    Draw the glow of a particle: num_rings concentric disks blurred with a
+    gaussian.  See GlowingParticle for the meaning of the arguments.
+
+    Returns a 2D float array scaled so its maximum is 1, and the distance
+    from its edge to the center pixel (the center is at [size,size]).
+    """
+
+    # Create mini array to draw object
+    size = radius*(expansion_factor**(num_rings - 1)) + 3
+    size = int(np.ceil(size))
+    img = np.zeros((2*size + 3,2*size + 3),dtype=np.float)
+
+    # Find center of mini array for drawing
+    center = size
+    # Draw num_rings circles, expanding radius by expansion_factor each time
+    # and dropping the alpha value by alpha_decay
+    sigma = radius
+    for i in range(num_rings):
+        rr, cc = draw.circle(center,center,
+                             radius=radius)
+        img[rr,cc] += alpha
+
+        alpha = alpha*alpha_decay
+        radius = int(round(radius*expansion_factor))
+
+    # Blur
+    img = filters.gaussian(img,sigma=sigma)
+
+    # Normalize the array so it ranges from 0 to 1
+    img = img/np.max(img)
+
+    return img, size
+
 class GlowingParticle(Sprite):
 
     def __init__(self,
@@ -14,7 +51,8 @@ class GlowingParticle(Sprite):
                  num_rings=8,
                  expansion_factor=1.3,
                  alpha=1,
-                 alpha_decay=1):
+                 alpha_decay=1,
+                 sprite_cache=None):
         """
         radius: particle radius
         intensity: how brightly the particle glows (0 to 1 scale)
@@ -23,6 +61,9 @@ class GlowingParticle(Sprite):
         expansion_factor: how much bigger each ring is than the previous ring
         alpha: maximum alpha for center of particle (0 to 1 scale)
         alpha_decay: multiply alpha by this value for each new ring
+        sprite_cache: SpriteCache to draw the bitmap from.  If None, use the
+                      shared default cache.  If False, draw the bitmap with
+                      the exact (unquantized) parameters and do not cache it.
         """
 
         if radius < 0:
@@ -60,51 +101,71 @@ class GlowingParticle(Sprite):
             raise ValueError(err)
         self._alpha_decay = alpha_decay
 
+        self._sprite_cache = sprite_cache
+
         super().__init__()
 
     def _build_sprite(self):
         """
-        Construct a bitmap representation of this particle.
+        Construct a bitmap representation of this particle, taking it from
+        the sprite cache if possible.
         """
 
-        # Create mini array to draw object
-        size = self._radius*(self._expansion_factor**(self._num_rings - 1)) + 3
-        self._size = int(np.ceil(size))
-        img = np.zeros((2*self._size + 3,2*self._size + 3),dtype=np.float)
+        cache = self._sprite_cache
+        if cache is None:
+            cache = default_cache()
+
+        if cache is False:
+            self._sprite, self._size = self._draw(self._radius,
+                                                  self._intensity,
+                                                  self._hue,
+                                                  self._alpha)
+            return
+
+        # Do not let tiny particles round down to nothing
+        radius = cache.quantize("radius",self._radius)
+        if radius == 0:
+            radius = self._radius
+
+        intensity = cache.quantize("intensity",self._intensity)
+        hue = cache.quantize("hue",self._hue)
+        alpha = cache.quantize("alpha",self._alpha)
 
-        # Find center of mini array for drawing
-        center = self._size
-        # Draw num_rings circles, expanding radius by expansion_factor each time
-        # and dropping the alpha value by alpha_decay
-        alpha = self._alpha
-        radius = self._radius
-        for i in range(self._num_rings):
-            rr, cc = draw.circle(center,center,
-                                 radius=radius)
-            img[rr,cc] += alpha
+        key = ("GlowingParticle",radius,intensity,hue,alpha,
+               self._num_rings,self._expansion_factor,self._alpha_decay)
 
-            alpha = alpha*self._alpha_decay
-            radius = int(round(radius*self._expansion_factor))
+        value = cache.get(key)
+        if value is None:
+            value = self._draw(radius,intensity,hue,alpha)
+            value[0].flags.writeable = False
+            cache.put(key,value)
 
-        # Blur
-        img = filters.gaussian(img,sigma=self._radius)
+        self._sprite, self._size = value
 
-        # Normalize the array so it ranges from 0 to 1
-        img = img/np.max(img)*self._intensity
+    def _draw(self,radius,intensity,hue,alpha):
+        """
+        Draw the particle bitmap.  Returns the RGBA bitmap and the distance
+        from its edge to the particle center.
+        """
+
+        img, size = glow_profile(radius,alpha,self._num_rings,
+                                 self._expansion_factor,self._alpha_decay)
+        img = img*intensity
 
         # Hue is set by user, value fixed at one, saturation is determined by
         # intensity
-        hue =   np.ones(img.shape,dtype=np.float)*self._hue
+        hue =   np.ones(img.shape,dtype=np.float)*hue
         value = np.ones(img.shape,dtype=np.float)
         saturation = 1 - img
 
         col = np.stack((hue,saturation,value),2)
-        rgb = np.array(255*matplotlib.colors.hsv_to_rgb(col),dtype=np.uint8)
 
         # Create output image, RGBA
-        self._sprite = np.zeros((img.shape[0],img.shape[1],4),dtype=np.uint8)
-        self._sprite[:,:,:3] = 255*matplotlib.colors.hsv_to_rgb(col)
-        self._sprite[:,:,3] = self._alpha*255*img
+        sprite = np.zeros((img.shape[0],img.shape[1],4),dtype=np.uint8)
+        sprite[:,:,:3] = 255*matplotlib.colors.hsv_to_rgb(col)
+        sprite[:,:,3] = alpha*255*img
+
+        return sprite, size
 
     @property
     def radius(self):
@@ -170,13 +231,28 @@ class GlowingParticleGenerator:
                  radius_pareto=1.0,
                  radius_max=5,
                  intensity_pareto=1.0,
-                 intensity_max=10):
+                 intensity_max=10,
+                 sprite_cache=None,
+                 rng=None):
+        """
+        hue: hue of new particles (0 to 1 scale)
+        radius_pareto: pareto shape parameter for sampling particle radii
+        radius_max: maximum radius
+        intensity_pareto: pareto shape parameter for sampling intensities
+        intensity_max: maximum intensity
+        sprite_cache: SpriteCache passed to new particles (see
+                      GlowingParticle)
+        rng: np.random.Generator used to sample radii and intensities.  If
+             None, use the global np.random state.
+        """
 
         self._hue = hue
         self._radius_pareto = radius_pareto
         self._radius_max = radius_max
         self._intensity_pareto = intensity_pareto
         self._intensity_max = intensity_max
+        self._sprite_cache = sprite_cache
+        self._rng = rng
 
     def create(self,**kwargs):
         """
@@ -184,21 +260,48 @@ class GlowingParticleGenerator:
         throw particle properties at it.
         """
 
+        rng = pyfx.util.rng.get_rng(self._rng)
+
         try:
             radius = kwargs["radius"]
         except KeyError:
-            radius = np.random.pareto(self._radius_pareto) + 1.0
+            radius = rng.pareto(self._radius_pareto) + 1.0
             if radius > self._radius_max:
                 radius = self._radius_max
 
-        # Generate random intensity (sampling from Pareto scale-free
-        # distribution)
-        intensity = np.random.pareto(self._intensity_pareto) + 1.0
-        if intensity > self._intensity_max:
-            intensity = self._intensity_max
-        intensity = intensity/self._intensity_max
+        try:
+            intensity = kwargs["intensity"]
+        except KeyError:
+
+            # Generate random intensity (sampling from Pareto scale-free
+            # distribution)
+            intensity = rng.pareto(self._intensity_pareto) + 1.0
+            if intensity > self._intensity_max:
+                intensity = self._intensity_max
+            intensity = intensity/self._intensity_max
+
+        hue = kwargs.get("hue",self._hue)
+
+        return GlowingParticle(radius=radius,intensity=intensity,hue=hue,
+                               sprite_cache=self._sprite_cache)
 
-        return GlowingParticle(radius=radius,intensity=intensity,hue=self._hue)
+    def sample_properties(self,num_particles):
+        """
+        Draw the intensities and hues of num_particles new particles at once,
+        without building their sprites.  Returns (intensities, hues) arrays.
+        Pass the values to create() as intensity and hue to build the matching
+        sprites.
+        """
+
+        rng = pyfx.util.rng.get_rng(self._rng)
+
+        intensities = rng.pareto(self._intensity_pareto,num_particles) + 1.0
+        np.minimum(intensities,self._intensity_max,out=intensities)
+        intensities = intensities/self._intensity_max
+
+        hues = np.ones(num_particles,dtype=np.float)*self._hue
+
+        return intensities, hues
 
     @property
     def hue(self):
@@ -234,3 +337,10 @@ class GlowingParticleGenerator:
     @intensity_max.setter
     def intensity_max(self,intensity_max):
         self._intensity_max = intensity_max
+
+    @property
+    def rng(self):
+        return self._rng
+    @rng.setter
+    def rng(self,rng):
+        self._rng = rng
@@ -0,0 +1,49 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+import os
+
+@pytest.fixture(autouse=True)
+def keep_random_state():
+    """
+    Some tests depend on the global random state; leave it as we found it.
+    """
+
+    state = np.random.get_state()
+    yield
+    np.random.set_state(state)
+
+@pytest.fixture
+def write_frames():
+    """
+    Function that writes a directory of png frames with a dark blob moving
+    across a gray background, for workspaces and frame sources.
+    """
+
+    def write(src_dir,num_frames=12,shape=(48,64),step=4):
+        """
+        Write num_frames frames to src_dir (moving the blob step pixels per
+        frame) and return the sorted list of files.  If src_dir already
+        exists, return the files in it.
+        """
+
+        src_dir = str(src_dir)
+        if not os.path.isdir(src_dir):
+            os.mkdir(src_dir)
+
+            rows, cols = np.mgrid[0:shape[0],0:shape[1]]
+            for t in range(num_frames):
+                frame = 127*np.ones((shape[0],shape[1],4),dtype=np.uint8)
+                frame[:,:,3] = 255
+                blob = ((rows - 24)/14)**2 + ((cols - 10 - step*t)/12)**2 < 1
+                frame[blob,:3] = 0
+
+                f = os.path.join(src_dir,"f{:03d}.png".format(t))
+                pyfx.util.to_image(frame).save(f)
+
+        return sorted([os.path.join(src_dir,f) for f in os.listdir(src_dir)])
+
+    return write
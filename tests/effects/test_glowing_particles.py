@@ -0,0 +1,121 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+import os, glob
+
+def _render(src_dir,tmp_path,name,chunks,workers=1,renderer="sprites"):
+    """
+    Render glowing particles in a DiffPotential, in the order given by
+    chunks (list of time intervals), in a fresh workspace.  Returns the
+    rendered frames.
+    """
+
+    ws = pyfx.Workspace(str(tmp_path / name),src_dir,seed=5)
+
+    dp = pyfx.processors.DiffPotential(ws,update_interval=3,threshold=0.05,
+                                       num_iterate=4,disk_size=3,blur=3)
+    gp = pyfx.effects.GlowingParticles(ws)
+    gp.add_waypoint(0,potentials=[dp],num_particles=20,velocity_dist=0.5)
+    gp.bake(checkpoint_interval=4,renderer=renderer)
+
+    out_dir = str(tmp_path / (name + "_out"))
+    for i, chunk in enumerate(chunks):
+        ws.render(out_dir,effects=(gp,),time_interval=chunk,overwrite=i > 0,
+                  workers=workers)
+
+    files = sorted(glob.glob(os.path.join(out_dir,"*.png")))
+
+    return [pyfx.util.to_array(f) for f in files]
+
+def test_checkpoint_parity(tmp_path,write_frames):
+
+    src_dir = str(tmp_path / "src")
+    write_frames(src_dir,num_frames=24,step=2)
+
+    serial = _render(src_dir,tmp_path,"serial",[(0,24)])
+    assert len(serial) == 24
+
+    # Later chunk first, so the simulation has to catch up from frame 0 and
+    # then pick up from checkpoints
+    chunked = _render(src_dir,tmp_path,"chunked",[(12,24),(5,12),(0,5)])
+    for a, b in zip(serial,chunked):
+        assert np.array_equal(a,b)
+
+    parallel = _render(src_dir,tmp_path,"parallel",[(0,24)],workers=3)
+    for a, b in zip(serial,parallel):
+        assert np.array_equal(a,b)
+
+    # Splatting draws from the intensity and hue arrays, which are
+    # checkpointed without any sprites
+    serial = _render(src_dir,tmp_path,"splat_serial",[(0,24)],renderer="splat")
+    chunked = _render(src_dir,tmp_path,"splat_chunked",[(12,24),(5,12),(0,5)],
+                      renderer="splat")
+    for a, b in zip(serial,chunked):
+        assert np.array_equal(a,b)
+
+def test_checkpoint_signature(tmp_path,write_frames):
+
+    src_dir = str(tmp_path / "src")
+    write_frames(src_dir,num_frames=4)
+    ws = pyfx.Workspace(str(tmp_path / "ws"),src_dir,seed=5)
+
+    def signature(potentials):
+        gp = pyfx.effects.GlowingParticles(ws)
+        gp.add_waypoint(0,potentials=potentials)
+        gp.rng_key = "same"
+        gp.bake(checkpoint_interval=2)
+        return gp._signature, gp.parallel_safe
+
+    radial = pyfx.physics.potentials.Radial((10,10),dimensions=ws.shape[:2])
+    sig, safe = signature([radial])
+    assert safe
+    assert signature([radial]) == (sig,True)
+
+    # Changing a potential invalidates checkpoints
+    radial.update(pot_mag=2.0)
+    assert signature([radial])[0] != sig
+
+    # So does changing how a DiffPotential surface is calculated
+    dp = pyfx.processors.DiffPotential(ws)
+    dp_sig = dp.signature
+    ws.diff_method = "absdiff"
+    assert dp.signature != dp_sig
+
+    # A potential without a signature cannot be checkpointed
+    class Anonymous(pyfx.physics.potentials.Potential):
+        pass
+
+    with pytest.warns(UserWarning):
+        assert signature([Anonymous(1.0)]) == (None,False)
+
+def test_stale_checkpoints(tmp_path,write_frames):
+
+    src_dir = str(tmp_path / "src")
+    write_frames(src_dir,num_frames=10)
+    ws = pyfx.Workspace(str(tmp_path / "ws"),src_dir,seed=5)
+
+    dp = pyfx.processors.DiffPotential(ws,update_interval=3,threshold=0.05,
+                                       num_iterate=4,disk_size=3,blur=3)
+    gp = pyfx.effects.GlowingParticles(ws)
+    gp.add_waypoint(0,potentials=[dp],num_particles=20)
+    gp.bake(checkpoint_interval=4)
+
+    ws.render(str(tmp_path / "out"),effects=(gp,),time_interval=(0,10))
+    assert gp._find_checkpoint(9) == 8
+
+    # A checkpoint from another setup is skipped for the last one that
+    # matches
+    f = gp._checkpoint_file(8)
+    with np.load(f) as data:
+        state = dict(data)
+    state["signature"] = "stale"
+    np.savez(f,**state)
+    assert gp._find_checkpoint(9) == 4
+
+    # Changing the background changes the DiffPotential wells, so none of
+    # the checkpoints apply
+    ws.set_background(5)
+    assert gp._find_checkpoint(9) is None
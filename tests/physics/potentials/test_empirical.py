@@ -0,0 +1,71 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+def test_empirical_batch():
+
+    x, y = np.meshgrid(np.arange(50),np.arange(40),indexing="ij")
+    obs = np.sin(x/5)*np.cos(y/7)
+    e = pyfx.physics.potentials.Empirical(obs)
+
+    coords = np.array([[10.5,3.2],[0,0],[49,39],[25.1,20.7]])
+    forces = np.array([e.get_forces(c) for c in coords])
+    energies = np.array([e.get_energy(c)[0,0] for c in coords])
+
+    assert np.allclose(e.get_forces_batch(coords),forces)
+    assert np.allclose(e.get_energy_batch(coords),energies)
+
+def test_fallback():
+
+    class Doubler(pyfx.physics.potentials.Potential):
+        def get_forces(self,coord):
+            return 2*coord
+
+    coords = np.array([[1,2],[3,4]],dtype=np.float)
+    assert np.array_equal(Doubler(1).get_forces_batch(coords),2*coords)
+    assert np.array_equal(Doubler(1).get_energy_batch(coords),np.zeros(2))
+
+def test_force_grid():
+
+    x, y = np.meshgrid(np.arange(50),np.arange(40),indexing="ij")
+    obs = np.sin(x/5)*np.cos(y/7)
+    e = pyfx.physics.potentials.Empirical(obs)
+
+    coords = np.array([[10.5,3.2],[0,0],[49,39],[25.1,20.7]])
+    forces = e.get_forces_batch(coords)
+
+    for force_grid in [1,3]:
+        g = pyfx.physics.potentials.Empirical(obs,force_grid=force_grid)
+        out = g.get_forces_batch(coords)
+        assert out.dtype == np.float32
+        assert np.allclose(out,forces,atol=0.01)
+        assert np.allclose(g.get_forces(coords[0]),forces[0],atol=0.01)
+
+    # Grid points are exact
+    g = pyfx.physics.potentials.Empirical(obs,force_grid=1)
+    assert np.allclose(g.get_forces_batch(coords[1:3]),forces[1:3],atol=1e-5)
+
+    with pytest.raises(ValueError):
+        pyfx.physics.potentials.Empirical(obs,force_grid=0)
+
+def test_lazy_spline():
+
+    x, y = np.meshgrid(np.arange(50),np.arange(40),indexing="ij")
+    well = np.array(np.round(255*(x/49)*(y/39)),dtype=np.uint8)
+    e = pyfx.physics.potentials.Empirical(well)
+
+    # Nothing is built until it is used
+    assert e._potential is None
+    assert e.surface is well
+
+    coords = np.array([[10.5,3.2],[25.1,20.7]])
+    spline = pyfx.physics.potentials.Empirical(well.astype(np.float))
+    assert np.allclose(e.get_forces_batch(coords),spline.get_forces_batch(coords))
+    assert e._potential is not None
+
+    # A new surface resets the spline
+    e.update(255 - well)
+    assert e._potential is None
+    assert np.allclose(e.get_energy_batch(coords),255 - spline.get_energy_batch(coords))
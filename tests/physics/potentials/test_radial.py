@@ -17,3 +17,14 @@ def test_radial():
         forces = r.get_forces(p.coord)
         p.advance_time(forces)
         print(p.velocity,p.coord)
+
+def test_radial_batch():
+
+    r = pyfx.physics.potentials.Radial(center_coord=np.array((300,300)),pot_mag=-1000)
+
+    coords = np.array([[320,320],[301,300],[0,0],[500,100]],dtype=np.float)
+    forces = np.array([r.get_forces(c) for c in coords])
+    energies = np.array([r.get_energy(c) for c in coords])
+
+    assert np.allclose(r.get_forces_batch(coords),forces)
+    assert np.allclose(r.get_energy_batch(coords),energies)
@@ -0,0 +1,84 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+def _spring(coords):
+    return -coords
+
+def test_constant_force():
+
+    # Both integrators are exact for a constant force when they only take
+    # full steps; substeps must add up to the requested time.
+    force = np.array((2.0,-1.0))
+    masses = np.array([1.0,2.0,4.0])
+
+    for integrator in [pyfx.physics.integrators.VelocityVerlet(),
+                       pyfx.physics.integrators.VelocityVerlet(max_displacement=0.1)]:
+
+        coords = np.zeros((3,2))
+        velocities = np.ones((3,2))
+        accels = force/masses[:,np.newaxis]
+        expected_accels = accels.copy()
+
+        num_steps = integrator.advance(coords,velocities,accels,masses,
+                                       lambda c: np.tile(force,(len(c),1)),
+                                       dt=1.0,num_steps=4)
+        assert num_steps == integrator.num_substeps
+
+        assert np.allclose(coords,4 + expected_accels*16/2)
+        assert np.allclose(velocities,1 + expected_accels*4)
+
+def test_adaptive_substeps():
+
+    masses = np.ones(2)
+    coords = np.array([[10.0,0.0],[1.0,1.0]])
+
+    # Fixed steps
+    fixed = pyfx.physics.integrators.VelocityVerlet()
+    assert fixed.advance(coords.copy(),np.zeros((2,2)),_spring(coords),masses,
+                         _spring,dt=1.0,num_steps=5) == 5
+
+    # Steep forces are split into substeps, up to max_substeps
+    adaptive = pyfx.physics.integrators.VelocityVerlet(max_displacement=0.5,
+                                                       max_substeps=3)
+    assert adaptive.advance(coords.copy(),np.zeros((2,2)),_spring(coords),masses,
+                            _spring,dt=1.0,num_steps=5) > 5
+    adaptive.max_substeps = 100
+    adaptive.max_displacement = 0.1
+    assert adaptive.advance(coords.copy(),np.zeros((2,2)),_spring(coords),masses,
+                            _spring,dt=1.0,num_steps=5) > 5*3
+
+    with pytest.raises(ValueError):
+        adaptive.max_displacement = 0
+
+def test_stability():
+
+    # A particle passing close to a repulsive 1/r core (like Radial near
+    # min_r) is thrown out with far too much energy when the frame is taken
+    # as one step, but not when it is split into substeps.
+    def core(coords):
+        r = np.sqrt(np.sum(coords*coords,axis=1))[:,np.newaxis]
+        return 5*coords/r**3
+
+    def energy(coords,velocities):
+        return 0.5*np.sum(velocities**2) + 5/np.sqrt(np.sum(coords**2))
+
+    masses = np.ones(1)
+    for cls in [pyfx.physics.integrators.VelocityVerlet,
+                pyfx.physics.integrators.SemiImplicitEuler]:
+
+        drift = []
+        for max_displacement in [None,0.01]:
+            coords = np.array([[10.0,0.05]])
+            velocities = np.array([[-5.0,0.0]])
+            e0 = energy(coords,velocities)
+
+            integrator = cls(max_displacement=max_displacement)
+            integrator.advance(coords,velocities,core(coords),masses,core,
+                               dt=1.0,num_steps=10)
+            drift.append(np.abs(energy(coords,velocities) - e0)/e0)
+
+        assert drift[0] > 10
+        assert drift[1] < 0.5
@@ -0,0 +1,213 @@
+import pytest
+
+import numpy as np
+np.random.seed(0)
+
+import pyfx
+
+def test_advance_time():
+
+    # Velocity Verlet is exact for a constant force
+    u = pyfx.physics.potentials.Uniform(force_vector=np.array((5,0),dtype=np.float))
+    pc = pyfx.physics.ParticleCollection(20,dimensions=(100,100),potentials=[u])
+    pc.construct_particles()
+
+    coords = pc.coords.copy()
+    velocities = pc.velocities.copy()
+    accels = u.get_forces(coords[0])/pc.masses[:,np.newaxis]
+
+    dt = 0.5
+    num_steps = 10
+    pc.advance_time(dt=dt,num_steps=num_steps)
+
+    t = dt*num_steps
+    assert np.allclose(pc.coords,coords + velocities*t + accels*t*t/2)
+    assert np.allclose(pc.velocities,velocities + accels*t)
+
+    # A lone particle is stepped by its own integrator with the collection's
+    # forces
+    p = pyfx.physics.Particle((50.0,50.0),velocity=(1.0,0.0),radius=2)
+    expected = pyfx.physics.Particle((50.0,50.0),velocity=(1.0,0.0),radius=2)
+    pc.apply_forces(p,dt=dt,num_steps=num_steps)
+    for i in range(num_steps):
+        expected.advance_time(u.get_forces(expected.coord),dt)
+    assert np.allclose(p.coord,expected.coord)
+    assert np.allclose(p.velocity,expected.velocity)
+    assert p.coord[0] > 50 + t
+
+def test_purge_and_equalize():
+
+    pc = pyfx.physics.ParticleCollection(20,dimensions=(100,100))
+    pc.construct_particles()
+    assert pc.coords.shape == (20,2)
+    assert len(pc.sprites) == 20
+
+    pc.coords[:5] = -1
+    pc.purge_invisible()
+    assert pc.coords.shape == (15,2)
+    assert len(pc.masses) == 15
+
+    pc.equalize_particles(30)
+    assert pc.coords.shape == (30,2)
+    assert len(pc.particles) == 30
+
+    pc.equalize_particles(10)
+    assert pc.velocities.shape == (10,2)
+
+    pc.equalize_particles(0)
+    assert len(pc.radii) == 0
+
+def test_get_and_set_state():
+
+    u = pyfx.physics.potentials.Uniform(force_vector=np.array((1,0),dtype=np.float))
+    pc = pyfx.physics.ParticleCollection(10,dimensions=(100,100),potentials=[u])
+    pc.construct_particles()
+    state = pc.get_state()
+    sprites = list(pc.sprites)
+
+    pc.advance_time(num_steps=3)
+    after = pc.coords.copy()
+
+    # Restoring the state and taking the same steps lands in the same place
+    pc.equalize_particles(0)
+    pc.set_state(state,sprites)
+    assert np.array_equal(pc.coords,state["coords"])
+    pc.advance_time(num_steps=3)
+    assert np.array_equal(pc.coords,after)
+
+    with pytest.raises(ValueError):
+        pc.set_state(state,sprites[:5])
+
+class _Sprite:
+    """
+    Stand-in sprite that remembers the particle it was made for.
+    """
+
+    def __init__(self,radius,velocity):
+        self.radius = radius
+        self.velocity = np.copy(velocity)
+        self.out_of_frame = False
+
+class _SpriteGenerator:
+
+    def create(self,radius,velocity):
+        return _Sprite(radius,velocity)
+
+def test_bulk_spawn():
+
+    dimensions = (60,80)
+    x, y = np.meshgrid(np.arange(60),np.arange(80),indexing="ij")
+    empirical = pyfx.physics.potentials.Empirical((x - 30.0)**2 + (y - 40.0)**2,
+                                                  kT=100)
+    uniform = pyfx.physics.potentials.Uniform(dimensions=dimensions)
+
+    for potentials in [[],[uniform],[empirical]]:
+        pc = pyfx.physics.ParticleCollection(500,dimensions=dimensions,
+                                             potentials=potentials,
+                                             radius_max=3)
+        pc.construct_particles()
+
+        assert pc.coords.shape == (500,2)
+        assert pc.velocities.shape == (500,2)
+        assert len(pc.radii) == 500
+        assert len(pc.masses) == 500
+        assert len(pc.sprites) == 500
+        assert np.all(pc.coords >= 0)
+        assert np.all(pc.coords < dimensions)
+        assert np.all(pc.radii >= 1)
+        assert np.all(pc.radii <= 3)
+
+    # Particles the potential cannot place are dropped
+    class HalfPlaced(pyfx.physics.potentials.Potential):
+        def sample_coords(self,num_coords=1):
+            coords = np.ones((num_coords,2))
+            coords[::2] = np.nan
+            return coords
+
+    pc = pyfx.physics.ParticleCollection(10,dimensions=dimensions,
+                                         potentials=[HalfPlaced(1.0)])
+    pc.construct_particles()
+    assert pc.coords.shape == (5,2)
+    assert len(pc.sprites) == 5
+    assert np.all(pc.coords == 1)
+
+def test_cull_keeps_arrays_aligned():
+
+    pc = pyfx.physics.ParticleCollection(40,dimensions=(100,100),
+                                         sprite_generator=_SpriteGenerator())
+    pc.construct_particles()
+
+    def check_aligned(pc):
+        assert len(pc.coords) == len(pc.velocities) == len(pc.radii) \
+               == len(pc.masses) == len(pc.sprites)
+        for v, r, s in zip(pc.velocities,pc.radii,pc.sprites):
+            assert s.radius == r
+            assert np.array_equal(s.velocity,v)
+        assert np.allclose(pc.masses,4/3*np.pi*pc.radii**3*pc.particle_density)
+
+    check_aligned(pc)
+
+    # Purge using the sprites
+    coords = pc.coords.copy()
+    for i in [0,7,8,39]:
+        pc.sprites[i].out_of_frame = True
+    pc.purge_invisible()
+    keep = np.ones(40,dtype=bool)
+    keep[[0,7,8,39]] = False
+    assert np.array_equal(pc.coords,coords[keep])
+    check_aligned(pc)
+
+    # Purge using a visibility mask
+    coords = pc.coords.copy()
+    visible = np.arange(36) % 3 != 0
+    pc.purge_invisible(visible)
+    assert np.array_equal(pc.coords,coords[visible])
+    check_aligned(pc)
+
+    # Randomly cull down to a target number, then spawn back up
+    pc.equalize_particles(10)
+    assert len(pc.sprites) == 10
+    check_aligned(pc)
+
+    pc.equalize_particles(25)
+    assert len(pc.sprites) == 25
+    check_aligned(pc)
+
+def test_sprite_properties():
+
+    # Intensities and hues are kept as arrays whether or not sprites are built
+    out = []
+    for build_sprites in [True,False]:
+        streams = pyfx.util.RandomStreams(seed=0)
+        gen = pyfx.visuals.sprites.GlowingParticleGenerator(hue=0.3,
+                                                            rng=streams.generator("pc"))
+        pc = pyfx.physics.ParticleCollection(30,dimensions=(100,100),
+                                             sprite_generator=gen,
+                                             build_sprites=build_sprites,
+                                             rng=streams.generator("pc"))
+        pc.construct_particles()
+        out.append(pc)
+
+        assert len(pc.intensities) == len(pc.hues) == 30
+        assert np.all(pc.intensities > 0)
+        assert np.all(pc.intensities <= 1)
+        assert np.all(pc.hues == 0.3)
+
+    with_sprites, without_sprites = out
+    assert np.array_equal(with_sprites.intensities,without_sprites.intensities)
+    assert np.array_equal([s.intensity for s in with_sprites.sprites],
+                          with_sprites.intensities)
+    assert all([s is None for s in without_sprites.sprites])
+
+    # Culling and state round trips keep the arrays with their particles
+    pc = without_sprites
+    intensities = pc.intensities.copy()
+    visible = np.arange(30) % 4 != 0
+    pc.purge_invisible(visible)
+    assert np.array_equal(pc.intensities,intensities[visible])
+
+    state = pc.get_state()
+    pc.equalize_particles(0)
+    pc.set_state(state)
+    assert np.array_equal(pc.intensities,intensities[visible])
+    assert len(pc.hues) == len(pc.coords)
@@ -0,0 +1,26 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+def test_sampler():
+
+    p = np.array([0.1,0,0.6,0.3])
+    s = pyfx.physics.Sampler(p)
+
+    # Same draws as np.random.choice
+    state = np.random.get_state()
+    expected = np.random.choice(len(p),50,p=p)
+    np.random.set_state(state)
+    assert np.array_equal(s.sample(50),expected)
+
+    # Frequencies match p
+    counts = np.bincount(s.sample(100000),minlength=len(p))
+    assert np.allclose(counts/100000,p,atol=0.01)
+
+    assert 0 <= s.sample() < len(p)
+
+    for bad in [[],[0,0],[-1,2],[np.nan,1]]:
+        with pytest.raises(ValueError):
+            pyfx.physics.Sampler(bad)
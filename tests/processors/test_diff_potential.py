@@ -0,0 +1,90 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+import os, glob
+
+def _diff_potential(tmp_path,name,write_frames):
+    """
+    Make a DiffPotential with keyframes 0, 3 and 6 in a fresh workspace.
+    """
+
+    src_dir = str(tmp_path / "src")
+    write_frames(src_dir,num_frames=9)
+
+    ws = pyfx.Workspace(str(tmp_path / name),src_dir)
+
+    return pyfx.processors.DiffPotential(ws,update_interval=3,threshold=0.05,
+                                         num_iterate=4,disk_size=3,blur=3)
+
+def _wells(dp):
+    """
+    Wells written out by dp, keyed by file name.
+    """
+
+    out = {}
+    for f in glob.glob(os.path.join(dp._processor_dir,"*.npz")):
+        with np.load(f) as data:
+            out[os.path.basename(f)] = data["well"]
+
+    return out
+
+def test_settings(tmp_path,write_frames):
+
+    dp = _diff_potential(tmp_path,"ws",write_frames)
+    assert dp.precompute() == 3
+
+    # Wells depend on how the workspace measures frame differences
+    dp._workspace.diff_method = "absdiff"
+    assert dp.precompute() == 3
+    assert dp.precompute() == 0
+
+    # ...and on the background
+    signature = dp.signature
+    dp._workspace.set_background(5)
+    assert dp.signature != signature
+    assert dp.precompute() == 3
+    assert dp.precompute() == 0
+
+    # Surfaces in memory are not reused after the settings change
+    dp._workspace.current_time = 3
+    energy = dp.get_energy_batch([[24,20]])
+    dp._workspace.diff_method = "ssim"
+    dp._workspace.current_time = 4
+    assert not np.array_equal(dp.get_energy_batch([[24,20]]),energy)
+
+def test_precompute(tmp_path,write_frames):
+
+    dp = _diff_potential(tmp_path,"serial",write_frames)
+    assert dp.precompute() == 3
+    assert sorted(_wells(dp).keys()) == ["000.npz","003.npz","006.npz"]
+
+    # Finished keyframes are skipped
+    assert dp.precompute() == 0
+
+    # Files from another format version are calculated again
+    f = os.path.join(dp._processor_dir,"003.npz")
+    with np.load(f) as data:
+        well = data["well"]
+    np.savez_compressed(f,version=0,well=well)
+    assert dp.precompute() == 1
+    assert dp.precompute() == 0
+
+    # A pool of workers writes the same wells
+    parallel = _diff_potential(tmp_path,"parallel",write_frames)
+    assert parallel.precompute(workers=2) == 3
+
+    serial_wells = _wells(dp)
+    parallel_wells = _wells(parallel)
+    assert serial_wells.keys() == parallel_wells.keys()
+    for k in serial_wells:
+        assert np.array_equal(serial_wells[k],parallel_wells[k])
+
+    # No partial files left behind
+    for d in [dp._processor_dir,parallel._processor_dir]:
+        assert glob.glob(os.path.join(d,"*.tmp")) == []
+
+    with pytest.raises(ValueError):
+        dp.precompute(workers=0)
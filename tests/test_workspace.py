@@ -0,0 +1,217 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+import os, glob
+
+class _Fade(pyfx.effects.base.Effect):
+    """
+    Effect that fades frames toward black by a waypoint-controlled amount.
+    """
+
+    def __init__(self,workspace):
+
+        self._default_waypoint = {"amount":0.0}
+        super().__init__(workspace)
+
+    def render(self,img):
+
+        t = self._workspace.current_time
+        if not self._baked:
+            self.bake()
+
+        out = np.copy(img)
+        out[:,:,:3] = np.round(img[:,:,:3]*(1 - self.amount[t]))
+
+        return out
+
+class _Jitter(pyfx.effects.base.Effect):
+    """
+    Effect that shifts each frame by a random offset chosen when it is baked.
+    """
+
+    def __init__(self,workspace):
+
+        self._default_waypoint = {}
+        super().__init__(workspace)
+
+    def bake(self,smooth_window_len=0):
+
+        self._interpolate_waypoints(smooth_window_len)
+        self._offsets = np.random.randint(-3,4,(self._workspace.max_time + 1,2))
+        self._baked = True
+
+    def render(self,img):
+
+        t = self._workspace.current_time
+        if not self._baked:
+            self.bake()
+
+        return np.roll(img,tuple(self._offsets[t]),axis=(0,1))
+
+def _render(src_dir,tmp_path,name,workers):
+    """
+    Render a stack of parallel-safe effects in a fresh workspace and return
+    the frames.
+    """
+
+    ws = pyfx.Workspace(str(tmp_path / name),src_dir)
+
+    # The jitter is random; bake it the same way both times
+    np.random.seed(3)
+    jitter = _Jitter(ws)
+    jitter.bake()
+
+    fade = _Fade(ws)
+    fade.add_waypoint(0,amount=0.0)
+    fade.add_waypoint(11,amount=0.8)
+
+    effects = (fade,jitter)
+    for e in effects:
+        assert e.parallel_safe
+
+    out_dir = str(tmp_path / (name + "_out"))
+    ws.render(out_dir,effects=effects,workers=workers)
+
+    files = sorted(glob.glob(os.path.join(out_dir,"*.png")))
+
+    return [pyfx.util.to_array(f) for f in files]
+
+def test_render_parallel(tmp_path,write_frames):
+
+    src_dir = str(tmp_path / "src")
+    write_frames(src_dir)
+
+    serial = _render(src_dir,tmp_path,"serial",workers=1)
+    parallel = _render(src_dir,tmp_path,"parallel",workers=3)
+
+    assert len(serial) == 12
+    assert len(parallel) == 12
+    for a, b in zip(serial,parallel):
+        assert np.array_equal(a,b)
+
+class _Stateful(pyfx.effects.base.Effect):
+    """
+    Effect that carries state from frame to frame.
+    """
+
+    def __init__(self,workspace):
+
+        self._default_waypoint = {}
+        super().__init__(workspace)
+        self._parallel_safe = False
+
+    def render(self,img):
+        return img
+
+def test_render_not_parallel_safe(tmp_path,write_frames):
+
+    src_dir = str(tmp_path / "src")
+    write_frames(src_dir,num_frames=3)
+    ws = pyfx.Workspace(str(tmp_path / "ws"),src_dir)
+
+    effect = _Stateful(ws)
+    assert not effect.parallel_safe
+
+    with pytest.warns(UserWarning):
+        ws.render(str(tmp_path / "out"),effects=(effect,),workers=2)
+
+    assert len(glob.glob(str(tmp_path / "out" / "*.png"))) == 3
+
+def _render_particles(src_dir,tmp_path,name,workers):
+    """
+    Render particles in a DiffPotential (checkpointed, so parallel-safe)
+    along with Ghost and a shaking VirtualCamera in a fresh workspace.
+    Returns the frames.
+    """
+
+    ws = pyfx.Workspace(str(tmp_path / name),src_dir,seed=3)
+
+    camera = pyfx.effects.VirtualCamera(ws)
+    camera.add_waypoint(0,shaking_magnitude=2.0)
+    camera.add_waypoint(11,zoom=1.2,shaking_magnitude=2.0)
+
+    ghost = pyfx.effects.Ghost(ws)
+
+    dp = pyfx.processors.DiffPotential(ws,update_interval=2,threshold=0.05,
+                                       num_iterate=4,disk_size=3,blur=3)
+    particles = pyfx.effects.GlowingParticles(ws)
+    particles.add_waypoint(0,potentials=[dp],num_particles=20)
+    particles.bake(checkpoint_interval=3)
+
+    effects = (ghost,particles,camera)
+    for e in effects:
+        assert e.parallel_safe
+
+    out_dir = str(tmp_path / (name + "_out"))
+    ws.render(out_dir,effects=effects,workers=workers)
+
+    files = sorted(glob.glob(os.path.join(out_dir,"*.png")))
+
+    return [pyfx.util.to_array(f) for f in files]
+
+def test_render_parallel_particles(tmp_path,write_frames):
+
+    src_dir = str(tmp_path / "src")
+    write_frames(src_dir)
+
+    serial = _render_particles(src_dir,tmp_path,"serial",workers=1)
+    parallel = _render_particles(src_dir,tmp_path,"parallel",workers=3)
+
+    assert len(serial) == 12
+    for a, b in zip(serial,parallel):
+        assert np.array_equal(a,b)
+
+    # Without checkpoints, particles have to be simulated in order
+    ws = pyfx.Workspace(str(tmp_path / "serial"))
+    particles = pyfx.effects.GlowingParticles(ws)
+    particles.bake()
+    assert not particles.parallel_safe
+
+def _render_precision(src_dir,tmp_path,dtype):
+    """
+    Render the same effect stack in a fresh workspace working at dtype.
+    Returns the frames as int arrays.
+    """
+
+    name = np.dtype(dtype).name
+    ws = pyfx.Workspace(str(tmp_path / name),src_dir,dtype=dtype,seed=3)
+
+    shift = pyfx.effects.ColorShift(ws)
+    shift.add_waypoint(0,value=0.4,hue_shift=0.1)
+    shift.add_waypoint(11,value=0.8,hue_shift=0.1)
+
+    mix = pyfx.effects.MixForeAndBack(ws)
+    mix.add_waypoint(0,mask=np.full(ws.shape,128,dtype=np.uint8))
+
+    ghost = pyfx.effects.Ghost(ws)
+
+    particles = pyfx.effects.GlowingParticles(ws)
+    particles.add_waypoint(0,num_particles=30)
+
+    out_dir = str(tmp_path / (name + "_out"))
+    ws.render(out_dir,effects=(shift,mix,ghost,particles))
+
+    files = sorted(glob.glob(os.path.join(out_dir,"*.png")))
+
+    return [pyfx.util.to_array(f).astype(np.int) for f in files]
+
+def test_render_precision(tmp_path,write_frames):
+
+    src_dir = str(tmp_path / "src")
+    write_frames(src_dir)
+
+    # Float working precisions only differ from uint8 by rounding.  uint8
+    # rounds after each of the four effects, so a few pixels can end up two
+    # gray levels off.
+    expected = _render_precision(src_dir,tmp_path,np.uint8)
+    assert len(expected) == 12
+    for dtype in [np.float32,np.float16]:
+        frames = _render_precision(src_dir,tmp_path,dtype)
+        assert len(frames) == 12
+        for a, b in zip(expected,frames):
+            diff = np.abs(a - b)
+            assert np.max(diff) <= 2
+            assert np.mean(diff) < 0.5
@@ -0,0 +1,33 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+def test_smooth_diff():
+
+    shape = (120,160)
+    bg = pyfx.util.Background(np.zeros(shape,dtype=np.uint8))
+
+    rows, cols = np.mgrid[0:shape[0],0:shape[1]]
+    diff = np.zeros(shape,dtype=np.float)
+    diff[((rows - 40)/15)**2 + ((cols - 100)/25)**2 < 1] = 1.0
+
+    kwargs = {"num_iterate":10,"disk_size":5,"blur":20}
+    slow = bg.smooth_diff(None,diff=diff,method="dilation",**kwargs)
+    fast = bg.smooth_diff(None,diff=diff,method="distance",**kwargs)
+
+    assert fast.dtype == np.uint8
+    assert fast.shape == shape
+    assert np.max(np.abs(slow.astype(np.int) - fast.astype(np.int))) <= 3
+
+    # Bottom of the well is on the blob, rim far from it
+    assert fast[40,100] == 0
+    assert fast[119,0] == 255
+
+    # Nothing different from the background: flat well
+    flat = bg.smooth_diff(None,diff=np.zeros(shape))
+    assert np.all(flat == 255)
+
+    with pytest.raises(ValueError):
+        bg.smooth_diff(None,diff=diff,method="not_a_method")
@@ -0,0 +1,144 @@
+import pyfx
+import numpy as np
+import pytest
+
+from PIL import Image
+
+def _random_rgba(shape,seed):
+
+    rs = np.random.RandomState(seed)
+    img = rs.randint(0,256,size=shape + (4,)).astype(np.uint8)
+
+    # Make sure fully transparent and fully opaque pixels show up
+    img[0,:,3] = 0
+    img[1,:,3] = 255
+
+    return img
+
+def test_over():
+
+    bottom = _random_rgba((50,60),0)
+    top = _random_rgba((50,60),1)
+
+    # Sanity checks
+    with pytest.raises(ValueError):
+        pyfx.util.composite.over(bottom,top[:10])
+    with pytest.raises(ValueError):
+        pyfx.util.composite.over(bottom,top[:,:,:3])
+    with pytest.raises(ValueError):
+        pyfx.util.composite.over(bottom,top.astype(np.float32))
+
+    # Same as PIL
+    expected = np.array(Image.alpha_composite(Image.fromarray(bottom),
+                                              Image.fromarray(top)))
+    out = pyfx.util.composite.over(bottom,top)
+    assert out.dtype == np.uint8
+    assert np.array_equal(out,expected)
+
+    # Transparent top leaves bottom alone; opaque top replaces it
+    assert np.array_equal(out[0],bottom[0])
+    assert np.array_equal(out[1],top[1])
+
+    # In place, into either input
+    b = bottom.copy()
+    result = pyfx.util.composite.over(b,top,out=b)
+    assert result is b
+    assert np.array_equal(b,out)
+
+    t = top.copy()
+    pyfx.util.composite.over(bottom,t,out=t)
+    assert np.array_equal(t,out)
+
+    # Only part of top visible
+    sparse = np.zeros_like(top)
+    sparse[10:20,30:35] = top[10:20,30:35]
+    expected = np.array(Image.alpha_composite(Image.fromarray(bottom),
+                                              Image.fromarray(sparse)))
+    assert np.array_equal(pyfx.util.composite.over(bottom,sparse),expected)
+
+    b = bottom.copy()
+    pyfx.util.composite.over(b,sparse,out=b)
+    assert np.array_equal(b,expected)
+
+    # Nothing visible
+    out = pyfx.util.composite.over(bottom,np.zeros_like(top))
+    assert np.array_equal(out,bottom)
+
+def test_alpha_composite():
+
+    bottom = _random_rgba((20,30),2)
+    top = _random_rgba((20,30),3)
+
+    expected = pyfx.util.composite.over(bottom,top)
+
+    # Takes arrays or images
+    out = pyfx.util.alpha_composite(Image.fromarray(bottom),top)
+    assert np.array_equal(out,expected)
+
+    out = pyfx.util.alpha_composite(bottom,top,return_as_pil=True)
+    assert isinstance(out,Image.Image)
+    assert np.array_equal(np.array(out),expected)
+
+    with pytest.raises(ValueError):
+        pyfx.util.alpha_composite(bottom,top[:10])
+
+def test_layer():
+
+    bottom = _random_rgba((100,120),6)
+    bottom[:,:,3] = 255
+    patch = _random_rgba((10,15),7)
+
+    layer = pyfx.util.composite.Layer(bottom.shape,tile_size=16)
+    assert layer.dirty_fraction == 0
+    assert np.array_equal(layer.composite(bottom),bottom)
+
+    # Draw two patches, one hanging off the edge of the frame
+    layer.array[5:15,20:35] = patch
+    layer.mark(5,15,20,35)
+    layer.array[95:100,110:120] = patch[:5,:10]
+    layer.mark(95,105,110,130)
+    assert 0 < layer.dirty_fraction < 1
+
+    # Same as compositing the whole layer
+    expected = pyfx.util.composite.over(bottom,layer.array)
+    assert np.array_equal(layer.composite(bottom),expected)
+
+    b = bottom.copy()
+    out = layer.composite(b,out=b)
+    assert out is b
+    assert np.array_equal(b,expected)
+
+    # Sprites record where they were written
+    layer.clear()
+    assert np.sum(layer.array) == 0
+    sprite = pyfx.visuals.sprites.GlowingParticle(radius=2)
+    out = sprite.write_to_image((50,60),layer)
+    assert out is layer
+    expected = sprite.write_to_image((50,60),np.zeros(bottom.shape,dtype=np.uint8))
+    assert np.array_equal(layer.array,expected)
+    assert np.array_equal(layer.composite(bottom),
+                          pyfx.util.composite.over(bottom,expected))
+
+def test_over_float():
+
+    bottom = _random_rgba((20,30),8)
+    top = _random_rgba((20,30),9)
+    expected = pyfx.util.composite.over(bottom,top)
+
+    for dtype in [np.float32,np.float16]:
+
+        b = pyfx.util.to_array(bottom,dtype=dtype)
+        t = pyfx.util.to_array(top,dtype=dtype)
+
+        out = pyfx.util.composite.over(b,t)
+        assert out.dtype == dtype
+        diff = np.abs(pyfx.util.to_array(out,dtype=np.uint8).astype(np.int16) -
+                      expected.astype(np.int16))
+        assert np.max(diff) <= 1
+
+        # helper keeps float precision
+        assert pyfx.util.alpha_composite(b,top).dtype == dtype
+
+    # Mixed types are not allowed
+    with pytest.raises(ValueError):
+        pyfx.util.composite.over(bottom,pyfx.util.to_array(top,dtype=np.float32))
@@ -33,3 +33,61 @@ def test_xy_to_rc():
     out = pyfx.util.convert.xy_to_rc((5,2),shape)
     assert out[0] == 7
     assert out[1] == 5
+
+def test_to_array():
+
+    rs = np.random.RandomState(0)
+    img = rs.randint(0,256,size=(10,12,4)).astype(np.uint8)
+
+    # Already in the right format: same object back
+    assert pyfx.util.to_array(img) is img
+    assert pyfx.util.to_array(img,copy=True) is not img
+
+    # int <--> float round trip
+    f = pyfx.util.to_array(img,dtype=np.float32,num_channels=4)
+    assert f.dtype == np.float32
+    assert np.max(f) <= 1 and np.min(f) >= 0
+    assert np.array_equal(pyfx.util.to_array(f,dtype=np.uint8),img)
+
+    # float <--> float
+    f64 = pyfx.util.to_array(f,dtype=np.float64,num_channels=3)
+    assert f64.dtype == np.float64
+    assert np.array_equal(f64,f[:,:,:3])
+
+    # Channel conversions
+    rgb = pyfx.util.to_array(img,num_channels=3)
+    assert np.array_equal(rgb,img[:,:,:3])
+    rgba = pyfx.util.to_array(rgb,num_channels=4)
+    assert np.array_equal(rgba[:,:,:3],rgb)
+    assert np.all(rgba[:,:,3] == 255)
+
+    # Out of bounds values
+    with pytest.raises(ValueError):
+        pyfx.util.to_array(f*2,dtype=np.uint8)
+    with pytest.raises(ValueError):
+        pyfx.util.to_array(img.astype(np.int32)*2,dtype=np.float32)
+
+    # ... are not checked if trusted
+    pyfx.util.to_array(img.astype(np.int32)*2,dtype=np.float32,trusted=True)
+
+def test_to_array_out():
+
+    rs = np.random.RandomState(1)
+    img = rs.randint(0,256,size=(10,12,4)).astype(np.uint8)
+
+    for dtype in [np.uint8,np.float32]:
+        for num_channels in [1,3,4]:
+
+            expected = pyfx.util.to_array(img,dtype=dtype,
+                                          num_channels=num_channels)
+            out = np.zeros(expected.shape,dtype=dtype)
+            result = pyfx.util.to_array(img,dtype=dtype,
+                                        num_channels=num_channels,out=out)
+            assert result is out
+            assert np.array_equal(out,expected)
+
+    # Wrong shape or type
+    with pytest.raises(ValueError):
+        pyfx.util.to_array(img,out=np.zeros((10,12,3),dtype=np.uint8))
+    with pytest.raises(ValueError):
+        pyfx.util.to_array(img,out=np.zeros((10,12,4),dtype=np.float32))
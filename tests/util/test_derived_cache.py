@@ -0,0 +1,43 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+import pickle
+
+def test_derived_cache():
+
+    cache = pyfx.util.DerivedCache(max_bytes=10*8*100)
+
+    calls = []
+    def calculate():
+        calls.append(1)
+        return np.ones(100)
+
+    # Calculated once, then shared
+    a = cache.get(3,"frame_diff",{"blur_sigma":10},calculate)
+    b = cache.get(3,"frame_diff",{"blur_sigma":10},calculate)
+    assert a is b
+    assert len(calls) == 1
+    assert not a.flags.writeable
+
+    # Different frame, kind or parameters are different products
+    cache.get(4,"frame_diff",{"blur_sigma":10},calculate)
+    cache.get(3,"frame_mask",{"blur_sigma":10},calculate)
+    cache.get(3,"frame_diff",{"blur_sigma":5},calculate)
+    assert len(calls) == 4
+
+    # Stays within budget
+    for t in range(20):
+        cache.get(t,"gray",{},calculate)
+    assert cache.num_bytes <= cache.max_bytes
+    assert len(cache) == 10
+
+    # Copies start out empty
+    copied = pickle.loads(pickle.dumps(cache))
+    assert len(copied) == 0
+    assert copied.max_bytes == cache.max_bytes
+
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,59 @@
+import pytest
+
+import numpy as np
+from skimage import filters, measure
+
+import pyfx
+
+def _frames():
+
+    rs = np.random.RandomState(0)
+
+    bg = rs.random_sample((120,160))
+    bg = filters.gaussian(bg,3)
+
+    img = bg.copy()
+    img[40:80,50:110] = 0.1
+
+    return bg, img
+
+def test_ssim_matches_skimage():
+
+    bg, img = _frames()
+
+    b = pyfx.util.Background(bg,blur_sigma=10)
+    diff = b.frame_diff(img)
+
+    expected = 1 - measure.compare_ssim(filters.gaussian(img,10),
+                                        filters.gaussian(bg,10),
+                                        full=True)[1]
+
+    assert np.allclose(diff,expected)
+
+def test_fast_methods():
+
+    bg, img = _frames()
+
+    expected = pyfx.util.Background(bg,blur_sigma=10).frame_diff(img)
+    for method in ["pyramid","absdiff"]:
+        diff = pyfx.util.Background(bg,blur_sigma=10,diff_method=method).frame_diff(img)
+        assert diff.shape == expected.shape
+
+        # Same pixels called as different
+        assert np.mean((diff > 0.05) == (expected > 0.05)) > 0.95
+
+    with pytest.raises(ValueError):
+        pyfx.util.Background(bg,diff_method="not_a_method")
+
+def test_custom_method():
+
+    bg, img = _frames()
+
+    class Zero:
+        def __init__(self,bg_array_bw,blur_sigma):
+            self._shape = bg_array_bw.shape
+        def diff(self,img_array_bw):
+            return np.zeros(self._shape)
+
+    b = pyfx.util.Background(bg,diff_method=Zero)
+    assert np.all(b.frame_diff(img) == 0)
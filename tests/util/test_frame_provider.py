@@ -0,0 +1,46 @@
+import pytest
+
+import numpy as np
+
+import time
+
+import pyfx
+
+
+def test_frame_provider(tmp_path,write_frames):
+
+    files = write_frames(tmp_path / "src",num_frames=10)
+    direct = [pyfx.util.to_array(f,dtype=np.uint8,num_channels=4)
+              for f in files]
+
+    # Room for three frames
+    max_bytes = 3*direct[0].nbytes
+    provider = pyfx.util.FrameProvider(files,read_ahead=2,max_bytes=max_bytes)
+
+    # Frames after the one requested are decoded in the background
+    frame = provider.get(0)
+    assert np.array_equal(frame,direct[0])
+    assert not frame.flags.writeable
+    start = time.time()
+    while not (1 in provider.cache and 2 in provider.cache):
+        assert time.time() - start < 10
+        time.sleep(0.01)
+    assert 3 not in provider.cache
+
+    # ... so the next requests come straight out of the cache
+    hits = provider.cache.hits
+    assert np.array_equal(provider.get(1),direct[1])
+    assert provider.cache.hits == hits + 1
+
+    # Sequential, backward, repeated and negative requests all match
+    # decoding directly, while the cache evicts old frames to stay in budget
+    for t in list(range(10)) + [9,2,2,5,0] + list(range(9,-1,-1)):
+        assert np.array_equal(provider.get(t),direct[t])
+        assert provider.cache.num_bytes <= max_bytes
+    assert np.array_equal(provider.get(-1),direct[9])
+    assert len(provider.cache) <= 3
+
+    with pytest.raises(IndexError):
+        provider.get(10)
+
+    provider.close()
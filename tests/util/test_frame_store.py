@@ -0,0 +1,58 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+import os, pickle
+
+def _write_frame(f,value,shape=(16,20)):
+    """
+    Write a flat frame with gray level value to f.
+    """
+
+    frame = value*np.ones((shape[0],shape[1],4),dtype=np.uint8)
+    frame[:,:,3] = 255
+    pyfx.util.to_image(frame).save(f)
+
+def test_frame_store(tmp_path,capsys):
+
+    src_dir = str(tmp_path / "src")
+    os.mkdir(src_dir)
+    files = [os.path.join(src_dir,"f{:03d}.png".format(t)) for t in range(5)]
+    for t, f in enumerate(files):
+        _write_frame(f,10*t)
+
+    store_dir = str(tmp_path / "store")
+
+    store = pyfx.util.FrameStore(store_dir,src_dir,files)
+    assert "building frame store" in capsys.readouterr().out
+    assert store.shape == (5,16,20,4)
+    for t, f in enumerate(files):
+        assert np.array_equal(store.get(t),pyfx.util.to_array(f))
+    assert not store[0].flags.writeable
+
+    # Same source: the existing store is used
+    store = pyfx.util.FrameStore(store_dir,src_dir,files)
+    assert "building frame store" not in capsys.readouterr().out
+    assert np.all(store.get(3)[:,:,0] == 30)
+
+    # Copies map the same file
+    copied = pickle.loads(pickle.dumps(store))
+    assert np.array_equal(copied.get(4),store.get(4))
+
+    # Changing a source frame invalidates the store
+    _write_frame(files[3],200)
+    stat = os.stat(files[3])
+    os.utime(files[3],(stat.st_atime,stat.st_mtime + 10))
+
+    store = pyfx.util.FrameStore(store_dir,src_dir,files)
+    assert "building frame store" in capsys.readouterr().out
+    assert np.all(store.get(3)[:,:,0] == 200)
+
+    # So does adding a frame
+    new_file = os.path.join(src_dir,"f005.png")
+    _write_frame(new_file,50)
+    store = pyfx.util.FrameStore(store_dir,src_dir,files + [new_file])
+    assert "building frame store" in capsys.readouterr().out
+    assert len(store) == 6
@@ -0,0 +1,121 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+import os, threading, time
+
+def _frames(num_frames,shape=(12,16)):
+
+    rs = np.random.RandomState(0)
+    return [rs.randint(0,256,size=shape + (4,)).astype(np.uint8)
+            for i in range(num_frames)]
+
+def test_png_writer(tmp_path):
+
+    frames = _frames(5)
+    with pyfx.util.PNGWriter(str(tmp_path),num_threads=2,queue_size=2) as writer:
+        for t, frame in enumerate(frames):
+            writer.write(frame,t)
+
+    for t, frame in enumerate(frames):
+        out_file = str(tmp_path / "frame{:08d}.png".format(t))
+        assert np.array_equal(pyfx.util.to_array(out_file),frame)
+
+    assert writer.stats["num_written"] == 5
+
+    with pytest.raises(ValueError):
+        writer.write(frames[0],0)
+
+    with pytest.raises(FileNotFoundError):
+        pyfx.util.PNGWriter(str(tmp_path / "missing"))
+
+def test_queue_size(tmp_path,monkeypatch):
+
+    # Writes hang until released, so we can see who is waiting on whom
+    release = threading.Event()
+    lock = threading.Lock()
+    started = []
+    write_file = pyfx.util.to_file
+    def slow_to_file(img,out_file,**kwargs):
+        with lock:
+            started.append(out_file)
+        release.wait()
+        write_file(img,out_file,**kwargs)
+
+    monkeypatch.setattr(pyfx.util,"to_file",slow_to_file)
+
+    frames = _frames(3)
+    writer = pyfx.util.PNGWriter(str(tmp_path),num_threads=1,queue_size=2)
+
+    # Two frames fit in the queue ...
+    writer.write(frames[0],0)
+    writer.write(frames[1],1)
+    assert writer.stats["num_blocked"] == 0
+
+    # ... the third has to wait for a free slot
+    third = threading.Thread(target=writer.write,args=(frames[2],2))
+    third.start()
+    third.join(0.2)
+    assert third.is_alive()
+    assert len(started) == 1
+
+    release.set()
+    third.join(10)
+    assert not third.is_alive()
+
+    writer.close()
+    assert len(started) == 3
+    assert writer.stats["num_written"] == 3
+    assert writer.stats["num_blocked"] == 1
+    assert writer.stats["time_blocked"] >= 0.2
+
+def test_flush_on_exception(tmp_path,monkeypatch):
+
+    write_file = pyfx.util.to_file
+    def slow_to_file(img,out_file,**kwargs):
+        time.sleep(0.05)
+        write_file(img,out_file,**kwargs)
+
+    monkeypatch.setattr(pyfx.util,"to_file",slow_to_file)
+
+    # Frames queued before an exception in the with block are still written,
+    # and the exception is not replaced
+    frames = _frames(4)
+    with pytest.raises(KeyError):
+        with pyfx.util.PNGWriter(str(tmp_path),queue_size=4) as writer:
+            for t, frame in enumerate(frames):
+                writer.write(frame,t)
+            raise KeyError("stop")
+
+    assert len(os.listdir(str(tmp_path))) == 4
+    assert writer.stats["num_written"] == 4
+
+def test_write_error(tmp_path,monkeypatch):
+
+    write_file = pyfx.util.to_file
+    def bad_to_file(img,out_file,**kwargs):
+        if out_file.endswith("frame00000001.png"):
+            raise OSError("disk full")
+        write_file(img,out_file,**kwargs)
+
+    monkeypatch.setattr(pyfx.util,"to_file",bad_to_file)
+
+    frames = _frames(3)
+    writer = pyfx.util.PNGWriter(str(tmp_path),num_threads=1)
+    writer.write(frames[0],0)
+    writer.write(frames[1],1)
+
+    # The error in the thread comes back to the caller ...
+    with pytest.raises(RuntimeError) as excinfo:
+        writer.flush()
+    assert "disk full" in str(excinfo.value)
+
+    # ... and keeps coming back, so it cannot be missed
+    with pytest.raises(RuntimeError):
+        writer.write(frames[2],2)
+    with pytest.raises(RuntimeError):
+        writer.close()
+
+    assert writer.stats["num_written"] == 1
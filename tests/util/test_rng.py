@@ -0,0 +1,52 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+def test_random_streams():
+
+    streams = pyfx.util.RandomStreams(seed=10)
+
+    # Same key, same numbers -- no matter what else was drawn in between
+    a = streams.generator("GlowingParticles.0",5).random(10)
+    streams.generator("GlowingParticles.0",4).random(1000)
+    b = streams.generator("GlowingParticles.0",5).random(10)
+    assert np.array_equal(a,b)
+
+    # Different keys and different seeds give different numbers
+    c = streams.generator("GlowingParticles.0",6).random(10)
+    d = streams.generator("GlowingParticles.1",5).random(10)
+    e = pyfx.util.RandomStreams(seed=11).generator("GlowingParticles.0",5).random(10)
+    for x in [c,d,e]:
+        assert not np.array_equal(a,x)
+
+    # A new seed is picked if none is given
+    assert pyfx.util.RandomStreams().seed != pyfx.util.RandomStreams().seed
+
+    with pytest.raises(ValueError):
+        streams.generator(-1)
+    with pytest.raises(ValueError):
+        pyfx.util.RandomStreams(seed=-1)
+
+def test_seeded_particle_collection():
+
+    streams = pyfx.util.RandomStreams(seed=0)
+
+    coords = []
+    for i in range(2):
+        rng = streams.generator("pc")
+        u = pyfx.physics.potentials.Uniform(dimensions=(100,100))
+        u.rng = rng
+        gen = pyfx.visuals.sprites.GlowingParticleGenerator(rng=rng,
+                                                            sprite_cache=False)
+        pc = pyfx.physics.ParticleCollection(20,dimensions=(100,100),
+                                             potentials=[u],
+                                             sprite_generator=gen,rng=rng)
+        pc.construct_particles()
+        pc.equalize_particles(10)
+        coords.append((pc.coords.copy(),
+                       [s.intensity for s in pc.sprites]))
+
+    assert np.array_equal(coords[0][0],coords[1][0])
+    assert coords[0][1] == coords[1][1]
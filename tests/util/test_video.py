@@ -0,0 +1,228 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+import multiprocessing, os, pickle, shutil, threading
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None or
+                                shutil.which("ffprobe") is None,
+                                reason="ffmpeg and ffprobe are not installed")
+
+# Lossless, so frames read back exactly as written
+LOSSLESS = {"codec":"ffv1","pix_fmt":"bgr0","crf":None}
+
+def _frames(num_frames=12,shape=(90,160)):
+
+    rs = np.random.RandomState(0)
+    return [rs.randint(0,256,size=shape + (3,)).astype(np.uint8)
+            for i in range(num_frames)]
+
+@pytest.fixture
+def clip(tmp_path):
+    """
+    12 frame, 10 frames per second video of random frames.  Returns the file
+    name and the frames.
+    """
+
+    frames = _frames()
+    video_file = str(tmp_path / "clip.mkv")
+    pyfx.util.to_video(frames,video_file,frame_rate=10,**LOSSLESS)
+
+    return video_file, frames
+
+def _read_in_child(reader,t,result):
+    """
+    Read frame t in another process (the target of a forked process).
+    """
+
+    result.put(np.array(reader[t]))
+
+def test_video_reader(clip):
+
+    video_file, frames = clip
+
+    reader = pyfx.util.VideoReader(video_file,buffer_size=3,num_recent=2)
+    assert len(reader) == 12
+    assert reader.shape == (90,160)
+    assert reader.frame_rate == 10
+
+    # Sequential, repeated, backward, far ahead and negative requests
+    for t in [0,1,2,2,3,7,6,11,0,5,-1]:
+        frame = reader[t]
+        assert np.array_equal(frame,frames[t])
+        assert not frame.flags.writeable
+
+    with pytest.raises(IndexError):
+        reader[12]
+
+    reader.close()
+    reader.close()
+
+    with pytest.raises(FileNotFoundError):
+        pyfx.util.VideoReader(video_file + ".missing")
+
+def test_reader_seek(clip,monkeypatch):
+
+    video_file, frames = clip
+
+    # Record where each decoder is started
+    starts = []
+    ffmpeg_input = pyfx.util.video.ffmpeg.input
+    def record_input(*args,**kwargs):
+        starts.append(kwargs.get("ss"))
+        return ffmpeg_input(*args,**kwargs)
+
+    monkeypatch.setattr(pyfx.util.video.ffmpeg,"input",record_input)
+
+    num_threads = threading.active_count()
+    reader = pyfx.util.VideoReader(video_file,buffer_size=3,num_recent=2)
+
+    # The first request seeks straight to the frame and starts the look-ahead
+    # thread
+    assert np.array_equal(reader[7],frames[7])
+    assert starts == [pytest.approx(0.7)]
+    assert threading.active_count() == num_threads + 1
+
+    # Frames after it, or a little ahead, stream out of the same decoder
+    for t in [8,9,11]:
+        assert np.array_equal(reader[t],frames[t])
+    assert len(starts) == 1
+
+    # Going backward, or far ahead, restarts the decoder with a seek
+    assert np.array_equal(reader[2],frames[2])
+    assert starts[-1] == pytest.approx(0.2)
+    assert np.array_equal(reader[10],frames[10])
+    assert starts[-1] == pytest.approx(1.0)
+
+    # Recent frames are not decoded again
+    assert np.array_equal(reader[10],frames[10])
+    assert len(starts) == 3
+
+    reader.close()
+    assert threading.active_count() == num_threads
+
+def test_reader_fork_and_pickle(clip):
+
+    video_file, frames = clip
+
+    reader = pyfx.util.VideoReader(video_file,buffer_size=3)
+    for t in range(3):
+        reader[t]
+
+    # A forked process notices it does not own the decoder and starts its own
+    context = multiprocessing.get_context("fork")
+    result = context.Queue()
+    process = context.Process(target=_read_in_child,args=(reader,8,result))
+    process.start()
+    assert np.array_equal(result.get(timeout=60),frames[8])
+    process.join(60)
+    assert process.exitcode == 0
+
+    # ... without disturbing the parent's decoder
+    for t in range(3,6):
+        assert np.array_equal(reader[t],frames[t])
+
+    # Copies start their own decoder, too
+    copy = pickle.loads(pickle.dumps(reader))
+    assert len(copy) == 12
+    assert np.array_equal(copy[4],frames[4])
+    assert np.array_equal(reader[6],frames[6])
+
+    copy.close()
+    reader.close()
+
+def test_reader_decode_error(clip,monkeypatch):
+
+    video_file, frames = clip
+
+    # Claim the video is longer than it is, so the decoder runs out of frames
+    monkeypatch.setattr(pyfx.util.video,"video_frame_info",
+                        lambda filename: (15,10.0))
+
+    reader = pyfx.util.VideoReader(video_file,buffer_size=3)
+    assert len(reader) == 15
+    with pytest.raises(IndexError) as excinfo:
+        reader[13]
+    assert "could not decode" in str(excinfo.value)
+
+    # The reader recovers
+    assert np.array_equal(reader[2],frames[2])
+    reader.close()
+
+def test_video_writer(tmp_path):
+
+    frames = _frames()
+
+    # A short queue, so write() has to wait on the feeder thread
+    video_file = str(tmp_path / "out.mkv")
+    with pyfx.util.VideoWriter(video_file,(90,160),frame_rate=10,queue_size=2,
+                               **LOSSLESS) as writer:
+        for frame in frames:
+            writer.write(frame)
+
+        with pytest.raises(ValueError):
+            writer.write(frames[0][:10])
+
+    assert writer.num_written == 12
+    with pytest.raises(ValueError):
+        writer.write(frames[0])
+
+    # Frames come out in the order they were written
+    video = pyfx.util.video_to_array(video_file)
+    assert len(video) == 12
+    for a, b in zip(video,frames):
+        assert np.array_equal(a,b)
+
+    with pytest.raises(FileExistsError):
+        pyfx.util.VideoWriter(video_file,(90,160))
+
+def test_video_writer_error(tmp_path):
+
+    frames = _frames()
+    num_threads = threading.active_count()
+
+    # ffmpeg gives up right away on a codec it does not have.  The error
+    # reaches the caller from write() or close(), whichever comes first.
+    writer = None
+    with pytest.raises(RuntimeError):
+        with pyfx.util.VideoWriter(str(tmp_path / "bad.mkv"),(90,160),
+                                   codec="not_a_codec",crf=None,
+                                   queue_size=2) as writer:
+            for i in range(10):
+                for frame in frames:
+                    writer.write(frame)
+
+    # Either way, the writer is shut down
+    with pytest.raises(ValueError):
+        writer.write(frames[0])
+    assert threading.active_count() == num_threads
+
+def test_to_video(tmp_path):
+
+    frames = _frames()
+    num_threads = threading.active_count()
+
+    video_file = str(tmp_path / "out.mkv")
+    pyfx.util.to_video(frames,video_file,frame_rate=10,queue_size=2,**LOSSLESS)
+    video = pyfx.util.video_to_array(video_file)
+    for a, b in zip(video,frames):
+        assert np.array_equal(a,b)
+
+    with pytest.raises(FileExistsError):
+        pyfx.util.to_video(frames,video_file)
+
+    # An error while producing frames is passed on, and the encoder is
+    # stopped rather than left waiting for more frames
+    def broken():
+        for frame in frames[:3]:
+            yield frame
+        raise KeyError("no more frames")
+
+    with pytest.raises(KeyError):
+        pyfx.util.to_video(broken(),str(tmp_path / "broken.mkv"),**LOSSLESS)
+    assert threading.active_count() == num_threads
+
+    with pytest.raises(ValueError):
+        pyfx.util.to_video([],str(tmp_path / "empty.mkv"))
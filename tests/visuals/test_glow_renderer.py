@@ -0,0 +1,63 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+def _sprite_layer(shape,coords,radii,intensities,hue):
+    """
+    Draw particles the slow way, one sprite at a time.
+    """
+
+    layer = pyfx.util.composite.Layer(shape)
+    for c, r, i in zip(coords,radii,intensities):
+        s = pyfx.visuals.sprites.GlowingParticle(radius=r,intensity=i,hue=hue,
+                                                 sprite_cache=False)
+        s.write_to_image(c,layer)
+
+    return layer.array
+
+def test_glow_renderer_parity():
+
+    shape = (120,160)
+
+    # Isolated particles (glows do not overlap), some at fractional positions
+    coords = np.array([[30,30],[30.4,80.7],[30,130],
+                       [90,30],[90.6,80.2],[90,130]])
+    radii = np.array([1.0,2.0,2.5,3.0,1.5,2.2])
+    intensities = np.array([0.5,0.7,0.9,0.6,0.8,1.0])
+    hue = 0.6
+
+    expected = _sprite_layer(shape,coords,radii,intensities,hue)
+
+    renderer = pyfx.visuals.sprites.GlowRenderer(shape)
+    out = renderer.render(coords,radii,intensities,hue)
+    assert out.shape == expected.shape
+    assert out.dtype == np.uint8
+
+    diff = np.abs(out.astype(np.int) - expected.astype(np.int))
+    assert np.mean(diff[:,:,3]) < 3
+    assert np.max(diff[:,:,3]) < 12
+
+    # Color only matters where the glow is visible
+    visible = np.minimum(out[:,:,3],expected[:,:,3]) > 16
+    assert np.max(diff[:,:,:3][visible]) < 12
+
+    # Different hues are accumulated separately
+    hues = np.array([0.0,0.2,0.4,0.6,0.8,0.9])
+    multi = renderer.render(coords,radii,intensities,hues)
+    assert np.array_equal(multi[:,:,3],out[:,:,3])
+
+def test_glow_renderer_in_frame():
+
+    shape = (50,60)
+    coords = np.array([[25,30],[-2,30],[-30,30],[25,65],[25,90],[52,-1]])
+    radii = np.array([2.0,2.0,2.0,2.0,2.0,1.0])
+
+    renderer = pyfx.visuals.sprites.GlowRenderer(shape)
+    in_frame = renderer.in_frame(coords,radii)
+
+    for c, r, v in zip(coords,radii,in_frame):
+        s = pyfx.visuals.sprites.GlowingParticle(radius=r,sprite_cache=False)
+        s.write_to_image(c,pyfx.util.composite.Layer(shape))
+        assert v == (not s.out_of_frame)
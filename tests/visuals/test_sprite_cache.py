@@ -0,0 +1,34 @@
+import pytest
+
+import numpy as np
+
+import pyfx
+
+def test_sprite_cache():
+
+    cache = pyfx.visuals.sprites.SpriteCache()
+
+    a = pyfx.visuals.sprites.GlowingParticle(radius=3.01,sprite_cache=cache)
+    b = pyfx.visuals.sprites.GlowingParticle(radius=2.99,sprite_cache=cache)
+    assert a.sprite is b.sprite
+    assert cache.misses == 1
+    assert cache.hits == 1
+    assert not a.sprite.flags.writeable
+
+    # Quantized parameters draw the same bitmap as unquantized ones
+    c = pyfx.visuals.sprites.GlowingParticle(radius=3.0,sprite_cache=False)
+    assert np.array_equal(a.sprite,c.sprite)
+
+    # Changing a parameter takes a new bitmap from the cache
+    a.hue = 0.2
+    assert a.sprite is not b.sprite
+    assert len(cache) == 2
+
+def test_sprite_cache_budget():
+
+    cache = pyfx.visuals.sprites.SpriteCache(max_bytes=50000)
+    for r in np.linspace(1,5,20):
+        pyfx.visuals.sprites.GlowingParticle(radius=r,sprite_cache=cache)
+
+    assert cache.num_bytes <= 50000
+    assert len(cache) < 20